@@ -1,14 +1,30 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, HttpUrl
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
 import io
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Literal
+from datetime import datetime
+import json
 import numpy as np
 from collections import defaultdict
+from resilience import resilient_get, CircuitOpenError
+import resilience
+from coalesce import SingleFlight, normalize_url
+from render_detect import render_router
+from browser_pool import get_browser_pool
+from scrape import scrape_website
+from endpoint_discovery import discover_sources, describe_sources, load_source_rows
+from jobs import JobQueue
+from change_detect import get_fingerprint_store
+from extract import extract_tags, page_tags
+from archive import archive_page
+from dataset_store import get_dataset_store, GROUP_COLUMNS
+from search_index import get_search_index, index_rows
 
 app = FastAPI(title="DataForage API", 
               description="Web scraping API for extracting structured data from websites")
@@ -25,9 +41,22 @@ app.add_middleware(
 class ScrapeRequest(BaseModel):
     url: HttpUrl
     tags: Optional[List[str]] = None  # Optional list of specific tags to scrape
+    source: Optional[str] = None  # Optional JSON data source from /analyze, or "auto" - skips HTML parsing
+
+class JobRequest(ScrapeRequest):
+    format: Literal["excel", "json"] = "excel"
+
+class MonitorRequest(ScrapeRequest):
+    min_change_bits: int = 0  # Ignore text changes whose simhash distance is below this
+
+class DataSource(BaseModel):
+    name: str
+    kind: str  # "embedded" (JSON in the page) or "endpoint" (URL the page's scripts load)
+    records: Optional[int] = None
 
 class AnalyzeResponse(BaseModel):
     available_tags: List[str]
+    data_sources: List[DataSource] = []
 
 # Function to reformat DataFrame for better Excel structure
 def reformat_for_excel(df):
@@ -58,25 +87,183 @@ def reformat_for_excel(df):
     # If dataframe structure is different, return original
     return df
 
-@app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze_webpage(request: ScrapeRequest):
-    """Analyze a webpage and return available HTML tags to scrape"""
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36'
+}
+
+# Concurrent identical requests share one in-flight fetch/parse/extract
+single_flight = SingleFlight()
+
+# Last-seen fingerprint per monitored URL, for change detection on re-scrapes
+fingerprints = get_fingerprint_store()
+
+# Every extraction is kept so past results can be queried without re-scraping
+datasets = get_dataset_store()
+
+# Full-text index over every extracted row, updated as scrapes complete
+search_index = get_search_index()
+
+# Function to fetch a page's static HTML
+def fetch_static(url):
+    """Fetch a page, raising HTTPException on a bad status"""
+    response = resilient_get(url, headers=HEADERS, timeout=30)
+    
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail=f"Failed to retrieve page. Status code: {response.status_code}")
+    
+    archive_page(url, response.content, 200, response.headers.get("Content-Type"))
+    return response
+
+# Function to render a page in the browser pool, None if rendering isn't available
+def render_html(url, static_response=None):
+    try:
+        # The static response doubles as the snapshot's validators, saving a second request
+        html = scrape_website(url, static_response=static_response)
+        archive_page(url, html, 200, "text/html; rendered")
+        return html
+    except Exception as e:
+        print(f"Rendering failed for {url}, using static HTML: {str(e)}")
+        return None
+
+# Function to fetch a page, paying for a browser only when the static HTML is a JS shell
+def fetch_page(url):
+    """Returns (content, soup); soup is the already-parsed static page when that was needed, else None"""
+    if render_router.decision(url):
+        # Domain is known to need rendering - skip straight to the browser
+        html = render_html(url)
+        return (html, None) if html is not None else (fetch_static(url).content, None)
+    
+    response = fetch_static(url)
+    content = response.content
+    soup = BeautifulSoup(content, "html.parser") if render_router.decision(url) is None else None
+    if render_router.needs_render(url, soup if soup is not None else content):
+        rendered = render_html(url, response)
+        if rendered is not None:
+            return rendered, None
+    return content, soup
+
+def fetch_soup(url):
+    content, soup = fetch_page(url)
+    return soup if soup is not None else BeautifulSoup(content, "html.parser")
+
+# Function to list the unique tags on a page
+def analyze_url(url):
+    soup = fetch_soup(url)
+    return {
+        "available_tags": page_tags(soup),
+        # JSON the page embeds or loads - scraping these skips HTML parsing and rendering
+        "data_sources": describe_sources(discover_sources(soup, url)),
+    }
+
+# Function to fetch a URL as JSON or HTML for data source extraction
+def fetch_for_source(url, accept_json):
+    accept = "application/json" if accept_json else "text/html,application/xhtml+xml"
+    return resilient_get(url, headers={**HEADERS, "Accept": accept}, timeout=30)
+
+# Function to extract rows straight from a page's JSON data source
+def scrape_source(url, source):
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36'
-        }
-        response = requests.get(str(request.url), headers=headers)
+        results = load_source_rows(url, source, fetch_for_source)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (requests.HTTPError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Failed to load data source: {str(e)}")
+    
+    if not results:
+        raise HTTPException(status_code=404, detail="No data found in the selected source.")
+    
+    return results
+
+# Function to extract the text of the requested tags (all tags if none given)
+def scrape_url(url, tags=None, source=None):
+    if source:
+        results = scrape_source(url, source)
+    else:
+        results = extract_tags(fetch_soup(url), tags)
+    
+    if not results:
+        raise HTTPException(status_code=404, detail="No data found for the selected tags.")
+    
+    datasets.save(url, results, "api", {"tags": tags, "source": source})
+    index_rows(url, results)
+    return results
+
+# Function to build the formatted Excel workbook for scraped results
+def build_excel(results):
+    # Create dataframe
+    df = pd.DataFrame(results)
+    
+    # Reformat to put tags as columns
+    reformatted_df = reformat_for_excel(df)
+    
+    # Create Excel file
+    excel_buffer = io.BytesIO()
+    with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
+        reformatted_df.to_excel(writer, index=False, sheet_name="Scraped Data")
         
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail=f"Failed to retrieve page. Status code: {response.status_code}")
-            
-        soup = BeautifulSoup(response.content, "html.parser")
+        # Get the xlsxwriter objects
+        workbook = writer.book
+        worksheet = writer.sheets["Scraped Data"]
         
-        # Extract all unique tags
-        all_tags = set([tag.name for tag in soup.find_all() if tag.name is not None])
+        # Add formatting
+        header_format = workbook.add_format({
+            'bold': True,
+            'bg_color': '#10b981',
+            'color': 'white',
+            'align': 'center',
+            'valign': 'vcenter',
+            'border': 1
+        })
         
-        return {"available_tags": sorted(all_tags)}
+        # Apply formatting to header
+        for col_num, value in enumerate(reformatted_df.columns.values):
+            worksheet.write(0, col_num, value, header_format)
+            
+        # Auto-adjust column widths
+        for i, col in enumerate(reformatted_df.columns):
+            max_len = max(
+                reformatted_df[col].astype(str).map(len).max(),
+                len(str(col))
+            ) + 2
+            worksheet.set_column(i, i, max_len)
+    
+    excel_buffer.seek(0)
+    return excel_buffer
+
+# Run blocking fetch/parse work off the event loop, coalesced per normalized URL and options
+async def coalesced(key, func, *args):
+    return await single_flight.do(key, lambda: run_in_threadpool(func, *args))
+
+def scrape_key(request):
+    return ("scrape", normalize_url(request.url), tuple(sorted(request.tags)) if request.tags else None, request.source)
+
+# Function to re-scrape a page and report only the rows that changed since the last check
+def monitor_url(url, tags=None, source=None, min_change_bits=0):
+    key = json.dumps([normalize_url(url), sorted(tags) if tags else None, source])
+    
+    if source:
+        rows = scrape_source(url, source)
+        return fingerprints.check(key, url, json.dumps(rows, sort_keys=True, default=str),
+                                  lambda: rows, min_change_bits)
+    
+    content, soup = fetch_page(url)
+    # Only parsed and extracted if the page body actually changed
+    extract = lambda: extract_tags(soup if soup is not None else BeautifulSoup(content, "html.parser"), tags)
+    return fingerprints.check(key, url, content, extract, min_change_bits)
+
+def monitor_key(request):
+    return ("monitor",) + scrape_key(request)[1:] + (request.min_change_bits,)
+
+@app.post("/analyze", response_model=AnalyzeResponse)
+async def analyze_webpage(request: ScrapeRequest):
+    """Analyze a webpage and return available HTML tags to scrape"""
+    try:
+        return await coalesced(("analyze", normalize_url(request.url)), analyze_url, str(request.url))
         
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Origin unavailable: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing page: {str(e)}")
 
@@ -84,32 +271,14 @@ async def analyze_webpage(request: ScrapeRequest):
 async def scrape_webpage(request: ScrapeRequest, background_tasks: BackgroundTasks):
     """Scrape data from a webpage and return as JSON"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36'
-        }
-        response = requests.get(str(request.url), headers=headers)
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail=f"Failed to retrieve page. Status code: {response.status_code}")
-            
-        soup = BeautifulSoup(response.content, "html.parser")
-        
-        results = []
-        
-        # If no specific tags are provided, get all tags
-        tags_to_scrape = request.tags if request.tags else [tag.name for tag in soup.find_all() if tag.name is not None]
-        
-        for tag in tags_to_scrape:
-            for el in soup.find_all(tag):
-                text = el.get_text(strip=True)
-                if text:
-                    results.append({"Tag": tag, "Text": text})
-        
-        if not results:
-            raise HTTPException(status_code=404, detail="No data found for the selected tags.")
+        results = await coalesced(scrape_key(request), scrape_url, str(request.url), request.tags, request.source)
             
         return {"data": results}
         
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Origin unavailable: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error scraping page: {str(e)}")
 
@@ -117,78 +286,205 @@ async def scrape_webpage(request: ScrapeRequest, background_tasks: BackgroundTas
 async def scrape_to_excel(request: ScrapeRequest):
     """Scrape data from a webpage and return as Excel file"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36'
-        }
-        response = requests.get(str(request.url), headers=headers)
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail=f"Failed to retrieve page. Status code: {response.status_code}")
-            
-        soup = BeautifulSoup(response.content, "html.parser")
-        
-        results = []
+        # Shares the extraction with any concurrent /scrape for the same URL and tags
+        results = await coalesced(scrape_key(request), scrape_url, str(request.url), request.tags, request.source)
         
-        # If no specific tags are provided, get all tags
-        tags_to_scrape = request.tags if request.tags else [tag.name for tag in soup.find_all() if tag.name is not None]
+        excel_buffer = await run_in_threadpool(build_excel, results)
         
-        for tag in tags_to_scrape:
-            for el in soup.find_all(tag):
-                text = el.get_text(strip=True)
-                if text:
-                    results.append({"Tag": tag, "Text": text})
-        
-        if not results:
-            raise HTTPException(status_code=404, detail="No data found for the selected tags.")
-            
-        # Create dataframe
-        df = pd.DataFrame(results)
+        return StreamingResponse(
+            excel_buffer,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": "attachment; filename=scraped_data.xlsx"}
+        )
         
-        # Reformat to put tags as columns
-        reformatted_df = reformat_for_excel(df)
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Origin unavailable: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating Excel file: {str(e)}")
+
+@app.post("/monitor")
+async def monitor_webpage(request: MonitorRequest):
+    """Re-scrape a page and return only what changed since the last check (status: new, unchanged or changed)"""
+    try:
+        return await coalesced(monitor_key(request), monitor_url, str(request.url), request.tags,
+                               request.source, request.min_change_bits)
         
-        # Create Excel file
-        excel_buffer = io.BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
-            reformatted_df.to_excel(writer, index=False, sheet_name="Scraped Data")
-            
-            # Get the xlsxwriter objects
-            workbook = writer.book
-            worksheet = writer.sheets["Scraped Data"]
-            
-            # Add formatting
-            header_format = workbook.add_format({
-                'bold': True,
-                'bg_color': '#10b981',
-                'color': 'white',
-                'align': 'center',
-                'valign': 'vcenter',
-                'border': 1
-            })
-            
-            # Apply formatting to header
-            for col_num, value in enumerate(reformatted_df.columns.values):
-                worksheet.write(0, col_num, value, header_format)
-                
-            # Auto-adjust column widths
-            for i, col in enumerate(reformatted_df.columns):
-                max_len = max(
-                    reformatted_df[col].astype(str).map(len).max(),
-                    len(str(col))
-                ) + 2
-                worksheet.set_column(i, i, max_len)
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Origin unavailable: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error monitoring page: {str(e)}")
+
+@app.post("/monitor/excel")
+async def monitor_to_excel(request: MonitorRequest):
+    """Excel file of the added and removed rows since the last check, or 204 if nothing changed"""
+    try:
+        result = await coalesced(monitor_key(request), monitor_url, str(request.url), request.tags,
+                                 request.source, request.min_change_bits)
+        if result["status"] == "unchanged":
+            return Response(status_code=204)
         
-        excel_buffer.seek(0)
+        changes = [{"Change": "added", **row} for row in result["added"]]
+        changes += [{"Change": "removed", **row} for row in result["removed"]]
+        excel_buffer = await run_in_threadpool(build_excel, changes)
         
         return StreamingResponse(
             excel_buffer,
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": "attachment; filename=scraped_data.xlsx"}
+            headers={"Content-Disposition": "attachment; filename=changes.xlsx"}
         )
         
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Origin unavailable: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating Excel file: {str(e)}")
 
+# Query past extractions - repeat reads never touch the origin
+def dataset_filters(url, url_prefix, since, until, origin, type=None, tag=None, text=None):
+    return dict(
+        url=url, url_prefix=url_prefix, origin=origin, type=type, tag=tag, text=text,
+        since=since.timestamp() if since else None,
+        until=until.timestamp() if until else None,
+    )
+
+@app.get("/datasets")
+async def list_datasets(url: Optional[str] = None, url_prefix: Optional[str] = None,
+                        since: Optional[datetime] = None, until: Optional[datetime] = None,
+                        origin: Optional[str] = None, limit: int = 50, offset: int = 0):
+    """Past extractions, newest first, with pagination"""
+    filters = dataset_filters(url, url_prefix, since, until, origin)
+    return await run_in_threadpool(datasets.extractions, limit=limit, offset=max(offset, 0), **filters)
+
+@app.get("/datasets/rows")
+async def query_dataset_rows(url: Optional[str] = None, url_prefix: Optional[str] = None,
+                             since: Optional[datetime] = None, until: Optional[datetime] = None,
+                             origin: Optional[str] = None, type: Optional[str] = None,
+                             tag: Optional[str] = None, q: Optional[str] = None,
+                             limit: int = 100, offset: int = 0):
+    """Rows from past extractions filtered by URL, time, type, tag or text (q), with pagination"""
+    filters = dataset_filters(url, url_prefix, since, until, origin, type, tag, q)
+    return await run_in_threadpool(datasets.rows, limit=limit, offset=max(offset, 0), **filters)
+
+@app.get("/datasets/aggregate")
+async def aggregate_datasets(group_by: Literal[tuple(GROUP_COLUMNS)] = "type",
+                             url: Optional[str] = None, url_prefix: Optional[str] = None,
+                             since: Optional[datetime] = None, until: Optional[datetime] = None,
+                             origin: Optional[str] = None, type: Optional[str] = None,
+                             tag: Optional[str] = None, q: Optional[str] = None,
+                             limit: int = 100, offset: int = 0):
+    """Row counts grouped by type, tag, url, day or origin"""
+    filters = dataset_filters(url, url_prefix, since, until, origin, type, tag, q)
+    return await run_in_threadpool(datasets.aggregate, group_by, limit=limit, offset=max(offset, 0), **filters)
+
+@app.get("/search")
+async def search_content(q: str, limit: int = 10, offset: int = 0):
+    """BM25-ranked search over every row extracted so far"""
+    return await run_in_threadpool(search_index.search, q, max(1, min(limit, 100)), max(offset, 0))
+
+@app.get("/datasets/{extraction_id}")
+async def get_dataset(extraction_id: int, limit: int = 100, offset: int = 0):
+    """One past extraction and a page of its rows"""
+    extraction = await run_in_threadpool(datasets.extraction, extraction_id)
+    if extraction is None:
+        raise HTTPException(status_code=404, detail="Extraction not found")
+    
+    extraction["rows"] = await run_in_threadpool(datasets.rows, limit=limit, offset=max(offset, 0),
+                                                 extraction_id=extraction_id)
+    return extraction
+
+@app.delete("/datasets/{extraction_id}")
+async def delete_dataset(extraction_id: int):
+    if not await run_in_threadpool(datasets.delete, extraction_id):
+        raise HTTPException(status_code=404, detail="Extraction not found")
+    return {"deleted": extraction_id}
+
+# Long-running scrapes and exports run as background jobs so the API stays responsive
+job_queue = JobQueue()
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def run_scrape_job(payload, progress):
+    """Job handler: scrape a page and build the requested export"""
+    progress(0.1, "Fetching page")
+    results = scrape_url(payload["url"], payload.get("tags"), payload.get("source"))
+    progress(0.6, f"Extracted {len(results)} items")
+    
+    if payload.get("format") == "json":
+        return json.dumps({"data": results}).encode("utf-8"), "application/json", "scraped_data.json"
+    
+    progress(0.7, "Building Excel file")
+    return build_excel(results).getvalue(), XLSX_MEDIA_TYPE, "scraped_data.xlsx"
+
+job_queue.register("scrape", run_scrape_job)
+
+@app.on_event("startup")
+def start_job_workers():
+    job_queue.start()
+
+@app.on_event("startup")
+def warm_browsers():
+    # Launches the pooled browsers in the background, so the first render doesn't wait for Chrome
+    get_browser_pool()
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    job_queue.stop()
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """Queue a scrape/export job and return its ID immediately"""
+    job_id = await run_in_threadpool(job_queue.submit, "scrape", {
+        "url": str(request.url),
+        "tags": request.tags,
+        "source": request.source,
+        "format": request.format,
+    })
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result",
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Status and progress of a job"""
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    job.pop("result_path", None)
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Download a finished job's result"""
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=409, detail=f"Job failed: {job['error']}")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    
+    return FileResponse(job["result_path"], media_type=job["media_type"], filename=job["filename"])
+
+@app.get("/metrics")
+async def get_metrics():
+    """Retry, circuit breaker, hedging, request coalescing, render routing, monitoring and search counters"""
+    return {
+        "resilience": resilience.metrics(),
+        "coalescing": single_flight.stats(),
+        "rendering": render_router.stats,
+        "monitoring": fingerprints.stats,
+        "search": search_index.stats,
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,390 @@
+"""
+Content-addressable archive of every fetched page body, so extraction rules can
+be re-run offline against past fetches instead of re-hitting the origins.
+
+    python archive.py stats
+    python archive.py list --url-prefix https://example.com/
+    python archive.py replay --category "Prices and Costs" -o prices.ndjson
+    python archive.py replay --data-type "product prices" --since 2024-06-01
+    python archive.py replay --tags h1,h2 --url-prefix https://example.com/blog/ -j 8
+"""
+import argparse
+import hashlib
+import mmap
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", ".cache/archive")
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1") != "0"
+PACK_MAX_BYTES = int(os.getenv("ARCHIVE_PACK_MAX_BYTES", str(256 * 1024 * 1024)))
+ZSTD_LEVEL = 6
+REPLAY_FIELDS = ["url", "fetched", "Type", "Tag", "Text", "URL"]
+
+
+def _compress(data):
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), "zstd"
+    return zlib.compress(data, 6), "zlib"
+
+
+def _decompress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This archive entry is zstd-compressed: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on path shared by every process on the machine (flock, or msvcrt on Windows)"""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class PackReader:
+    """Memory-mapped read access to pack files; maps are refreshed as packs grow"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def read(self, pack, offset, length):
+        with self._lock:
+            mapped = self._maps.get(pack)
+            if mapped is None or offset + length > len(mapped):
+                if mapped is not None:
+                    mapped.close()
+                with open(os.path.join(self.directory, f"pack-{pack:05d}.dat"), "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[pack] = mapped
+            return mapped[offset:offset + length]
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps = {}
+
+
+class HtmlArchive:
+    """
+    Page bodies stored once per SHA-256, compressed (zstd when available) and
+    appended to pack files; a SQLite index maps URL + fetch time to content.
+    Several processes may archive into the same directory: appends and their
+    index rows are written under a file lock.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR, pack_max_bytes=PACK_MAX_BYTES):
+        self.directory = directory
+        self.pack_max_bytes = pack_max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.db"), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                pack INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                codec TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS captures (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                fetched REAL NOT NULL,
+                hash TEXT NOT NULL,
+                status INTEGER,
+                content_type TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_captures_url ON captures (url, fetched);
+            CREATE INDEX IF NOT EXISTS idx_captures_fetched ON captures (fetched);
+        """)
+        self._db.commit()
+        self._lock_path = os.path.join(directory, "pack.lock")
+        self.reader = PackReader(directory)
+        self.stats = {"captures": 0, "stored": 0, "deduplicated": 0, "bytes_in": 0, "bytes_stored": 0}
+
+    def _pack_path(self, pack):
+        return os.path.join(self.directory, f"pack-{pack:05d}.dat")
+
+    def put(self, url, content, status=200, content_type=None, fetched=None):
+        """Archive one fetched body; returns its content hash"""
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()
+        fetched = fetched if fetched is not None else time.time()
+        with self._lock:
+            self.stats["captures"] += 1
+            self.stats["bytes_in"] += len(content)
+            exists = self._db.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if not exists:
+                data, codec = _compress(content)
+                with file_lock(self._lock_path):
+                    # Another process may have stored it, or moved to a new pack, since the check above
+                    exists = self._db.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone()
+                    if not exists:
+                        self._store(digest, data, len(content), codec)
+            if exists:
+                self.stats["deduplicated"] += 1
+            self._db.execute(
+                "INSERT INTO captures (url, fetched, hash, status, content_type) VALUES (?, ?, ?, ?, ?)",
+                (url, fetched, digest, status, content_type),
+            )
+            self._db.commit()
+        return digest
+
+    def _store(self, digest, data, size, codec):
+        """Append a compressed body to the current pack and index it. Caller holds the file lock"""
+        (pack,) = self._db.execute("SELECT COALESCE(MAX(pack), 1) FROM blobs").fetchone()
+        path = self._pack_path(pack)
+        if os.path.exists(path) and os.path.getsize(path) + len(data) > self.pack_max_bytes:
+            pack += 1
+            path = self._pack_path(pack)
+        with open(path, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(data)
+        self._db.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                         (digest, pack, offset, len(data), size, codec))
+        # Committed before the lock is released, so the next writer sees this pack and offset
+        self._db.commit()
+        self.stats["stored"] += 1
+        self.stats["bytes_stored"] += len(data)
+
+    def location(self, digest):
+        with self._lock:
+            return self._db.execute(
+                "SELECT pack, offset, length, codec FROM blobs WHERE hash = ?", (digest,)
+            ).fetchone()
+
+    def get(self, digest):
+        """Decompressed body for a content hash, or None"""
+        location = self.location(digest)
+        if location is None:
+            return None
+        pack, offset, length, codec = location
+        return _decompress(self.reader.read(pack, offset, length), codec)
+
+    def latest(self, url, at=None):
+        """Body of the newest capture of url (as of `at`, a timestamp), or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT hash FROM captures WHERE url = ? AND fetched <= ? ORDER BY fetched DESC LIMIT 1",
+                (url, at if at is not None else time.time()),
+            ).fetchone()
+        return self.get(row[0]) if row else None
+
+    def captures(self, url_prefix=None, since=None, until=None, latest_only=True):
+        """
+        (url, fetched, pack, offset, length, codec) for matching captures, in URL
+        order. latest_only keeps the newest capture per URL within the window.
+        """
+        where = ["c.fetched >= ?", "c.fetched <= ?"]
+        params = [since or 0, until or time.time()]
+        if url_prefix:
+            # Range scan on the URL index rather than LIKE
+            where.append("c.url >= ? AND c.url < ?")
+            params += [url_prefix, url_prefix + "\U0010ffff"]
+        sql = ("SELECT c.url, MAX(c.fetched) AS fetched, b.pack, b.offset, b.length, b.codec"
+               if latest_only else "SELECT c.url, c.fetched, b.pack, b.offset, b.length, b.codec")
+        sql += " FROM captures c JOIN blobs b ON b.hash = c.hash WHERE " + " AND ".join(where)
+        sql += " GROUP BY c.url ORDER BY c.url" if latest_only else " ORDER BY c.url, c.fetched"
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def summary(self):
+        with self._lock:
+            captures, urls, first, last = self._db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT url), MIN(fetched), MAX(fetched) FROM captures"
+            ).fetchone()
+            blobs, raw, stored = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM blobs"
+            ).fetchone()
+        return {
+            "captures": captures, "urls": urls, "unique_bodies": blobs,
+            "raw_bytes": raw, "stored_bytes": stored,
+            "compression_ratio": round(raw / stored, 2) if stored else None,
+            "first_fetch": first, "last_fetch": last,
+        }
+
+    def close(self):
+        self.reader.close()
+        self._db.close()
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive():
+    """Process-wide archive"""
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = HtmlArchive()
+        return _archive
+
+
+def archive_page(url, content, status=200, content_type=None):
+    """Record a fetched body; never lets an archiving problem break the fetch itself"""
+    if not ARCHIVE_ENABLED or not content:
+        return
+    try:
+        get_archive().put(str(url), content, status, content_type)
+    except Exception as e:
+        print(f"Could not archive {url}: {e}")
+
+
+# Offline replay - runs in worker processes, each with its own memory maps
+
+_worker_reader = None
+
+
+def _replay_one(task):
+    global _worker_reader
+    from bs4 import BeautifulSoup
+
+    directory, (url, fetched, pack, offset, length, codec), extractor = task
+    if _worker_reader is None:
+        _worker_reader = PackReader(directory)
+    soup = BeautifulSoup(_decompress(_worker_reader.read(pack, offset, length), codec), "html.parser")
+
+    kind, arg, extra = extractor
+    if kind == "category":
+        from extract import extract_category
+        rows = extract_category(soup, arg, extra)
+    elif kind == "data-type":
+        from py import process_data_by_type
+        rows = process_data_by_type(soup, arg.lower().split())
+    else:
+        from extract import extract_tags
+        rows = extract_tags(soup, arg)
+
+    fetched_at = datetime.fromtimestamp(fetched, tz=timezone.utc).isoformat()
+    return [{"url": url, "fetched": fetched_at, **row} for row in rows]
+
+
+def replay(archive, extractor, on_rows, url_prefix=None, since=None, until=None, latest_only=True, workers=None):
+    """
+    Re-run an extractor over archived pages with no network access.
+    extractor is ("category", name, custom_query), ("data-type", text, None)
+    or ("tags", [tags] or None, None). Returns (pages, rows).
+    """
+    captures = archive.captures(url_prefix, since, until, latest_only)
+    tasks = ((archive.directory, capture, extractor) for capture in captures)
+    pages = rows = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(_replay_one, tasks, chunksize=16):
+            pages += 1
+            rows += len(result)
+            on_rows(result)
+    return pages, rows
+
+
+def _timestamp(value):
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the page archive and replay extraction offline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Archive size and compression")
+
+    def add_filters(command):
+        command.add_argument("--url-prefix", help="Only URLs starting with this")
+        command.add_argument("--since", help="Only captures at or after this ISO date/time")
+        command.add_argument("--until", help="Only captures at or before this ISO date/time")
+        command.add_argument("--all-captures", action="store_true", help="Every capture, not just the newest per URL")
+
+    add_filters(commands.add_parser("list", help="List archived captures"))
+    replay_parser = commands.add_parser("replay", help="Re-run extraction over archived pages")
+    add_filters(replay_parser)
+    rules = replay_parser.add_mutually_exclusive_group(required=True)
+    rules.add_argument("--category", help="A main.py data category, e.g. 'Prices and Costs'")
+    rules.add_argument("--data-type", help="py.py data type, e.g. 'product prices'")
+    rules.add_argument("--tags", help="Comma-separated tags, as in api.py (empty for all tags)")
+    replay_parser.add_argument("--query", default="", help="Search terms for --category 'Custom Query'")
+    replay_parser.add_argument("-o", "--output", default="-", help="Output file (.ndjson, .csv or .parquet), - for stdout")
+    replay_parser.add_argument("-f", "--format", choices=["ndjson", "csv", "parquet"])
+    replay_parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    archive = HtmlArchive()
+    try:
+        if args.command == "stats":
+            for key, value in archive.summary().items():
+                print(f"{key}: {value}")
+            return 0
+
+        window = dict(url_prefix=args.url_prefix, since=_timestamp(args.since), until=_timestamp(args.until),
+                      latest_only=not args.all_captures)
+        if args.command == "list":
+            for url, fetched, *_ in archive.captures(**window):
+                print(f"{datetime.fromtimestamp(fetched, tz=timezone.utc).isoformat()}  {url}")
+            return 0
+
+        from extract import DATA_CATEGORIES
+        from cli import open_writer
+        if args.category:
+            if args.category not in DATA_CATEGORIES:
+                parser.error(f"unknown category; choose from: {', '.join(DATA_CATEGORIES)}")
+            extractor = ("category", args.category, args.query)
+        elif args.data_type:
+            extractor = ("data-type", args.data_type, None)
+        else:
+            extractor = ("tags", [t.strip() for t in args.tags.split(",") if t.strip()] or None, None)
+
+        start = time.monotonic()
+        writer = open_writer(args.output, args.format, fields=REPLAY_FIELDS)
+        try:
+            pages, rows = replay(archive, extractor, writer.write, workers=args.workers, **window)
+        finally:
+            writer.close()
+        elapsed = max(time.monotonic() - start, 1e-9)
+        print(f"\n✅ Replayed {pages} archived pages, {rows} rows in {elapsed:.1f}s - {pages / elapsed:.1f} pages/s",
+              file=sys.stderr)
+        return 0
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import queue
+import threading
+import time
+
+CHROME_DRIVER_PATH = "./chromedriver.exe"
+POOL_SIZE = 2  # Warm browsers kept alive; also the max number of concurrent renders
+MAX_USES = 50  # Pages rendered by one browser before it is replaced (caps memory creep)
+RENDER_TIMEOUT = 15  # Seconds to wait for a page to become ready
+NETWORK_IDLE_SECONDS = 0.5  # No new network requests for this long counts as idle
+POLL_INTERVAL = 0.1
+
+# Heavy resources that never matter for text extraction
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg", "*.avi", "*.mov",
+]
+
+# Network resources the page has requested since the last sample. Clearing the
+# entries keeps the browser's resource timing buffer (250 by default) from filling
+# up, after which the count would stop growing and a busy page would look idle
+NEW_RESOURCES_JS = """
+var count = window.performance.getEntriesByType('resource').length;
+window.performance.clearResourceTimings();
+return count;
+"""
+READY_STATE_JS = "return document.readyState"
+
+
+class RenderTimeout(Exception):
+    """Raised when a page doesn't reach its readiness condition in time"""
+
+
+def chrome_driver_factory(block_resources=True):
+    """Start a headless Chrome with images, fonts and media blocked"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    if block_resources:
+        options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.media_stream": 2,
+        })
+    # Return from driver.get() at DOMContentLoaded; readiness is decided by our own waits
+    options.page_load_strategy = "eager"
+
+    driver = webdriver.Chrome(service=Service(CHROME_DRIVER_PATH), options=options)
+    if block_resources:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    return driver
+
+
+class BrowserPool:
+    """
+    Keeps warm browser instances and hands them out for renders.
+    At most `size` renders run at once; extra callers queue for a free browser.
+    """
+
+    def __init__(self, size=POOL_SIZE, driver_factory=chrome_driver_factory, max_uses=MAX_USES):
+        self.size = size
+        self.driver_factory = driver_factory
+        self.max_uses = max_uses
+        self._idle = queue.LifoQueue()  # Most recently used first, keeps caches warm
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+        self.stats = {"renders": 0, "browsers_started": 0, "browsers_recycled": 0, "timeouts": 0}
+
+    def warm_up(self):
+        """Start every browser up front so the first renders don't pay for launch"""
+        drivers = []
+        try:
+            for _ in range(self.size):
+                drivers.append(self._acquire())
+        finally:
+            for driver in drivers:
+                self._release(driver)
+
+    def _start(self):
+        driver = self.driver_factory()
+        driver.render_count = 0
+        self.stats["browsers_started"] += 1
+        return driver
+
+    def _acquire(self, timeout=None):
+        if self._closed:
+            raise RuntimeError("BrowserPool is closed")
+        if not self._slots.acquire(timeout=timeout):
+            raise RenderTimeout(f"No browser free after {timeout}s")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._start()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, driver, broken=False):
+        try:
+            if broken or self._closed or driver.render_count >= self.max_uses:
+                if not broken and not self._closed:
+                    self.stats["browsers_recycled"] += 1
+                self._discard(driver)
+                return
+            try:
+                # Reset the tab so the next render starts clean
+                driver.get("about:blank")
+                driver.delete_all_cookies()
+            except Exception:
+                self._discard(driver)
+                return
+            self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    def _discard(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def render(self, url, wait_for_selector=None, network_idle=True, timeout=RENDER_TIMEOUT):
+        """
+        Load a URL in a pooled browser and return the rendered HTML once ready:
+        document complete, the selector present (if given) and the network idle.
+        """
+        driver = self._acquire(timeout=timeout)
+        broken = False
+        try:
+            driver.get(url)
+            self._wait_until_ready(driver, wait_for_selector, network_idle, timeout)
+            self.stats["renders"] += 1
+            return driver.page_source
+        except RenderTimeout:
+            self.stats["timeouts"] += 1
+            raise
+        except Exception:
+            broken = True
+            raise
+        finally:
+            driver.render_count += 1
+            self._release(driver, broken=broken)
+
+    def _wait_until_ready(self, driver, wait_for_selector, network_idle, timeout):
+        deadline = time.monotonic() + timeout
+        idle_since = None
+        while True:
+            now = time.monotonic()
+            ready = driver.execute_script(READY_STATE_JS) == "complete"
+            if ready and wait_for_selector:
+                ready = bool(driver.find_elements("css selector", wait_for_selector))
+            if ready and network_idle:
+                if idle_since is None or driver.execute_script(NEW_RESOURCES_JS):
+                    idle_since = now
+                ready = now - idle_since >= NETWORK_IDLE_SECONDS
+            if ready:
+                return
+            if now >= deadline:
+                raise RenderTimeout(f"Page not ready after {timeout}s: {driver.current_url}")
+            time.sleep(POLL_INTERVAL)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Function to launch a pool's browsers, logging rather than raising if Chrome can't start
+def warm_up_pool(pool):
+    try:
+        pool.warm_up()
+    except Exception as e:
+        print(f"Browser pool warm-up failed: {str(e)}")
+
+
+def get_browser_pool():
+    """Process-wide pool shared by every render call; its browsers are launched in the background on creation"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            threading.Thread(target=warm_up_pool, args=(_pool,), name="browser-warm-up", daemon=True).start()
+        return _pool
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+
+FINGERPRINT_DB = os.getenv("FINGERPRINT_DB", ".cache/fingerprints.db")
+SIMHASH_BITS = 64
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def content_hash(content):
+    """SHA-256 of the raw page body (or of rows, for JSON data sources)"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def simhash(texts):
+    """
+    64-bit simhash of word bigrams across the texts; similar text gives hashes a
+    small Hamming distance apart, so cosmetic edits can be told from real ones.
+    """
+    weights = [0] * SIMHASH_BITS
+    words = [w.lower() for text in texts for w in WORD.findall(text)]
+    features = Counter(zip(words, words[1:])) if len(words) > 1 else Counter(words)
+    for feature, count in features.items():
+        h = int.from_bytes(hashlib.blake2b(repr(feature).encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if h >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def row_hash(row):
+    return hashlib.sha1(json.dumps(row, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def diff_rows(old_rows, new_rows):
+    """Row-level delta as (added, removed), treating rows as a multiset"""
+    old_hashes = [row_hash(row) for row in old_rows]
+    new_hashes = [row_hash(row) for row in new_rows]
+    common = Counter(old_hashes) & Counter(new_hashes)
+
+    def unmatched(rows, hashes):
+        matched = Counter()
+        for row, h in zip(rows, hashes):
+            if matched[h] < common[h]:
+                matched[h] += 1
+            else:
+                yield row
+
+    return list(unmatched(new_rows, new_hashes)), list(unmatched(old_rows, old_hashes))
+
+
+def row_texts(rows):
+    for row in rows:
+        for value in row.values():
+            if isinstance(value, str):
+                yield value
+
+
+class FingerprintStore:
+    """
+    Last-seen fingerprint of each monitored URL: a hash of the raw content, a
+    simhash of the extracted text and the extracted rows (zlib-compressed JSON)
+    so the next check can report only what changed.
+    """
+
+    def __init__(self, path=FINGERPRINT_DB):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                simhash TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                rows BLOB NOT NULL,
+                checked REAL NOT NULL,
+                changed REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+        self.stats = {"checks": 0, "short_circuited": 0, "unchanged": 0, "changed": 0, "new": 0}
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_hash, simhash, rows, changed FROM fingerprints WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"content_hash": row[0], "simhash": int(row[1], 16), "rows": row[2], "changed": row[3]}
+
+    def _save(self, key, url, digest, fingerprint, rows, now):
+        blob = zlib.compress(json.dumps(rows, ensure_ascii=False, default=str).encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, digest, f"{fingerprint:016x}", len(rows), blob, now, now),
+            )
+            self._db.commit()
+
+    def _touch(self, key, digest, now):
+        with self._lock:
+            self._db.execute("UPDATE fingerprints SET content_hash = ?, checked = ? WHERE key = ?", (digest, now, key))
+            self._db.commit()
+
+    def check(self, key, url, content, extract, min_change_bits=0):
+        """
+        Compare a fresh fetch against the stored fingerprint. extract() is only
+        called when the raw content hash differs. Changes whose simhash distance is
+        below min_change_bits count as unchanged (and keep accumulating until they don't).
+        """
+        self.stats["checks"] += 1
+        now = time.time()
+        digest = content_hash(content)
+        previous = self.get(key)
+        result = {"url": url, "checked_at": now, "content_hash": digest, "added": [], "removed": []}
+
+        if previous is not None and previous["content_hash"] == digest:
+            # Byte-identical page: skip parsing, extraction and export entirely
+            self.stats["short_circuited"] += 1
+            self.stats["unchanged"] += 1
+            self._touch(key, digest, now)
+            return {**result, "status": "unchanged", "simhash": f"{previous['simhash']:016x}", "distance": 0,
+                    "last_changed": previous["changed"]}
+
+        rows = extract()
+        fingerprint = simhash(row_texts(rows))
+        result.update(simhash=f"{fingerprint:016x}", row_count=len(rows))
+
+        if previous is None:
+            self.stats["new"] += 1
+            self._save(key, url, digest, fingerprint, rows, now)
+            return {**result, "status": "new", "distance": None, "added": rows, "last_changed": now}
+
+        distance = hamming(previous["simhash"], fingerprint)
+        old_rows = json.loads(zlib.decompress(previous["rows"]).decode("utf-8"))
+        added, removed = diff_rows(old_rows, rows)
+        if (not added and not removed) or distance < min_change_bits:
+            # Only markup or noise changed; remember the new body so the next identical fetch short-circuits
+            self.stats["unchanged"] += 1
+            self._touch(key, digest, now)
+            return {**result, "status": "unchanged", "distance": distance, "last_changed": previous["changed"]}
+
+        self.stats["changed"] += 1
+        self._save(key, url, digest, fingerprint, rows, now)
+        return {**result, "status": "changed", "distance": distance, "added": added, "removed": removed,
+                "last_changed": now}
+
+    def forget(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM fingerprints WHERE key = ?", (key,))
+            self._db.commit()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_fingerprint_store():
+    """Process-wide fingerprint store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FingerprintStore()
+        return _store
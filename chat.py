@@ -1,12 +1,18 @@
 import streamlit as st
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-from google.generativeai import types
+from google.genai import types
 import requests
 from bs4 import BeautifulSoup
 import time
 
+from chat_history import get_chat_history, render_history
+from llm_cache import get_llm_cache
+from llm_gateway import cache_variant, get_llm_gateway
+
+# Same model and prompt as chat_api.py, so the two share cached answers
+CACHE_VARIANT = cache_variant("search")
+
 # Load environment variables
 load_dotenv()
 
@@ -145,9 +151,29 @@ with col1:
 st.markdown('<h1 class="main-header">DataForage AI Chat</h1>', unsafe_allow_html=True)
 st.markdown('<p class="sub-header">Ask questions about any website content</p>', unsafe_allow_html=True)
 
-# Initialize session state
-if 'messages' not in st.session_state:
-    st.session_state.messages = []
+# Function to render an answer while its chunks arrive; returns the full text and when the first chunk came
+def render_stream(chunks, loading, box):
+    answer, first_token_time = "", None
+    for text in chunks:
+        if first_token_time is None:
+            first_token_time = time.time()
+            loading.empty()
+        answer += text
+        box.markdown(answer + "▌")
+    box.markdown(answer)
+    return answer, first_token_time
+
+# Function to render one chat message
+def render_message(msg):
+    if msg["role"] == "user":
+        st.markdown(f"<div class='user-message'>{msg['content']}</div>", unsafe_allow_html=True)
+    else:
+        st.markdown(f"<div class='ai-message'>{msg['content']}</div>", unsafe_allow_html=True)
+        if msg.get("caption"):
+            st.caption(msg["caption"])
+
+# Initialize session state (capped chat history, older turns summarized)
+chat_history = get_chat_history()
 
 if 'gemini_key_set' not in st.session_state:
     # Check if API key is available
@@ -220,67 +246,72 @@ if st.session_state.gemini_key_set:
             else:
                 # Add user message to chat history
                 user_message = f"Question: {question}\nWebsite: {url}"
-                st.session_state.messages.append({"role": "user", "content": user_message})
+                chat_history.append({"role": "user", "content": user_message})
                 
-                # Display loading indicator
+                # Display loading indicator until the first chunk of the answer arrives
                 with st.container():
-                    st.markdown('<div class="loading"><div class="loading-dot"></div><div class="loading-dot"></div><div class="loading-dot"></div></div>', unsafe_allow_html=True)
+                    loading = st.empty()
+                    answer_box = st.empty()
+                    loading.markdown('<div class="loading"><div class="loading-dot"></div><div class="loading-dot"></div><div class="loading-dot"></div></div>', unsafe_allow_html=True)
                     
                     try:
-                        # Initialize Gemini API
-                        model = genai.GenerativeModel('gemini-2.0-flash')
-                        api_key = os.getenv("GEMINI_API_KEY")
-                        client = genai.Client(api_key=api_key)
+                        # Reuse an earlier answer to the same question while the page is unchanged
+                        llm_cache = get_llm_cache()
+                        fingerprint = llm_cache.page_fingerprint(url)
+                        cached = llm_cache.get(question, url, fingerprint, CACHE_VARIANT)
                         
-                        # Construct the prompt with the URL and question
-                        prompt = f"{question} from this URL: {url}"
-                        
-                        start_time = time.time()
-                        # Call the Gemini API with web search capability
-                        response = client.models.generate_content(
-                            model='gemini-2.0-flash',
-                            contents=prompt,
-                            config=types.GenerateContentConfig(
-                                tools=[types.Tool(
-                                    google_search=types.GoogleSearchRetrieval
-                                )]
+                        if cached is not None:
+                            chat_history.append({
+                                "role": "assistant",
+                                "content": cached["response"],
+                                "caption": f"Answered from cache (saved {cached['latency']:.2f} seconds)",
+                            })
+                        else:
+                            # Construct the prompt with the URL and question
+                            prompt = f"{question} from this URL: {url}"
+                            
+                            start_time = time.time()
+                            # Stream the answer from Gemini with web search capability, through the shared gateway
+                            chunks = get_llm_gateway().stream(
+                                prompt,
+                                "chat",
+                                config=types.GenerateContentConfig(
+                                    tools=[types.Tool(google_search=types.GoogleSearch())]
+                                ),
+                                api_key=os.getenv("GEMINI_API_KEY"),
                             )
-                        )
-                        end_time = time.time()
-                        
-                        # Extract the response text
-                        response_text = response.candidates[0].content.parts[0].text
-                        
-                        # Add AI response to chat history
-                        st.session_state.messages.append({"role": "assistant", "content": response_text})
-                        
-                        # Display processing time
-                        processing_time = end_time - start_time
-                        st.caption(f"Processed in {processing_time:.2f} seconds")
+                            answer, first_token_time = render_stream(chunks, loading, answer_box)
+                            end_time = time.time()
+                            
+                            # Display processing time and time to first token with the answer
+                            processing_time = end_time - start_time
+                            caption = f"Processed in {processing_time:.2f} seconds"
+                            if first_token_time is not None:
+                                caption += f" (first token after {first_token_time - start_time:.2f} seconds)"
+                            
+                            # Add the complete AI response to chat history
+                            chat_history.append({"role": "assistant", "content": answer, "caption": caption})
+                            llm_cache.put(question, url, fingerprint, answer, processing_time, CACHE_VARIANT)
                         
                     except Exception as e:
                         st.error(f"Error: {str(e)}")
-                        st.session_state.messages.append({
+                        chat_history.append({
                             "role": "assistant", 
                             "content": f"Sorry, I encountered an error while processing your request: {str(e)}"
                         })
                     
-                    # Clear the loading indicator and rerun to display messages
+                    # Rerun to display messages, now including the complete answer
                     st.rerun()
         
-        # Display chat messages
-        if st.session_state.messages:
+        # Display chat messages: only a recent window is rendered, older ones on request
+        if chat_history:
             st.markdown("<div class='chat-container'>", unsafe_allow_html=True)
-            for msg in st.session_state.messages:
-                if msg["role"] == "user":
-                    st.markdown(f"<div class='user-message'>{msg['content']}</div>", unsafe_allow_html=True)
-                else:
-                    st.markdown(f"<div class='ai-message'>{msg['content']}</div>", unsafe_allow_html=True)
+            render_history(chat_history, render_message)
             st.markdown("</div>", unsafe_allow_html=True)
             
             # Add a button to clear chat history
             if st.button("Clear Chat History"):
-                st.session_state.messages = []
+                chat_history.clear()
                 st.rerun()
     
     with col2:
@@ -1,17 +1,23 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
-import google.generativeai as genai
-from google.generativeai import types
+from google.genai import types
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 import json
 
+from llm_cache import get_llm_cache
+from llm_gateway import LLM_TIMEOUT, LLMBusyError, cache_variant, estimate_tokens, get_llm_gateway, response_text
+from retrieval import build_prompt, get_index_cache
+
 # Load environment variables
 load_dotenv()
 
-# Initialize Google Gemini API client
+# Check the Gemini API key up front rather than on the first chat
 api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
     raise ValueError("GEMINI_API_KEY environment variable not set")
@@ -32,43 +38,147 @@ app.add_middleware(
 class ChatRequest(BaseModel):
     url: str
     question: str
+    similarity_threshold: Optional[float] = None  # Reuse answers to near-duplicate questions from this similarity up (1 disables)
+    retrieval: bool = True  # Send the model the relevant parts of the page instead of letting it browse
 
 # Define response model
 class ChatResponse(BaseModel):
     response: str
+    cached: bool = False
+    matched_question: Optional[str] = None
+    similarity: Optional[float] = None
+
+# Shared Gemini clients, concurrency/rate limits and per-caller accounting
+gateway = get_llm_gateway()
+
+# Answers to repeated questions are served from cache while the page is unchanged
+llm_cache = get_llm_cache()
+CACHE_VARIANT = cache_variant("search")  # chat.py asks with the same model and prompt, so they share answers
+RETRIEVAL_VARIANT = cache_variant("retrieval")
+
+# Per-URL BM25 indexes of fetched pages, so only the relevant chunks go to the model
+page_indexes = get_index_cache()
+retrieval_stats = {"grounded": 0, "browsing": 0, "excerpt_tokens": 0}
+
+def build_request(chat_request):
+    """Prompt and config for a question about a URL, with web search enabled"""
+    prompt = f"{chat_request.question} from this URL: {chat_request.url}"
+    config = types.GenerateContentConfig(
+        tools=[types.Tool(google_search=types.GoogleSearch())]
+    )
+    return prompt, config
 
-# Initialize Gemini client
-client = genai.Client(api_key=api_key)
+async def prepare(chat_request):
+    """
+    Prompt, config, cache variant and page fingerprint for a question. The page is
+    fetched and indexed locally and only its best chunks are sent; if that fails
+    the model browses the URL itself.
+    """
+    page = None
+    if chat_request.retrieval:
+        try:
+            page = await asyncio.to_thread(page_indexes.get, chat_request.url)
+        except Exception as e:
+            print(f"Retrieval failed for {chat_request.url}, letting the model browse: {str(e)}")
+    
+    if page is None or not page.chunks:
+        retrieval_stats["browsing"] += 1
+        prompt, config = build_request(chat_request)
+        fingerprint = await asyncio.to_thread(llm_cache.page_fingerprint, chat_request.url)
+        return prompt, config, CACHE_VARIANT, fingerprint
+    
+    chunks = page.top_chunks(chat_request.question)
+    retrieval_stats["grounded"] += 1
+    retrieval_stats["excerpt_tokens"] += sum(estimate_tokens(text) for _, text, _ in chunks)
+    prompt = build_prompt(chat_request.question, chat_request.url, chunks)
+    return prompt, types.GenerateContentConfig(temperature=0.2), RETRIEVAL_VARIANT, page.fingerprint
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat_with_url(chat_request: ChatRequest):
     """Process a chat request that asks a question about a URL."""
+    # Reuse an earlier answer to the same question while the page is unchanged
+    prompt, config, variant, fingerprint = await prepare(chat_request)
+    cached = await asyncio.to_thread(llm_cache.get, chat_request.question, chat_request.url, fingerprint, variant,
+                                     chat_request.similarity_threshold)
+    if cached is not None:
+        return ChatResponse(response=cached["response"], cached=True, matched_question=cached.get("matched_question"),
+                            similarity=cached.get("similarity"))
+    
     try:
-        # Construct the prompt with the URL and question
-        prompt = f"{chat_request.question} from this URL: {chat_request.url}"
-        
-        # Call the Gemini API with web search capability
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                tools=[types.Tool(
-                    google_search=types.GoogleSearchRetrieval
-                )]
-            )
-        )
-        
-        # Extract the response text
-        response_text = response.candidates[0].content.parts[0].text
+        # Call Gemini through the shared gateway, without blocking the event loop
+        start_time = time.time()
+        response = await gateway.agenerate(prompt, "chat_api", config=config)
+        text = response_text(response)
         
-        return ChatResponse(response=response_text)
+        await asyncio.to_thread(llm_cache.put, chat_request.question, chat_request.url, fingerprint, text,
+                                time.time() - start_time, variant)
+        return ChatResponse(response=text)
     
+    except (asyncio.TimeoutError, TimeoutError):
+        print(f"Gemini call timed out after {LLM_TIMEOUT}s")
+        raise HTTPException(status_code=504, detail=f"AI processing timed out after {LLM_TIMEOUT:.0f} seconds")
     except Exception as e:
         error_message = str(e)
         # Log the error for server-side debugging
         print(f"Error in chat_with_url: {error_message}")
         raise HTTPException(status_code=500, detail=f"AI processing error: {error_message}")
 
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_answer(chat_request):
+    """Server-sent events: a "token" event per chunk as Gemini produces it, then "done" (or "error")"""
+    prompt, config, variant, fingerprint = await prepare(chat_request)
+    cached = await asyncio.to_thread(llm_cache.get, chat_request.question, chat_request.url, fingerprint, variant,
+                                     chat_request.similarity_threshold)
+    if cached is not None:
+        yield sse("token", {"text": cached["response"]})
+        yield sse("done", {"cached": True, "matched_question": cached.get("matched_question"),
+                           "similarity": cached.get("similarity")})
+        return
+    
+    try:
+        start_time = time.time()
+        parts = []
+        async for text in gateway.astream(prompt, "chat_api", config=config):
+            parts.append(text)
+            yield sse("token", {"text": text})
+        # Only complete answers are cached
+        await asyncio.to_thread(llm_cache.put, chat_request.question, chat_request.url, fingerprint, "".join(parts),
+                                time.time() - start_time, variant)
+        yield sse("done", {"cached": False})
+    except LLMBusyError:
+        yield sse("error", {"detail": "AI service is busy, try again shortly"})
+    except (asyncio.TimeoutError, TimeoutError):
+        yield sse("error", {"detail": f"AI processing timed out after {LLM_TIMEOUT:.0f} seconds"})
+    except Exception as e:
+        print(f"Error in chat stream: {str(e)}")
+        yield sse("error", {"detail": f"AI processing error: {str(e)}"})
+
+@app.post("/chat/stream")
+async def chat_stream(chat_request: ChatRequest):
+    """Same as /chat, but forwards the answer as server-sent events while it is generated"""
+    return StreamingResponse(
+        stream_answer(chat_request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.delete("/chat/cache")
+async def clear_chat_cache(url: Optional[str] = None):
+    """Drop cached answers for a URL, or all of them"""
+    return {"invalidated": await asyncio.to_thread(llm_cache.invalidate, url)}
+
+@app.get("/chat/cache/similar")
+async def similar_question_hits(url: Optional[str] = None, limit: int = 50, offset: int = 0):
+    """Audit log of answers reused for a near-duplicate question"""
+    return await asyncio.to_thread(llm_cache.similar_hits, limit=limit, offset=offset, url=url)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Gemini call concurrency, queueing, timeout and error counters, answer cache hit rates and retrieval use"""
+    return {**gateway.usage(), "cache": llm_cache.metrics(), "retrieval": {**retrieval_stats, **page_indexes.stats}}
+
 # For development testing
 if __name__ == "__main__":
     import uvicorn
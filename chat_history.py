@@ -0,0 +1,106 @@
+"""
+Bounded chat history for the Streamlit chat pages: only the latest messages
+are kept verbatim, older ones are folded into a short summary when the cap is
+reached, and only a recent window is rendered, with older messages loaded on
+request.
+"""
+import os
+import re
+
+import streamlit as st
+
+MAX_MESSAGES = int(os.getenv("CHAT_MAX_MESSAGES", "40"))  # Messages kept verbatim per session
+COMPACT_MESSAGES = 10  # Messages folded into the summary at a time, so compaction runs once per few turns
+WINDOW = int(os.getenv("CHAT_WINDOW", "10"))  # Messages rendered per rerun until "load older" is clicked
+MAX_SUMMARY_LINES = 50
+SUMMARY_CHARS = 160
+
+
+def first_sentence(text, chars=SUMMARY_CHARS):
+    text = re.sub(r"\s+", " ", text or "").strip()
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    return sentence if len(sentence) <= chars else sentence[:chars - 1] + "…"
+
+
+class ChatHistory:
+    """One session's messages: the recent ones verbatim, the rest as summary lines"""
+
+    def __init__(self, max_messages=MAX_MESSAGES, window=WINDOW):
+        self.max_messages = max(max_messages, COMPACT_MESSAGES + 2)
+        self.window = window
+        self.messages = []
+        self.summary = []
+        self.compacted = 0  # Messages folded into the summary so far
+        self.shown = window
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __bool__(self):
+        return bool(self.messages or self.summary)
+
+    def append(self, message):
+        self.messages.append(message)
+        if message["role"] == "user":
+            # A new question goes back to showing only the recent window
+            self.shown = self.window
+        if len(self.messages) > self.max_messages:
+            self._compact()
+
+    def _compact(self):
+        """Fold the oldest messages into summary lines: each question with the first sentence of its answer"""
+        count = COMPACT_MESSAGES
+        # Don't split a question from its answer
+        if count < len(self.messages) and self.messages[count]["role"] != "user":
+            count += 1
+        old, self.messages = self.messages[:count], self.messages[count:]
+        self.compacted += len(old)
+        line = None
+        for message in old:
+            if message["role"] == "user":
+                if line:
+                    self.summary.append(line)
+                line = first_sentence(message["content"].splitlines()[0] if message["content"] else "", 120)
+            else:
+                answer = first_sentence(message["content"])
+                line = f"{line} → {answer}" if line else f"→ {answer}"
+        if line:
+            self.summary.append(line)
+        del self.summary[:-MAX_SUMMARY_LINES]
+
+    def visible(self):
+        """Messages to render this rerun (the latest `shown` ones)"""
+        return self.messages[-self.shown:] if self.shown else []
+
+    def hidden(self):
+        """Stored messages not rendered yet"""
+        return max(len(self.messages) - self.shown, 0)
+
+    def load_older(self):
+        self.shown += self.window
+
+    def clear(self):
+        self.messages = []
+        self.summary = []
+        self.compacted = 0
+        self.shown = self.window
+
+
+# Function to get this session's chat history, created on first use
+def get_chat_history():
+    if "chat_history" not in st.session_state:
+        st.session_state.chat_history = ChatHistory()
+    return st.session_state.chat_history
+
+
+# Function to render the summary, a "load older" button and the recent window of messages
+def render_history(history, render_message):
+    if history.summary and not history.hidden():
+        with st.expander(f"Earlier conversation ({history.compacted} messages, summarized)"):
+            st.markdown("\n".join(f"- {line}" for line in history.summary))
+    if history.hidden():
+        if st.button(f"Load older messages ({history.hidden()} more)"):
+            history.load_older()
+            st.rerun()
+    for message in history.visible():
+        render_message(message)
@@ -0,0 +1,244 @@
+"""
+Non-interactive batch scraper.
+
+    python cli.py urls.txt --data-type "product prices" --output prices.ndjson
+    cat urls.txt | python cli.py - --pages 5 --concurrency 32 --output out.parquet
+    python cli.py --sitemap https://example.com -d "article titles" -o titles.ndjson
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import chain
+
+from bs4 import BeautifulSoup
+
+import py
+from proxy_pool import ProxyPool
+from sitemap import SitemapState, discover_urls
+
+OUTPUT_FIELDS = ["url", "page_url", "page", "Type", "Text"]
+INTEGER_FIELDS = {"page", "depth"}
+PARQUET_BATCH_ROWS = 10000
+
+
+class NDJSONWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, rows):
+        for row in rows:
+            self.stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class CSVWriter:
+    def __init__(self, stream, fields=OUTPUT_FIELDS):
+        self.stream = stream
+        self.writer = csv.DictWriter(stream, fieldnames=fields, extrasaction="ignore")
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.stream.flush()
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class ParquetWriter:
+    """Buffers rows into row groups so memory stays bounded however many URLs run"""
+
+    def __init__(self, path, fields=OUTPUT_FIELDS):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self.pa = pa
+        self.fields = fields
+        self.schema = pa.schema([(field, pa.int32() if field in INTEGER_FIELDS else pa.string()) for field in fields])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.buffer = []
+
+    def write(self, rows):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= PARQUET_BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            columns = {field: [row.get(field) for row in self.buffer] for field in self.fields}
+            self.writer.write_table(self.pa.table(columns, schema=self.schema))
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def open_writer(output, output_format, fields=OUTPUT_FIELDS):
+    if output_format is None:
+        extension = os.path.splitext(output)[1].lower().lstrip(".")
+        output_format = {"csv": "csv", "parquet": "parquet", "pq": "parquet"}.get(extension, "ndjson")
+    if output_format == "parquet":
+        if output == "-":
+            raise SystemExit("Parquet output needs a file path")
+        return ParquetWriter(output, fields)
+    stream = sys.stdout if output == "-" else open(output, "w", encoding="utf-8", newline="")
+    return CSVWriter(stream, fields) if output_format == "csv" else NDJSONWriter(stream)
+
+
+def read_urls(source):
+    """Yield URLs lazily from a file or stdin, skipping blanks and comments"""
+    stream = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    with stream:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def scrape_url(url, keywords, max_pages, delay):
+    """Scrape one URL (following next-page links up to max_pages); returns (rows, pages)"""
+    rows = []
+    page_url = url
+    pages = 0
+    while page_url and pages < max_pages:
+        response = py.fetch(page_url, py.get_request_config())
+        if response.status_code != 200:
+            if pages == 0:
+                raise RuntimeError(f"status {response.status_code}")
+            break
+        soup = BeautifulSoup(response.content, "html.parser")
+        pages += 1
+        for item in py.process_data_by_type(soup, keywords):
+            rows.append({"url": url, "page_url": page_url, "page": pages, **item})
+        page_url = py.find_next_page_link(soup, page_url) if pages < max_pages else None
+        if page_url and delay:
+            time.sleep(delay)
+    return rows, pages
+
+
+def run(urls, keywords, writer, concurrency, max_pages, delay, quiet=False):
+    """Scrape URLs with at most `concurrency` in flight, streaming rows to writer as each finishes"""
+    stats = {"urls": 0, "failed": 0, "pages": 0, "rows": 0}
+    start = time.monotonic()
+    last_report = start
+
+    def finish(future):
+        url = futures.pop(future)
+        stats["urls"] += 1
+        try:
+            rows, pages = future.result()
+        except Exception as e:
+            stats["failed"] += 1
+            print(f"FAILED {url}: {e}", file=sys.stderr)
+            return
+        stats["pages"] += pages
+        stats["rows"] += len(rows)
+        writer.write(rows)
+
+    futures = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for url in urls:
+            # Bound the in-flight set so huge URL lists never sit in memory as futures
+            while len(futures) >= concurrency * 2:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+            futures[executor.submit(scrape_url, url, keywords, max_pages, delay)] = url
+
+            now = time.monotonic()
+            if not quiet and now - last_report >= 5:
+                last_report = now
+                print(f"... {stats['urls']} URLs done, {stats['rows']} rows, "
+                      f"{stats['urls'] / (now - start):.1f} URLs/s", file=sys.stderr)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(future)
+
+    stats["elapsed"] = time.monotonic() - start
+    return stats
+
+
+def print_summary(stats):
+    elapsed = max(stats["elapsed"], 1e-9)
+    print(
+        f"\n✅ {stats['urls'] - stats['failed']}/{stats['urls']} URLs succeeded "
+        f"({stats['failed']} failed), {stats['pages']} pages, {stats['rows']} rows in {stats['elapsed']:.1f}s\n"
+        f"   Throughput: {stats['urls'] / elapsed:.2f} URLs/s, {stats['pages'] / elapsed:.2f} pages/s, "
+        f"{stats['rows'] / elapsed:.1f} rows/s",
+        file=sys.stderr,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape many URLs without prompts, streaming results to disk.")
+    parser.add_argument("input", nargs="?", help="File with one URL per line, or - for stdin")
+    parser.add_argument("-d", "--data-type", required=True,
+                        help="What data to extract, e.g. 'product prices', 'article titles', 'contact information'")
+    parser.add_argument("-o", "--output", default="-", help="Output file (.ndjson, .csv or .parquet), - for stdout")
+    parser.add_argument("-f", "--format", choices=["ndjson", "csv", "parquet"], help="Output format (default: from extension)")
+    parser.add_argument("-p", "--pages", type=int, default=1, help="Max pages per URL, following next-page links (default: 1)")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="URLs scraped in parallel (default: 16)")
+    parser.add_argument("--proxy", action="append", default=[], help="Proxy URL (repeatable)")
+    parser.add_argument("--proxy-file", help="File with one proxy URL per line")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait between pages of the same URL")
+    parser.add_argument("-q", "--quiet", action="store_true", help="No progress output")
+    parser.add_argument("--sitemap", action="append", default=[],
+                        help="Site whose robots.txt/sitemaps supply URLs; only pages changed since its last run are scraped (repeatable)")
+    parser.add_argument("--full", action="store_true", help="With --sitemap, ignore lastmod and scrape every listed URL")
+    args = parser.parse_args(argv)
+    if not args.input and not args.sitemap:
+        parser.error("give an input file or at least one --sitemap")
+
+    proxies = list(args.proxy)
+    if args.proxy_file:
+        proxies.extend(read_urls(args.proxy_file))
+    if proxies:
+        py.use_proxy = True
+        py.proxy_pool = ProxyPool(proxies)
+
+    sources = [read_urls(args.input)] if args.input else []
+    sitemap_state = SitemapState() if args.sitemap else None
+    sitemap_stats = {}
+    started = time.time()
+    for site in args.sitemap:
+        since = None if args.full else sitemap_state.last_run(site)
+        if since and not args.quiet:
+            print(f"{site}: only pages modified since {since:%Y-%m-%d %H:%M} UTC", file=sys.stderr)
+        sources.append(discover_urls(site, since=since, stats=sitemap_stats))
+
+    keywords = args.data_type.lower().split()
+    writer = open_writer(args.output, args.format)
+    try:
+        stats = run(chain.from_iterable(sources), keywords, writer, max(args.concurrency, 1),
+                    max(args.pages, 1), args.delay, args.quiet)
+    finally:
+        writer.close()
+        if py.proxy_pool is not None:
+            py.proxy_pool.close()
+    print_summary(stats)
+    if sitemap_state is not None:
+        print(f"   Sitemaps: {sitemap_stats.get('sitemaps', 0)} read, {sitemap_stats.get('urls', 0)} URLs queued, "
+              f"{sitemap_stats.get('skipped', 0)} unchanged entries skipped", file=sys.stderr)
+        # Only advance the cutoff when nothing was missed, so failed pages are retried next run
+        if stats["failed"] == 0 and not sitemap_stats.get("failed"):
+            for site in args.sitemap:
+                sitemap_state.mark_run(site, started)
+        sitemap_state.close()
+    return 0 if stats["failed"] < stats["urls"] or stats["urls"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import asyncio
+from collections import Counter
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """
+    Normalize a URL so equivalent spellings map to the same key:
+    lowercase scheme/host, default port dropped, query sorted, fragment removed.
+    """
+    parts = urlsplit(str(url).strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical async calls: the first caller for a key runs the
+    work, everyone arriving while it is in flight awaits the same result.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self._counts = Counter()
+
+    async def do(self, key, func):
+        """Run func() (a coroutine factory) once per key among concurrent callers"""
+        task = self._in_flight.get(key)
+        if task is None:
+            self._counts["executed"] += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self._counts["deduplicated"] += 1
+        # Shield so one waiter disconnecting doesn't cancel the work for the rest
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "executed": self._counts["executed"],
+            "deduplicated": self._counts["deduplicated"],
+            "in_flight": len(self._in_flight),
+        }
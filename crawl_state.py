@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CRAWL_DB = os.getenv("CRAWL_STATE_DB", ".cache/crawl_state.db")
+
+
+class CrawlState:
+    """
+    Checkpointed state for one crawl run: frontier, visited URLs and per-page results.
+    Each completed page is committed in a single transaction, so an interrupted
+    run resumes from its last checkpoint without refetching finished pages.
+    """
+
+    def __init__(self, start_url, options, path=CRAWL_DB):
+        self.start_url = start_url
+        self.run_id = hashlib.sha256(json.dumps([start_url, options], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                start_url TEXT NOT NULL,
+                options TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS frontier (
+                run_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                depth INTEGER NOT NULL DEFAULT 0,
+                added REAL NOT NULL,
+                PRIMARY KEY (run_id, url)
+            );
+            CREATE TABLE IF NOT EXISTS visited (
+                run_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                page_no INTEGER NOT NULL,
+                item_count INTEGER NOT NULL,
+                fetched REAL NOT NULL,
+                PRIMARY KEY (run_id, url)
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                run_id TEXT NOT NULL,
+                page_no INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                row TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_results_run ON results (run_id, page_no);
+        """)
+        now = time.time()
+        self._db.execute(
+            "INSERT OR IGNORE INTO runs VALUES (?, ?, ?, 'running', ?, ?)",
+            (self.run_id, start_url, json.dumps(options, sort_keys=True), now, now),
+        )
+        self._db.commit()
+
+    @property
+    def status(self):
+        with self._lock:
+            return self._db.execute("SELECT status FROM runs WHERE run_id = ?", (self.run_id,)).fetchone()[0]
+
+    def is_resumable(self):
+        """True if a previous, unfinished run already checkpointed pages"""
+        return self.status == "running" and self.pages_done() > 0
+
+    def pages_done(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM visited WHERE run_id = ?", (self.run_id,)).fetchone()[0]
+
+    def is_visited(self, url):
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM visited WHERE run_id = ? AND url = ?", (self.run_id, url)
+            ).fetchone() is not None
+
+    def add_to_frontier(self, urls, depth=0):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO frontier (run_id, url, depth, added) "
+                "SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM visited WHERE run_id = ? AND url = ?)",
+                [(self.run_id, url, depth, time.time(), self.run_id, url) for url in urls],
+            )
+            self._db.commit()
+
+    def next_url(self):
+        """Oldest URL waiting in the frontier, or None when it is empty"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url FROM frontier WHERE run_id = ? ORDER BY added LIMIT 1", (self.run_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def complete_page(self, url, rows, next_urls=(), depth=0):
+        """Checkpoint one finished page: its results, visited mark and newly found URLs"""
+        now = time.time()
+        with self._lock:
+            with self._db:
+                (page_no,) = self._db.execute(
+                    "SELECT COUNT(*) + 1 FROM visited WHERE run_id = ?", (self.run_id,)
+                ).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO visited VALUES (?, ?, ?, ?, ?)",
+                    (self.run_id, url, page_no, len(rows), now),
+                )
+                self._db.executemany(
+                    "INSERT INTO results VALUES (?, ?, ?, ?)",
+                    [(self.run_id, page_no, url, json.dumps(row, ensure_ascii=False)) for row in rows],
+                )
+                self._db.execute("DELETE FROM frontier WHERE run_id = ? AND url = ?", (self.run_id, url))
+                for next_url in next_urls:
+                    self._db.execute(
+                        "INSERT OR IGNORE INTO frontier (run_id, url, depth, added) "
+                        "SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM visited WHERE run_id = ? AND url = ?)",
+                        (self.run_id, next_url, depth + 1, now, self.run_id, next_url),
+                    )
+                self._db.execute("UPDATE runs SET updated = ? WHERE run_id = ?", (now, self.run_id))
+        return page_no
+
+    def results(self):
+        """All checkpointed result rows, in page order"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT row FROM results WHERE run_id = ? ORDER BY page_no, rowid", (self.run_id,)
+            ).fetchall()
+        return [json.loads(row) for (row,) in rows]
+
+    def finish(self):
+        with self._lock:
+            self._db.execute("UPDATE runs SET status = 'done', updated = ? WHERE run_id = ?", (time.time(), self.run_id))
+            self._db.commit()
+
+    def reset(self):
+        """Discard everything recorded for this run and start over"""
+        with self._lock:
+            with self._db:
+                for table in ("frontier", "visited", "results"):
+                    self._db.execute(f"DELETE FROM {table} WHERE run_id = ?", (self.run_id,))
+                self._db.execute("UPDATE runs SET status = 'running', updated = ? WHERE run_id = ?",
+                                 (time.time(), self.run_id))
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,293 @@
+"""
+Domain-scoped crawler built on py.py's fetch and extraction functions.
+
+    python crawler.py https://example.com --data-type "product prices" --max-pages 5000 -o prices.ndjson
+"""
+import argparse
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+
+from bs4 import BeautifulSoup
+
+import py
+from cli import OUTPUT_FIELDS, open_writer
+from coalesce import normalize_url
+from proxy_pool import ProxyPool
+
+# Crawl rows also record how many links deep their page was found
+CRAWL_FIELDS = OUTPUT_FIELDS + ["depth"]
+
+# Query parameters that only track the visitor and never change the page
+TRACKING_PARAMS = {"gclid", "dclid", "fbclid", "msclkid", "yclid", "igshid", "ref", "ref_src", "_ga", "_gl", "mkt_tok", "sessionid", "sid"}
+TRACKING_PREFIXES = ("utm_", "mc_", "pk_", "hsa_", "oly_")
+
+# Links to files that never contain extractable HTML
+SKIP_EXTENSIONS = re.compile(
+    r"\.(jpe?g|png|gif|webp|svg|ico|bmp|pdf|zip|gz|tar|rar|7z|exe|dmg|mp[34]|avi|mov|webm|ogg|wav|css|js|json|xml|woff2?|ttf|docx?|xlsx?|pptx?)$",
+    re.IGNORECASE,
+)
+
+
+def canonicalize_url(url, base=None):
+    """
+    Canonical form used for dedup: absolute, normalized host/port/query order,
+    fragment and tracking parameters dropped, trailing slash removed (except root).
+    Returns None for non-HTTP links.
+    """
+    if base is not None:
+        url = urljoin(base, url)
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ("http", "https"):
+        return None
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    path = re.sub(r"/{2,}", "/", parts.path)
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/")
+    return normalize_url(urlunsplit((parts.scheme, parts.netloc, path, urlencode(query), "")))
+
+
+class BloomFilter:
+    """Fixed-size set membership with a bounded false-positive rate; never grows"""
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Kirsch-Mitzenmacher double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def add(self, item):
+        """Add item; returns False if it was (probably) already present"""
+        new = False
+        for p in self._positions(item):
+            byte, mask = p >> 3, 1 << (p & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+
+class Frontier:
+    """Priority queue of URLs to visit, kept on disk so its size doesn't cost memory"""
+
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="frontier-", suffix=".db")
+            os.close(fd)
+            self._temp_path = path
+        else:
+            self._temp_path = None
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS frontier (seq INTEGER PRIMARY KEY, priority INTEGER, depth INTEGER, url TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_frontier_priority ON frontier (priority, seq)")
+        (self._size,) = self._db.execute("SELECT COUNT(*) FROM frontier").fetchone()
+
+    def __len__(self):
+        return self._size
+
+    def push_many(self, entries):
+        """entries: iterable of (url, depth, priority); lower priority pops first"""
+        entries = list(entries)
+        self._db.executemany("INSERT INTO frontier (priority, depth, url) VALUES (?, ?, ?)",
+                             [(priority, depth, url) for url, depth, priority in entries])
+        self._db.commit()
+        self._size += len(entries)
+
+    def pop(self):
+        row = self._db.execute("SELECT seq, url, depth FROM frontier ORDER BY priority, seq LIMIT 1").fetchone()
+        if row is None:
+            return None
+        self._db.execute("DELETE FROM frontier WHERE seq = ?", (row[0],))
+        self._size -= 1
+        return row[1], row[2]
+
+    def close(self):
+        self._db.close()
+        if self._temp_path:
+            os.remove(self._temp_path)
+
+
+class Crawler:
+    """
+    BFS crawl restricted to the start URLs' domains (plus any extra allowed ones)
+    and optional path rules, within depth and page budgets. Links matching
+    `prefer` jump ahead of others at the same depth.
+    """
+
+    def __init__(self, start_urls, keywords, allowed_domains=(), allow_paths=(), deny_paths=(),
+                 max_depth=3, max_pages=1000, concurrency=8, prefer=None, delay=0.0,
+                 seen_capacity=1_000_000, frontier_path=None):
+        self.keywords = keywords
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.delay = delay
+        self.allow_paths = [re.compile(p) for p in allow_paths]
+        self.deny_paths = [re.compile(p) for p in deny_paths]
+        self.prefer = re.compile(prefer) if prefer else None
+        self.seen = BloomFilter(capacity=seen_capacity)
+        self.frontier = Frontier(frontier_path)
+        self.stats = {"pages": 0, "failed": 0, "rows": 0, "links_seen": 0, "links_queued": 0}
+
+        start_urls = [u for u in (canonicalize_url(u) for u in start_urls) if u]
+        self.domains = {urlsplit(u).hostname for u in start_urls} | {d.lower() for d in allowed_domains}
+        self._enqueue([(u, 0) for u in start_urls], force=True)
+
+    def in_scope(self, url):
+        parts = urlsplit(url)
+        host = parts.hostname or ""
+        if not any(host == d or host.endswith("." + d) for d in self.domains):
+            return False
+        if SKIP_EXTENSIONS.search(parts.path):
+            return False
+        if self.deny_paths and any(p.search(parts.path) for p in self.deny_paths):
+            return False
+        if self.allow_paths and not any(p.search(parts.path) for p in self.allow_paths):
+            return False
+        return True
+
+    def _priority(self, url, depth):
+        # Depth-major ordering keeps the crawl breadth-first
+        return depth * 2 - (1 if self.prefer and self.prefer.search(url) else 0)
+
+    def _enqueue(self, links, force=False):
+        entries = []
+        for url, depth in links:
+            self.stats["links_seen"] += 1
+            if depth > self.max_depth or not (force or self.in_scope(url)):
+                continue
+            if self.seen.add(url):
+                entries.append((url, depth, self._priority(url, depth)))
+        self.frontier.push_many(entries)
+        self.stats["links_queued"] += len(entries)
+
+    def _fetch_page(self, url, depth):
+        """Worker: fetch one page and return its rows and outgoing links"""
+        response = py.fetch(url, py.get_request_config())
+        if response.status_code != 200:
+            raise RuntimeError(f"status {response.status_code}")
+        if "html" not in response.headers.get("Content-Type", "text/html"):
+            return [], []
+        soup = BeautifulSoup(response.content, "html.parser")
+        rows = [{"url": url, "page_url": url, "depth": depth, **item} for item in py.process_data_by_type(soup, self.keywords)]
+        links = []
+        if depth < self.max_depth:
+            for a in soup.find_all("a", href=True):
+                link = canonicalize_url(a["href"], base=response.url or url)
+                if link:
+                    links.append((link, depth + 1))
+        if self.delay:
+            time.sleep(self.delay)
+        return rows, links
+
+    def crawl(self, on_rows):
+        """Run the crawl, calling on_rows(rows) as each page finishes"""
+        start = time.monotonic()
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                while (len(in_flight) < self.concurrency and len(self.frontier)
+                       and self.stats["pages"] + self.stats["failed"] + len(in_flight) < self.max_pages):
+                    url, depth = self.frontier.pop()
+                    in_flight[executor.submit(self._fetch_page, url, depth)] = url
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = in_flight.pop(future)
+                    try:
+                        rows, links = future.result()
+                    except Exception as e:
+                        self.stats["failed"] += 1
+                        print(f"FAILED {url}: {e}", file=sys.stderr)
+                        continue
+                    self.stats["pages"] += 1
+                    self.stats["rows"] += len(rows)
+                    for row in rows:
+                        row["page"] = self.stats["pages"]
+                    on_rows(rows)
+                    self._enqueue(links)
+        self.stats["elapsed"] = time.monotonic() - start
+        self.stats["frontier_left"] = len(self.frontier)
+        return self.stats
+
+    def close(self):
+        self.frontier.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl a site and extract data from every page in scope.")
+    parser.add_argument("start_urls", nargs="+", help="Where to start; their domains bound the crawl")
+    parser.add_argument("-d", "--data-type", required=True, help="What data to extract, e.g. 'product prices'")
+    parser.add_argument("-o", "--output", default="-", help="Output file (.ndjson, .csv or .parquet), - for stdout")
+    parser.add_argument("-f", "--format", choices=["ndjson", "csv", "parquet"])
+    parser.add_argument("--max-pages", type=int, default=1000, help="Page budget (default: 1000)")
+    parser.add_argument("--max-depth", type=int, default=3, help="Link depth budget (default: 3)")
+    parser.add_argument("--allow-domain", action="append", default=[], help="Extra domain to stay within (repeatable)")
+    parser.add_argument("--allow-path", action="append", default=[], help="Only follow paths matching this regex (repeatable)")
+    parser.add_argument("--deny-path", action="append", default=[], help="Never follow paths matching this regex (repeatable)")
+    parser.add_argument("--prefer", help="Regex; matching URLs are crawled first within each depth")
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds each worker waits after a page")
+    parser.add_argument("--seen-capacity", type=int, default=1_000_000, help="URLs the dedup filter is sized for")
+    parser.add_argument("--proxy", action="append", default=[], help="Proxy URL (repeatable)")
+    args = parser.parse_args(argv)
+
+    if args.proxy:
+        py.use_proxy = True
+        py.proxy_pool = ProxyPool(args.proxy)
+
+    crawler = Crawler(
+        args.start_urls, args.data_type.lower().split(), allowed_domains=args.allow_domain,
+        allow_paths=args.allow_path, deny_paths=args.deny_path, max_depth=args.max_depth,
+        max_pages=args.max_pages, concurrency=max(args.concurrency, 1), prefer=args.prefer,
+        delay=args.delay, seen_capacity=args.seen_capacity,
+    )
+    writer = open_writer(args.output, args.format, CRAWL_FIELDS)
+    try:
+        stats = crawler.crawl(writer.write)
+    finally:
+        writer.close()
+        crawler.close()
+        if py.proxy_pool is not None:
+            py.proxy_pool.close()
+    elapsed = max(stats["elapsed"], 1e-9)
+    print(
+        f"\n✅ Crawled {stats['pages']} pages ({stats['failed']} failed), {stats['rows']} rows in {stats['elapsed']:.1f}s "
+        f"- {stats['pages'] / elapsed:.2f} pages/s\n"
+        f"   Links seen: {stats['links_seen']}, queued: {stats['links_queued']}, left in frontier: {stats['frontier_left']}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
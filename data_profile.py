@@ -0,0 +1,136 @@
+"""
+Compact statistical profile of a scraped DataFrame for LLM prompts: per-column
+counts, top values, text lengths and recognisable patterns, rendered to fit a
+token budget and cached by the frame's content fingerprint.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from extract import EMAIL_PATTERN, PHONE_PATTERN, PRICE_PATTERN
+from llm_gateway import estimate_tokens
+
+PROFILE_TOKEN_BUDGET = int(os.getenv("PROFILE_TOKEN_BUDGET", "800"))
+TOP_VALUES = 5
+PATTERN_SAMPLE = 5000  # Values per column checked against PATTERNS; counts and lengths use every value
+PATTERN_MIN_SHARE = 0.1  # Patterns matching fewer values than this aren't reported
+MAX_PROFILES = 32
+
+PATTERNS = {
+    "email": EMAIL_PATTERN,
+    "phone": PHONE_PATTERN,
+    "price": PRICE_PATTERN,
+    "url": re.compile(r"^(https?://|www\.|/)\S*$"),
+    "date": re.compile(r"\b(\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{2,4})\b"),
+    "number": re.compile(r"^[-+]?[\d,]*\.?\d+%?$"),
+}
+
+
+def frame_fingerprint(df):
+    """Content hash of a frame: columns, dtypes and every cell"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((list(map(str, df.columns)), list(map(str, df.dtypes)), df.shape)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def profile_column(series):
+    """Counts, top values, length distribution and pattern shares of one column"""
+    values = series.dropna()
+    profile = {"name": str(series.name), "dtype": str(series.dtype), "values": len(values),
+               "empty": len(series) - len(values)}
+    if not len(values):
+        return profile
+
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        numbers = values.to_numpy(dtype=float)
+        profile["distinct"] = int(values.nunique())
+        profile["range"] = {"min": float(numbers.min()), "median": float(np.median(numbers)),
+                            "mean": float(numbers.mean()), "max": float(numbers.max())}
+        return profile
+
+    text = values.astype(str)
+    counts = text.value_counts()
+    profile["distinct"] = len(counts)
+    profile["top"] = [(value, int(count)) for value, count in counts.head(TOP_VALUES).items()]
+    lengths = text.str.len().to_numpy()
+    profile["length"] = dict(zip(("min", "median", "p90", "max"),
+                                 (int(v) for v in np.percentile(lengths, [0, 50, 90, 100], method="nearest"))))
+    sample = text if len(text) <= PATTERN_SAMPLE else text.sample(PATTERN_SAMPLE, random_state=0)
+    shares = {name: float(sample.map(pattern.search).notna().mean()) for name, pattern in PATTERNS.items()}
+    profile["patterns"] = {name: share for name, share in shares.items() if share >= PATTERN_MIN_SHARE}
+    return profile
+
+
+def profile_frame(df):
+    return {"rows": len(df), "columns": [profile_column(df[column]) for column in df.columns]}
+
+
+def shorten(value, chars):
+    value = re.sub(r"\s+", " ", str(value)).strip()
+    return value if len(value) <= chars else value[:chars - 1] + "…"
+
+
+def render_column(column, top_values, value_chars):
+    parts = [f"{column['values']} values", f"{column['empty']} empty"]
+    if "distinct" in column:
+        parts.append(f"{column['distinct']} distinct")
+    if "range" in column:
+        parts.append("min/median/mean/max " + "/".join(f"{v:g}" for v in column["range"].values()))
+    if "length" in column:
+        parts.append("length min/median/p90/max " + "/".join(str(v) for v in column["length"].values()))
+    if column.get("patterns"):
+        parts.append("looks like " + ", ".join(f"{name} {share:.0%}" for name, share in column["patterns"].items()))
+    line = f"- {column['name']} ({column['dtype']}): " + "; ".join(parts)
+    if top_values and column.get("top"):
+        line += "; top: " + ", ".join(f'"{shorten(value, value_chars)}" x{count}'
+                                     for value, count in column["top"][:top_values])
+    return line
+
+
+def render_profile(profile, budget=PROFILE_TOKEN_BUDGET):
+    """
+    Profile as prompt text within budget tokens: fewer and shorter top values
+    first, then later columns are listed by name only.
+    """
+    header = f"Rows: {profile['rows']}, Columns: {len(profile['columns'])}"
+    for top_values, value_chars in ((TOP_VALUES, 80), (3, 50), (1, 30), (0, 0)):
+        text = "\n".join([header] + [render_column(c, top_values, value_chars) for c in profile["columns"]])
+        if estimate_tokens(text) <= budget:
+            return text
+
+    lines = [header]
+    for i, column in enumerate(profile["columns"]):
+        line = render_column(column, 0, 0)
+        rest = [c["name"] for c in profile["columns"][i + 1:]]
+        tail = f"- {len(rest)} more columns: {shorten(', '.join(rest), 200)}" if rest else ""
+        if estimate_tokens("\n".join(lines + [line, tail])) > budget:
+            rest = [c["name"] for c in profile["columns"][i:]]
+            lines.append(f"- {len(rest)} more columns: {shorten(', '.join(rest), 200)}")
+            break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+_profiles = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def describe_frame(df, budget=PROFILE_TOKEN_BUDGET):
+    """Rendered profile of df, reused while the frame's content is unchanged"""
+    key = (frame_fingerprint(df), budget)
+    with _profiles_lock:
+        if key in _profiles:
+            _profiles.move_to_end(key)
+            return _profiles[key]
+    text = render_profile(profile_frame(df), budget)
+    with _profiles_lock:
+        _profiles[key] = text
+        while len(_profiles) > MAX_PROFILES:
+            _profiles.popitem(last=False)
+    return text
@@ -0,0 +1,184 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DATASET_DB = os.getenv("DATASET_DB", ".cache/datasets.db")
+MAX_PAGE_SIZE = 1000
+GROUP_COLUMNS = {
+    "type": "r.type",
+    "tag": "r.tag",
+    "url": "e.url",
+    "day": "date(e.created, 'unixepoch')",
+    "origin": "e.origin",
+}
+
+
+class DatasetStore:
+    """
+    Every extraction (one scrape of one URL) with its rows, indexed by URL,
+    time, type and tag so past results can be queried without re-scraping.
+    """
+
+    def __init__(self, path=DATASET_DB):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                created REAL NOT NULL,
+                origin TEXT NOT NULL,
+                params TEXT NOT NULL,
+                row_count INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rows (
+                extraction_id INTEGER NOT NULL REFERENCES extractions (id) ON DELETE CASCADE,
+                row_no INTEGER NOT NULL,
+                type TEXT,
+                tag TEXT,
+                text TEXT,
+                data TEXT,
+                PRIMARY KEY (extraction_id, row_no)
+            );
+            CREATE INDEX IF NOT EXISTS idx_extractions_url ON extractions (url, created);
+            CREATE INDEX IF NOT EXISTS idx_extractions_created ON extractions (created);
+            CREATE INDEX IF NOT EXISTS idx_rows_type ON rows (type);
+            CREATE INDEX IF NOT EXISTS idx_rows_tag ON rows (tag);
+        """)
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.commit()
+
+    def save(self, url, rows, origin, params=None):
+        """Store one extraction's rows; returns its ID"""
+        with self._lock:
+            with self._db:
+                cursor = self._db.execute(
+                    "INSERT INTO extractions (url, created, origin, params, row_count) VALUES (?, ?, ?, ?, ?)",
+                    (str(url), time.time(), origin, json.dumps(params or {}, sort_keys=True), len(rows)),
+                )
+                extraction_id = cursor.lastrowid
+                self._db.executemany(
+                    "INSERT INTO rows VALUES (?, ?, ?, ?, ?, ?)",
+                    [(extraction_id, i, row.get("Type"), row.get("Tag"),
+                      None if row.get("Text") is None else str(row.get("Text")),
+                      json.dumps({k: v for k, v in row.items() if k not in ("Type", "Tag", "Text")},
+                                 ensure_ascii=False, default=str))
+                     for i, row in enumerate(rows)],
+                )
+        return extraction_id
+
+    @staticmethod
+    def _filters(url=None, url_prefix=None, since=None, until=None, origin=None,
+                 type=None, tag=None, text=None, extraction_id=None):
+        where, params = [], []
+        if extraction_id is not None:
+            where.append("e.id = ?")
+            params.append(extraction_id)
+        if url:
+            where.append("e.url = ?")
+            params.append(url)
+        if url_prefix:
+            where.append("e.url >= ? AND e.url < ?")
+            params += [url_prefix, url_prefix + "\U0010ffff"]
+        if since is not None:
+            where.append("e.created >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("e.created <= ?")
+            params.append(until)
+        if origin:
+            where.append("e.origin = ?")
+            params.append(origin)
+        if type:
+            where.append("r.type = ?")
+            params.append(type)
+        if tag:
+            where.append("r.tag = ?")
+            params.append(tag)
+        if text:
+            where.append("r.text LIKE ? ESCAPE '\\'")
+            params.append("%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        return (" WHERE " + " AND ".join(where)) if where else "", params
+
+    def _page(self, count_sql, select_sql, params, limit, offset):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self._lock:
+            (total,) = self._db.execute(count_sql, params).fetchone()
+            cursor = self._db.execute(select_sql + " LIMIT ? OFFSET ?", params + [limit, offset])
+            columns = [c[0] for c in cursor.description]
+            items = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        return {"total": total, "limit": limit, "offset": offset, "items": items}
+
+    def extractions(self, limit=50, offset=0, **filters):
+        """Past extractions, newest first"""
+        where, params = self._filters(**filters)
+        page = self._page(
+            f"SELECT COUNT(*) FROM extractions e{where}",
+            f"SELECT e.id, e.url, e.created, e.origin, e.params, e.row_count FROM extractions e{where} "
+            "ORDER BY e.created DESC, e.id DESC",
+            params, limit, offset,
+        )
+        for item in page["items"]:
+            item["params"] = json.loads(item["params"])
+        return page
+
+    def extraction(self, extraction_id):
+        page = self.extractions(limit=1, extraction_id=extraction_id)
+        return page["items"][0] if page["items"] else None
+
+    def rows(self, limit=100, offset=0, **filters):
+        """Stored rows across extractions, filtered on extraction and row fields"""
+        where, params = self._filters(**filters)
+        join = "FROM rows r JOIN extractions e ON e.id = r.extraction_id"
+        page = self._page(
+            f"SELECT COUNT(*) {join}{where}",
+            f"SELECT e.id AS extraction_id, e.url, e.created, r.row_no, r.type, r.tag, r.text, r.data {join}{where} "
+            "ORDER BY e.created DESC, e.id DESC, r.row_no",
+            params, limit, offset,
+        )
+        for item in page["items"]:
+            item.update(json.loads(item.pop("data") or "{}"))
+        return page
+
+    def aggregate(self, group_by="type", limit=100, offset=0, **filters):
+        """Row counts per type, tag, url, day or origin, with distinct texts and extractions"""
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"group_by must be one of: {', '.join(GROUP_COLUMNS)}")
+        column = GROUP_COLUMNS[group_by]
+        where, params = self._filters(**filters)
+        join = "FROM rows r JOIN extractions e ON e.id = r.extraction_id"
+        return self._page(
+            f"SELECT COUNT(*) FROM (SELECT 1 {join}{where} GROUP BY {column})",
+            f"SELECT {column} AS \"key\", COUNT(*) AS rows, COUNT(DISTINCT r.text) AS distinct_texts, "
+            f"COUNT(DISTINCT e.id) AS extractions, MIN(e.created) AS first_seen, MAX(e.created) AS last_seen "
+            f"{join}{where} GROUP BY {column} ORDER BY rows DESC",
+            params, limit, offset,
+        )
+
+    def delete(self, extraction_id):
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM rows WHERE extraction_id = ?", (extraction_id,))
+                cursor = self._db.execute("DELETE FROM extractions WHERE id = ?", (extraction_id,))
+        return cursor.rowcount > 0
+
+    def close(self):
+        self._db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_dataset_store():
+    """Process-wide dataset store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DatasetStore()
+        return _store
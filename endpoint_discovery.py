@@ -0,0 +1,152 @@
+import json
+import re
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+JSON_SCRIPT_TYPES = {"application/json", "application/ld+json"}
+MAX_ENDPOINTS = 20
+MAX_FLATTEN_DEPTH = 6
+
+# window.__INITIAL_STATE__ = {...} and similar embedded state assignments
+STATE_ASSIGNMENT = re.compile(r"(?:window|self|globalThis)\.(__[A-Za-z0-9_]+__|[A-Za-z_$][\w$]*State)\s*=\s*(?=[\[{])")
+
+# Quoted URLs passed to fetch/axios/XHR, or that look like data endpoints
+FETCH_CALL = re.compile(r"""(?:fetch|axios(?:\.get)?|\$\.getJSON|\.open\(\s*["']GET["']\s*,)\s*\(?\s*["'`]([^"'`\s]+)["'`]""")
+ENDPOINT_LITERAL = re.compile(r"""["'`]((?:https?://[^"'`\s]+|/[^"'`\s]*)(?:/api/|/graphql|\.json\b)[^"'`\s]*)["'`]""")
+
+
+def _script_soup(html):
+    if isinstance(html, BeautifulSoup):
+        return html
+    # Only the script tags matter here, so skip building the rest of the tree
+    return BeautifulSoup(html, "html.parser", parse_only=SoupStrainer("script"))
+
+
+def discover_sources(html, base_url):
+    """
+    Find JSON data a page carries or loads: JSON script blobs (__NEXT_DATA__,
+    ld+json), embedded state assignments and endpoints referenced by inline scripts.
+    Returns a list of dicts with name, kind and either data or url.
+    """
+    soup = _script_soup(html)
+    sources = []
+    endpoints = []
+    decoder = json.JSONDecoder()
+
+    for i, script in enumerate(soup.find_all("script")):
+        text = script.string or ""
+        script_type = (script.get("type") or "").lower()
+        if not text.strip():
+            continue
+
+        if script_type in JSON_SCRIPT_TYPES:
+            try:
+                data = json.loads(text)
+            except ValueError:
+                continue
+            name = f"#{script['id']}" if script.get("id") else f"{script_type}[{i}]"
+            sources.append({"name": name, "kind": "embedded", "data": data})
+            continue
+
+        for match in STATE_ASSIGNMENT.finditer(text):
+            try:
+                data, _ = decoder.raw_decode(text, match.end())
+            except ValueError:
+                continue
+            sources.append({"name": f"window.{match.group(1)}", "kind": "embedded", "data": data})
+
+        for match in list(FETCH_CALL.finditer(text)) + list(ENDPOINT_LITERAL.finditer(text)):
+            endpoint = urljoin(base_url, match.group(1))
+            if urlparse(endpoint).scheme in ("http", "https") and endpoint not in endpoints:
+                endpoints.append(endpoint)
+
+    for endpoint in endpoints[:MAX_ENDPOINTS]:
+        sources.append({"name": endpoint, "kind": "endpoint", "url": endpoint})
+    return sources
+
+
+def _flatten(value, prefix, row, depth):
+    if isinstance(value, dict) and depth < MAX_FLATTEN_DEPTH:
+        for key, item in value.items():
+            _flatten(item, f"{prefix}.{key}" if prefix else str(key), row, depth + 1)
+    elif isinstance(value, list) and all(not isinstance(v, (dict, list)) for v in value):
+        row[prefix or "value"] = ", ".join(str(v) for v in value)
+    elif isinstance(value, (dict, list)):
+        row[prefix or "value"] = json.dumps(value, ensure_ascii=False)[:1000]
+    else:
+        row[prefix or "value"] = value
+
+
+def _record_lists(value, depth=0):
+    """Yield every list of objects in a JSON document"""
+    if depth > MAX_FLATTEN_DEPTH * 2:
+        return
+    if isinstance(value, list):
+        if value and all(isinstance(v, dict) for v in value):
+            yield value
+        for item in value:
+            yield from _record_lists(item, depth + 1)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _record_lists(item, depth + 1)
+
+
+def flatten_records(data):
+    """
+    Turn a JSON payload into flat rows: the largest list of objects becomes one
+    row per object with dotted column names; otherwise the whole payload is one row.
+    """
+    best = max(_record_lists(data), key=len, default=None)
+    records = best if best is not None else [data]
+    rows = []
+    for record in records:
+        row = {}
+        _flatten(record, "", row, 0)
+        rows.append(row)
+    return rows
+
+
+def describe_sources(sources):
+    """Summaries of discovered sources for API responses"""
+    summaries = []
+    for source in sources:
+        records = len(flatten_records(source["data"])) if source["kind"] == "embedded" else None
+        summaries.append({"name": source["name"], "kind": source["kind"], "records": records})
+    return summaries
+
+
+def load_source_rows(url, source, fetch):
+    """
+    Fetch the named data source for a page and return its flattened rows.
+    fetch(url, accept_json) must return a requests-style response.
+    Endpoint URLs are fetched directly, without touching the page HTML at all;
+    "auto" picks the richest source the page has.
+    """
+    if source.startswith(("http://", "https://")):
+        response = fetch(source, True)
+        response.raise_for_status()
+        return flatten_records(response.json())
+
+    response = fetch(url, False)
+    response.raise_for_status()
+    candidates = discover_sources(response.text, url)
+
+    if source == "auto":
+        # Largest embedded payload first, then endpoints until one yields JSON
+        embedded = [flatten_records(c["data"]) for c in candidates if c["kind"] == "embedded"]
+        if embedded:
+            return max(embedded, key=len)
+        for candidate in candidates:
+            try:
+                return load_source_rows(url, candidate["url"], fetch)
+            except Exception:
+                continue
+        raise LookupError(f"No JSON data sources found on {url}")
+
+    for candidate in candidates:
+        if candidate["name"] == source:
+            if candidate["kind"] == "endpoint":
+                return load_source_rows(url, candidate["url"], fetch)
+            return flatten_records(candidate["data"])
+    raise LookupError(f"Data source {source!r} not found on {url}")
@@ -0,0 +1,136 @@
+"""
+Extraction rules shared by the Streamlit app (main.py), the API (api.py) and
+offline replay over archived pages. Everything here works on a parsed page only.
+"""
+import re
+
+# Data categories offered in the Streamlit app
+DATA_CATEGORIES = [
+    "Page Titles and Headers",
+    "Product Information",
+    "Prices and Costs",
+    "Contact Information",
+    "Links and Navigation",
+    "Article Content",
+    "Custom Query"
+]
+
+PRICE_PATTERN = re.compile(r'(\$|€|£|\¥|USD|EUR)\s?[\d,.]+|\d+(\.\d{2})?(?=\s*(?:\$|€|£|\¥|USD|EUR))')
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+PHONE_PATTERN = re.compile(r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}')
+
+
+# Function to list the unique tags on a page
+def page_tags(soup):
+    return sorted(set([tag.name for tag in soup.find_all() if tag.name is not None]))
+
+
+# Function to extract one of the DATA_CATEGORIES from a page
+def extract_category(soup, category, custom_query="", tags=None):
+    """
+    Returns a list of {"Type", "Text"} rows ("URL" too for links).
+    tags is the page's tag list if the caller already has it.
+    """
+    tags = set(tags) if tags is not None else set(page_tags(soup))
+    results = []
+
+    # Map user-friendly categories to appropriate tags and extraction logic
+    if category == "Page Titles and Headers":
+        header_tags = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'title']
+        for tag in header_tags:
+            if tag in tags:
+                for el in soup.find_all(tag):
+                    text = el.get_text(strip=True)
+                    if text:
+                        results.append({"Type": f"Header ({tag})", "Text": text})
+
+    elif category == "Product Information":
+        # Look for product-related elements
+        product_classes = ["product", "item", "goods"]
+        # Try various product patterns
+        for el in soup.find_all(class_=lambda c: c and any(p in str(c).lower() for p in product_classes)):
+            name = el.get_text(strip=True)
+            if name:
+                results.append({"Type": "Product", "Text": name})
+
+        # Also check common product containers
+        for tag in ['div', 'li', 'article']:
+            if tag in tags:
+                for el in soup.find_all(tag):
+                    if el.find('img') and (el.find('h3') or el.find('h2')):
+                        text = el.get_text(strip=True)
+                        results.append({"Type": "Product Item", "Text": text[:200]})
+
+    elif category == "Prices and Costs":
+        # Price extraction with regex patterns
+        for tag in ['span', 'div', 'p', 'strong']:
+            if tag in tags:
+                for el in soup.find_all(tag):
+                    text = el.get_text(strip=True)
+                    if PRICE_PATTERN.search(text):
+                        results.append({"Type": "Price", "Text": text})
+
+    elif category == "Contact Information":
+        # Check contact info in various tags
+        for tag in ['p', 'div', 'span', 'a', 'address']:
+            if tag in tags:
+                for el in soup.find_all(tag):
+                    text = el.get_text(strip=True)
+                    if "contact" in text.lower() or EMAIL_PATTERN.search(text) or PHONE_PATTERN.search(text):
+                        results.append({"Type": "Contact", "Text": text})
+
+    elif category == "Links and Navigation":
+        # Get links
+        if 'a' in tags:
+            for el in soup.find_all('a'):
+                text = el.get_text(strip=True)
+                href = el.get('href', '')
+                if text and href:
+                    results.append({"Type": "Link", "Text": text, "URL": href})
+
+    elif category == "Article Content":
+        # Article content typically in p tags, sometimes with article container
+        article_container = soup.find('article')
+
+        if article_container:
+            for p in article_container.find_all('p'):
+                text = p.get_text(strip=True)
+                if text and len(text) > 15:  # Avoid very short paragraphs
+                    results.append({"Type": "Article Paragraph", "Text": text})
+        else:
+            # No article container, look for content in p tags
+            for p in soup.find_all('p'):
+                text = p.get_text(strip=True)
+                if text and len(text) > 30:  # Longer threshold for general p tags
+                    results.append({"Type": "Paragraph", "Text": text})
+
+    elif category == "Custom Query":
+        # Handle custom query with intelligent extraction
+        query_terms = (custom_query or "").lower().split()
+
+        for tag in sorted(tags):
+            for el in soup.find_all(tag):
+                text = el.get_text(strip=True)
+                if text and any(term in text.lower() for term in query_terms):
+                    results.append({"Type": f"Custom Match ({tag})", "Text": text})
+
+    else:
+        raise ValueError(f"Unknown data category: {category}")
+
+    return results
+
+
+# Function to pull the text of the requested tags out of a parsed page (all tags if none given)
+def extract_tags(soup, tags=None):
+    results = []
+
+    # If no specific tags are provided, get all tags
+    tags_to_scrape = tags if tags else [tag.name for tag in soup.find_all() if tag.name is not None]
+
+    for tag in tags_to_scrape:
+        for el in soup.find_all(tag):
+            text = el.get_text(strip=True)
+            if text:
+                results.append({"Tag": tag, "Text": text})
+
+    return results
@@ -0,0 +1,229 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+JOBS_DIR = os.getenv("JOBS_DIR", ".cache/jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_TTL = int(os.getenv("JOB_TTL", str(3600)))  # Queued jobs not started within this many seconds expire
+RESULT_RETENTION = int(os.getenv("JOB_RESULT_RETENTION", str(24 * 3600)))  # Seconds results stay downloadable
+JOB_LEASE = float(os.getenv("JOB_LEASE", "60"))  # Seconds without a heartbeat before a running job counts as abandoned
+POLL_INTERVAL = 0.5
+CLEANUP_INTERVAL = 60
+
+
+class JobQueue:
+    """
+    Persistent SQLite-backed job queue with a pool of worker threads.
+    Handlers are registered per job kind and called as handler(payload, progress);
+    they return (data_bytes, media_type, filename) which is stored for download.
+    Several processes may share the database: running jobs carry their queue's
+    owner ID and a heartbeat, and only jobs whose lease lapsed are requeued.
+    """
+
+    def __init__(self, directory=JOBS_DIR, workers=JOB_WORKERS, job_ttl=JOB_TTL,
+                 result_retention=RESULT_RETENTION, lease=JOB_LEASE):
+        self.directory = directory
+        self.workers = workers
+        self.job_ttl = job_ttl
+        self.result_retention = result_retention
+        self.lease = lease
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers = {}
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "jobs.db"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                message TEXT,
+                error TEXT,
+                result_path TEXT,
+                media_type TEXT,
+                filename TEXT,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL
+            )
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat", "REAL")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created)")
+        self._db.commit()
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            self._db.commit()
+            return cursor
+
+    def submit(self, kind, payload):
+        """Queue a job and return its ID"""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, kind, payload, status, created) VALUES (?, ?, ?, 'queued', ?)",
+            (job_id, kind, json.dumps(payload), time.time()),
+        )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """Job status as a dict, or None if unknown"""
+        with self._lock:
+            self._db.row_factory = sqlite3.Row
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            self._db.row_factory = None
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        if job["status"] == "queued":
+            with self._lock:
+                (ahead,) = self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?", (job["created"],)
+                ).fetchone()
+            job["queue_position"] = ahead + 1
+        return job
+
+    def _claim(self):
+        """Atomically move the oldest queued job this queue can handle to running"""
+        kinds = list(self._handlers)
+        if not kinds:
+            return None
+        placeholders = ",".join("?" for _ in kinds)
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT id, kind, payload FROM jobs WHERE status = 'queued' AND kind IN ({placeholders}) "
+                "ORDER BY created LIMIT 1", kinds
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'running', started = ?, owner = ?, heartbeat = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (now, self.owner, now, row[0]),
+            )
+            self._db.commit()
+            # Another process sharing the database may have claimed it first
+            return row if cursor.rowcount == 1 else None
+
+    def _progress_callback(self, job_id):
+        def progress(fraction, message=None):
+            self._execute("UPDATE jobs SET progress = ?, message = ?, heartbeat = ? WHERE id = ? AND owner = ?",
+                          (max(0.0, min(fraction, 1.0)), message, time.time(), job_id, self.owner))
+        return progress
+
+    def _run(self, job_id, kind, payload):
+        try:
+            data, media_type, filename = self._handlers[kind](json.loads(payload), self._progress_callback(job_id))
+            result_path = os.path.join(self.directory, f"{job_id}.result")
+            with open(result_path, "wb") as f:
+                f.write(data)
+            self._execute(
+                "UPDATE jobs SET status = 'done', progress = 1, result_path = ?, media_type = ?, "
+                "filename = ?, finished = ? WHERE id = ? AND owner = ?",
+                (result_path, media_type, filename, time.time(), job_id, self.owner),
+            )
+        except Exception as e:
+            detail = getattr(e, "detail", None)
+            if detail is None:
+                # Unexpected error rather than an HTTP-style "no data" failure
+                detail = str(e)
+                traceback.print_exc()
+            print(f"Job {job_id} failed: {detail}")
+            self._execute("UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ? AND owner = ?",
+                          (str(detail), time.time(), job_id, self.owner))
+
+    def _worker(self):
+        while not self._stop.is_set():
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._run(*job)
+
+    def requeue_abandoned(self):
+        """Requeue running jobs of our kinds whose owner stopped heartbeating (crashed or shut down)"""
+        kinds = list(self._handlers)
+        if not kinds:
+            return 0
+        placeholders = ",".join("?" for _ in kinds)
+        cursor = self._execute(
+            f"UPDATE jobs SET status = 'queued', progress = 0, owner = NULL, heartbeat = NULL "
+            f"WHERE status = 'running' AND kind IN ({placeholders}) AND (heartbeat IS NULL OR heartbeat < ?)",
+            (*kinds, time.time() - self.lease),
+        )
+        if cursor.rowcount:
+            self._wakeup.set()
+        return cursor.rowcount
+
+    def _heartbeat(self):
+        """Renew the lease on every job this queue is running"""
+        while not self._stop.wait(self.lease / 4):
+            self._execute("UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND owner = ?",
+                          (time.time(), self.owner))
+
+    def cleanup(self):
+        """Requeue abandoned jobs, expire stale queued jobs and delete results past their retention"""
+        self.requeue_abandoned()
+        now = time.time()
+        self._execute("UPDATE jobs SET status = 'expired', finished = ? WHERE status = 'queued' AND created < ?",
+                      (now, now - self.job_ttl))
+        with self._lock:
+            old = self._db.execute(
+                "SELECT id, result_path FROM jobs WHERE status IN ('done', 'failed', 'expired') AND finished < ?",
+                (now - self.result_retention,),
+            ).fetchall()
+        for job_id, result_path in old:
+            if result_path:
+                try:
+                    os.remove(result_path)
+                except OSError:
+                    pass
+            self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def _janitor(self):
+        while not self._stop.wait(CLEANUP_INTERVAL):
+            self.cleanup()
+
+    def start(self):
+        """Start the workers; jobs abandoned by a stopped process are requeued once their lease lapses"""
+        if self._threads:
+            return
+        self._stop.clear()
+        self.cleanup()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        for name, target in (("job-heartbeat", self._heartbeat), ("job-janitor", self._janitor)):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
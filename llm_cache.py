@@ -0,0 +1,408 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from bs4 import BeautifulSoup
+
+from coalesce import normalize_url
+from resilience import resilient_get
+
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", ".cache/llm_cache.db")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))  # Seconds an answer is reused for an unchanged page
+MEMORY_ENTRIES = 512  # Answers kept in process memory in front of the disk tier
+MAX_ENTRIES = 50000  # Disk tier size; least recently used answers are dropped past this
+EVICT_TO = 0.95  # Eviction trims the disk tier to this share of MAX_ENTRIES, so it runs once per many stores
+RECOUNT_EVERY = 1000  # Stores between recounts of the disk tier (other processes may share the DB)
+FINGERPRINT_TTL = 60  # Seconds a page fingerprint is reused before the page is fetched again
+FINGERPRINT_TIMEOUT = 5
+
+# Near-duplicate questions: MinHash over word shingles, LSH bands to find candidates,
+# exact Jaccard on the shingles to decide. 1.0 turns matching off.
+SIMILARITY_THRESHOLD = float(os.getenv("LLM_SIMILARITY_THRESHOLD", "0.8"))
+NUM_PERM = 64
+AUDIT_ROWS = 10000  # Near-duplicate hits kept in the audit log
+BAND_ROWS = 4  # 16 bands of 4 rows: pairs at Jaccard 0.5 share a band about 65% of the time, at 0.8 almost always
+
+SPACE = re.compile(r"\s+")
+WORD = re.compile(r"\w+", re.UNICODE)
+# Filler that doesn't change what is being asked about a page; who/when/where/why/how and negations are kept
+QUESTION_STOPWORDS = frozenset("""
+    a an the is are was were be been do does did what which can could would should will shall may might
+    please tell me us show list give find get provide summarize summarise describe explain extract
+    on in at of for to from into about with by and or this that these those here there it its
+    page pages website site url web link i you my your all any some there's what's
+""".split())
+_rng = random.Random(20240601)
+PERMUTATIONS = [(_rng.getrandbits(64) | 1, _rng.getrandbits(64)) for _ in range(NUM_PERM)]
+MASK64 = (1 << 64) - 1
+
+
+def normalize_question(question):
+    """Case, whitespace and trailing punctuation don't change what is being asked"""
+    return SPACE.sub(" ", question.casefold()).strip().rstrip("?!. ")
+
+
+def stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def question_shingles(question):
+    """Content words of a question (lightly stemmed) plus adjacent pairs, so word order still counts a little"""
+    words = [stem(w) for w in WORD.findall(question.casefold()) if w not in QUESTION_STOPWORDS]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def minhash(shingles):
+    """NUM_PERM-value MinHash signature, using multiply-shift hashes of each shingle's 64-bit digest"""
+    values = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+    return [min(((a * v + b) & MASK64) >> 32 for v in values) for a, b in PERMUTATIONS]
+
+
+def lsh_buckets(signature, scope):
+    """One bucket per band; questions sharing any bucket within a scope are candidates"""
+    buckets = []
+    for start in range(0, NUM_PERM, BAND_ROWS):
+        band = ",".join(map(str, signature[start:start + BAND_ROWS]))
+        buckets.append(hashlib.blake2b(f"{scope}:{start}:{band}".encode("utf-8"), digest_size=12).hexdigest())
+    return buckets
+
+
+def chat_url(url):
+    """Normalized form of a URL typed into a chat box (scheme optional)"""
+    url = url.strip()
+    if not url:
+        return ""
+    if "://" not in url:
+        url = f"https://{url}"
+    return normalize_url(url)
+
+
+def text_fingerprint(html):
+    """Hash of a page's visible text, so rotating tokens and script noise don't count as changes"""
+    soup = BeautifulSoup(html, "html.parser")
+    for el in soup(["script", "style", "noscript", "template"]):
+        el.decompose()
+    text = SPACE.sub(" ", soup.get_text(" ")).strip()
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Gemini answers keyed by normalized question, URL and prompt variant, stored
+    with a fingerprint of the page they were generated from. A small in-memory
+    LRU sits in front of a SQLite tier; an answer is served only while it is
+    within the TTL and the page still has the same fingerprint. Questions are
+    also MinHash/LSH-indexed so rephrasings of a cached question can hit.
+    """
+
+    def __init__(self, path=LLM_CACHE_DB, ttl=LLM_CACHE_TTL, memory_entries=MEMORY_ENTRIES,
+                 max_entries=MAX_ENTRIES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._fingerprints = {}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                question TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                response TEXT NOT NULL,
+                latency REAL NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_answers_url ON answers (url);
+            CREATE INDEX IF NOT EXISTS idx_answers_accessed ON answers (accessed);
+            CREATE TABLE IF NOT EXISTS question_shingles (
+                key TEXT PRIMARY KEY,
+                shingles TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS question_bands (
+                bucket TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (bucket, key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_question_bands_key ON question_bands (key);
+            CREATE TABLE IF NOT EXISTS similar_hits (
+                id INTEGER PRIMARY KEY,
+                created REAL NOT NULL,
+                url TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                question TEXT NOT NULL,
+                matched TEXT NOT NULL,
+                similarity REAL NOT NULL
+            );
+        """)
+        self._db.commit()
+        # Disk tier size, tracked as answers come and go instead of counted on every store
+        (self._entries,) = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()
+        self._stores_since_count = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "similar_hits": 0, "misses": 0, "expired": 0, "invalidated": 0,
+                      "bypassed": 0, "stores": 0, "evictions": 0, "seconds_saved": 0.0}
+
+    @staticmethod
+    def key(question, url, variant=""):
+        raw = json.dumps([normalize_question(question), chat_url(url), variant])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def page_fingerprint(self, url):
+        """
+        Fingerprint of the page as it is now ("" for questions without a URL, None
+        if it can't be fetched). Reused for FINGERPRINT_TTL so bursts fetch once.
+        """
+        url = chat_url(url)
+        if not url:
+            return ""
+        now = time.time()
+        with self._lock:
+            cached = self._fingerprints.get(url)
+        if cached is not None and now - cached[1] < FINGERPRINT_TTL:
+            return cached[0]
+        try:
+            response = resilient_get(url, attempts=1, hedge_after=None, timeout=FINGERPRINT_TIMEOUT,
+                                     headers={"User-Agent": "Mozilla/5.0"})
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Could not fingerprint {url}: {str(e)}")
+            return None
+        fingerprint = text_fingerprint(response.text)
+        with self._lock:
+            if len(self._fingerprints) >= self.memory_entries:
+                self._fingerprints.clear()
+            self._fingerprints[url] = (fingerprint, now)
+        return fingerprint
+
+    def get(self, question, url, fingerprint, variant="", threshold=None):
+        """
+        Cached answer dict ("response", "created", "latency") or None. Without an
+        exact match, an answer to a near-duplicate question about the same page is
+        used if its shingle similarity reaches threshold (SIMILARITY_THRESHOLD by
+        default); those hits carry "matched_question" and "similarity" and are logged.
+        """
+        if fingerprint is None:
+            self.stats["bypassed"] += 1
+            return None
+        key = self.key(question, url, variant)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            tier = "memory_hits"
+            if entry is not None:
+                self._memory.move_to_end(key)
+            else:
+                row = self._db.execute(
+                    "SELECT fingerprint, response, latency, created FROM answers WHERE key = ?", (key,)
+                ).fetchone()
+                entry = dict(zip(("fingerprint", "response", "latency", "created"), row)) if row else None
+                tier = "disk_hits"
+
+        if entry is not None and (now - entry["created"] >= self.ttl or entry["fingerprint"] != fingerprint):
+            # Expired, or the page changed since the answer was generated
+            self.stats["expired" if now - entry["created"] >= self.ttl else "invalidated"] += 1
+            self._delete(key)
+            entry = None
+        if entry is None:
+            match = self._similar(question, url, fingerprint, variant, threshold, now)
+            if match is None:
+                self.stats["misses"] += 1
+                return None
+            key, entry, extra = match
+            tier = "similar_hits"
+        else:
+            extra = {}
+
+        self.stats[tier] += 1
+        self.stats["seconds_saved"] += entry["latency"]
+        with self._lock:
+            self._remember(key, entry)
+            self._db.execute("UPDATE answers SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return {"response": entry["response"], "created": entry["created"], "latency": entry["latency"], **extra}
+
+    @staticmethod
+    def _scope(url, variant):
+        return hashlib.sha256(json.dumps([chat_url(url), variant]).encode("utf-8")).hexdigest()
+
+    def _similar(self, question, url, fingerprint, variant, threshold, now):
+        """Best fresh answer for the same page whose question is similar enough, as (key, entry, extra)"""
+        threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+        shingles = question_shingles(question)
+        if threshold >= 1 or not shingles:
+            return None
+        buckets = lsh_buckets(minhash(shingles), self._scope(url, variant))
+        with self._lock:
+            candidates = self._db.execute(
+                "SELECT a.key, a.question, s.shingles, a.fingerprint, a.response, a.latency, a.created "
+                "FROM answers a JOIN question_shingles s ON s.key = a.key "
+                f"WHERE a.key IN (SELECT key FROM question_bands WHERE bucket IN ({','.join('?' for _ in buckets)}))",
+                buckets,
+            ).fetchall()
+
+        best = None
+        for key, matched, stored, stored_fingerprint, response, latency, created in candidates:
+            if stored_fingerprint != fingerprint or now - created >= self.ttl:
+                continue
+            similarity = jaccard(shingles, set(json.loads(stored)))
+            if similarity >= threshold and (best is None or similarity > best[0]):
+                best = (similarity, key, matched,
+                        {"fingerprint": stored_fingerprint, "response": response, "latency": latency, "created": created})
+        if best is None:
+            return None
+
+        similarity, key, matched, entry = best
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO similar_hits (created, url, variant, question, matched, similarity) VALUES (?, ?, ?, ?, ?, ?)",
+                (now, chat_url(url), variant, normalize_question(question), matched, similarity),
+            )
+            self._db.execute("DELETE FROM similar_hits WHERE id <= (SELECT MAX(id) FROM similar_hits) - ?", (AUDIT_ROWS,))
+        return key, entry, {"matched_question": matched, "similarity": round(similarity, 4)}
+
+    def put(self, question, url, fingerprint, response, latency, variant=""):
+        """Store a fresh answer; latency is what the Gemini call took, counted as saved on each hit"""
+        if fingerprint is None or not response:
+            return
+        key = self.key(question, url, variant)
+        now = time.time()
+        entry = {"fingerprint": fingerprint, "response": response, "latency": latency, "created": now}
+        shingles = question_shingles(question)
+        with self._lock:
+            self._remember(key, entry)
+            self._forget_questions([key])
+            if self._db.execute("SELECT 1 FROM answers WHERE key = ?", (key,)).fetchone() is None:
+                self._entries += 1
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, chat_url(url), normalize_question(question), fingerprint, response, latency, now, now),
+            )
+            if shingles:
+                self._db.execute("INSERT INTO question_shingles VALUES (?, ?)", (key, json.dumps(sorted(shingles))))
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO question_bands VALUES (?, ?)",
+                    [(bucket, key) for bucket in lsh_buckets(minhash(shingles), self._scope(url, variant))],
+                )
+            self._db.commit()
+        self.stats["stores"] += 1
+        self._evict()
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _forget_questions(self, keys):
+        """Drop the similarity index entries of answers (caller holds the lock)"""
+        self._db.executemany("DELETE FROM question_shingles WHERE key = ?", [(k,) for k in keys])
+        self._db.executemany("DELETE FROM question_bands WHERE key = ?", [(k,) for k in keys])
+
+    def _delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+            self._entries -= self._db.execute("DELETE FROM answers WHERE key = ?", (key,)).rowcount
+            self._forget_questions([key])
+            self._db.commit()
+
+    def _evict(self):
+        """Once the disk tier passes max_entries, drop least recently used answers down to EVICT_TO of it"""
+        with self._lock:
+            self._stores_since_count += 1
+            if self._stores_since_count >= RECOUNT_EVERY:
+                (self._entries,) = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()
+                self._stores_since_count = 0
+            if self._entries <= self.max_entries:
+                return
+            victims = [k for (k,) in self._db.execute(
+                "SELECT key FROM answers ORDER BY accessed LIMIT ?", (self._entries - int(self.max_entries * EVICT_TO),))]
+            self._db.executemany("DELETE FROM answers WHERE key = ?", [(k,) for k in victims])
+            self._forget_questions(victims)
+            self._db.commit()
+            self._entries -= len(victims)
+            for key in victims:
+                self._memory.pop(key, None)
+        self.stats["evictions"] += len(victims)
+
+    def invalidate(self, url=None):
+        """Drop cached answers for one URL (all answers if no URL); returns how many"""
+        with self._lock:
+            if url is None:
+                cursor = self._db.execute("DELETE FROM answers")
+                self._db.execute("DELETE FROM question_shingles")
+                self._db.execute("DELETE FROM question_bands")
+                self._memory.clear()
+                self._fingerprints.clear()
+            else:
+                url = chat_url(url)
+                keys = [k for (k,) in self._db.execute("SELECT key FROM answers WHERE url = ?", (url,))]
+                cursor = self._db.execute("DELETE FROM answers WHERE url = ?", (url,))
+                self._forget_questions(keys)
+                for key in keys:
+                    self._memory.pop(key, None)
+                self._fingerprints.pop(url, None)
+            self._db.commit()
+            self._entries = max(self._entries - cursor.rowcount, 0)
+        self.stats["invalidated"] += cursor.rowcount
+        return cursor.rowcount
+
+    def similar_hits(self, limit=50, offset=0, url=None):
+        """Audit log of answers served for a near-duplicate question, newest first"""
+        where, params = (" WHERE url = ?", [chat_url(url)]) if url else ("", [])
+        limit = max(1, min(limit, 1000))
+        with self._lock:
+            (total,) = self._db.execute(f"SELECT COUNT(*) FROM similar_hits{where}", params).fetchone()
+            cursor = self._db.execute(
+                f"SELECT created, url, variant, question, matched, similarity FROM similar_hits{where} "
+                "ORDER BY id DESC LIMIT ? OFFSET ?", params + [limit, offset],
+            )
+            columns = [c[0] for c in cursor.description]
+            items = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        return {"total": total, "limit": limit, "offset": offset, "items": items}
+
+    def metrics(self):
+        """Counters plus hit rate and current tier sizes"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["similar_hits"]
+        lookups = hits + self.stats["misses"]
+        with self._lock:
+            entries = self._entries
+            memory = len(self._memory)
+        return {**self.stats, "seconds_saved": round(self.stats["seconds_saved"], 2),
+                "hit_rate": round(hits / lookups, 4) if lookups else None,
+                "similarity_threshold": SIMILARITY_THRESHOLD,
+                "memory_entries": memory, "disk_entries": entries}
+
+    def close(self):
+        self._db.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Process-wide LLM answer cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
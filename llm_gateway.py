@@ -0,0 +1,323 @@
+"""
+One way to call Gemini for the Streamlit pages, chat.py and chat_api.py:
+pooled clients, a process-wide concurrency and requests-per-minute limit that
+callers queue behind, coalescing of identical in-flight requests, and token and
+latency accounting per caller.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from google import genai
+from google.genai import types
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))  # Gemini calls in flight at once; the rest wait their turn
+LLM_RPM = int(os.getenv("LLM_RPM", "60"))  # Calls started per rolling minute (0 for no limit)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # Seconds per call, including time spent waiting for a slot
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")  # Proxy or local stand-in for the Gemini API
+
+
+class LLMBusyError(TimeoutError):
+    """Raised when a call waited LLM_TIMEOUT for a slot without getting one"""
+
+
+def estimate_tokens(text):
+    """Rough model token count (about four characters per token)"""
+    return len(text or "") // 4 + 1
+
+
+def cache_variant(mode, model=GEMINI_MODEL):
+    """
+    Answer cache variant for a model and a way of asking: "search" (URL prompt with
+    Google Search, chat_api.py and chat.py), "retrieval" (grounded in page excerpts),
+    "url" (URL prompt, no tools) or "web_search" (question only, with search)
+    """
+    return f"{model}+{mode}"
+
+
+def response_text(response):
+    """Text of a response's first candidate ("" if it has none)"""
+    try:
+        return response.candidates[0].content.parts[0].text or ""
+    except (AttributeError, IndexError, TypeError):
+        return ""
+
+
+class Limiter:
+    """Caps calls in flight and calls started per minute; waiters queue until both allow"""
+
+    def __init__(self, concurrency=LLM_CONCURRENCY, rpm=LLM_RPM):
+        self.concurrency = concurrency
+        self.rpm = rpm
+        self.in_flight = 0
+        self.waiting = 0
+        self._starts = deque()
+        self._cond = threading.Condition()
+
+    def _wait_time(self, now):
+        """0 if a call may start now, else seconds to wait (None: until a call finishes). Caller holds the lock"""
+        if self.in_flight >= self.concurrency:
+            return None
+        if self.rpm:
+            while self._starts and now - self._starts[0] >= 60:
+                self._starts.popleft()
+            if len(self._starts) >= self.rpm:
+                return self._starts[0] + 60 - now
+        return 0
+
+    def _take(self, now):
+        self.in_flight += 1
+        self._starts.append(now)
+
+    def acquire(self, timeout=LLM_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait_time(now)
+                    if wait == 0:
+                        self._take(now)
+                        return
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise LLMBusyError(f"No Gemini slot free within {timeout:.0f} seconds")
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+            finally:
+                self.waiting -= 1
+
+    async def acquire_async(self, timeout=LLM_TIMEOUT):
+        """Same as acquire() without blocking the event loop; polls since waiters may be in other threads"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.waiting += 1
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    wait = self._wait_time(now)
+                    if wait == 0:
+                        self._take(now)
+                        return
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise LLMBusyError(f"No Gemini slot free within {timeout:.0f} seconds")
+                await asyncio.sleep(min(0.05 if wait is None else wait, remaining))
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+
+class LLMGateway:
+    """Shared Gemini access point; one per process, see get_llm_gateway()"""
+
+    def __init__(self, concurrency=LLM_CONCURRENCY, rpm=LLM_RPM, timeout=LLM_TIMEOUT, base_url=GEMINI_BASE_URL):
+        self.timeout = timeout
+        self.base_url = base_url
+        self.limiter = Limiter(concurrency, rpm)
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._pending = {}
+        # Sized well past the limiter so callers queue (and time out) there, not in the executor
+        self._executor = ThreadPoolExecutor(max_workers=max(32, concurrency * 4), thread_name_prefix="llm")
+        self._usage = defaultdict(lambda: defaultdict(float))
+
+    def client(self, api_key=None):
+        """Pooled client for the key (GEMINI_API_KEY by default); clients are reused across calls and threads"""
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable not set")
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                options = {"timeout": int(self.timeout * 1000)}
+                if self.base_url:
+                    options["base_url"] = self.base_url
+                client = genai.Client(api_key=api_key, http_options=types.HttpOptions(**options))
+                self._clients[api_key] = client
+            return client
+
+    def _record(self, caller, started, queued, prompt, response=None, text=None, error=None):
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt)
+        if text is None:
+            text = response_text(response) if response is not None else ""
+        output_tokens = getattr(usage, "candidates_token_count", None) or (estimate_tokens(text) if text else 0)
+        with self._lock:
+            stats = self._usage[caller]
+            stats["calls"] += 1
+            stats["queue_seconds"] += queued
+            stats["latency_seconds"] += time.monotonic() - started
+            if error is not None:
+                stats["timeouts" if isinstance(error, TimeoutError) else "errors"] += 1
+            else:
+                stats["prompt_tokens"] += prompt_tokens
+                stats["output_tokens"] += output_tokens
+
+    def _call(self, prompt, caller, model, config, api_key):
+        client = self.client(api_key)
+        started = time.monotonic()
+        try:
+            self.limiter.acquire(self.timeout)
+        except LLMBusyError as e:
+            self._record(caller, started, time.monotonic() - started, prompt, error=e)
+            raise
+        queued = time.monotonic() - started
+        try:
+            response = client.models.generate_content(model=model, contents=prompt, config=config)
+        except Exception as e:
+            self._record(caller, started, queued, prompt, error=e)
+            raise
+        finally:
+            self.limiter.release()
+        self._record(caller, started, queued, prompt, response)
+        return response
+
+    @staticmethod
+    def _request_key(prompt, model, config, api_key):
+        config_json = config.model_dump_json(exclude_none=True) if config is not None else ""
+        raw = json.dumps([prompt, model, config_json, api_key or os.getenv("GEMINI_API_KEY")])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def submit(self, prompt, caller, model=GEMINI_MODEL, config=None, api_key=None):
+        """
+        Queue a call and return its Future. An identical request (same prompt,
+        model, config and key) already in flight is shared instead of repeated.
+        """
+        key = self._request_key(prompt, model, config, api_key)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                self._usage[caller]["coalesced"] += 1
+                return future
+            future = self._executor.submit(self._call, prompt, caller, model, config, api_key)
+            self._pending[key] = future
+
+        def done(_):
+            with self._lock:
+                if self._pending.get(key) is future:
+                    del self._pending[key]
+
+        future.add_done_callback(done)
+        return future
+
+    def generate(self, prompt, caller, model=GEMINI_MODEL, config=None, api_key=None):
+        """Blocking call through the shared limits; returns the Gemini response"""
+        return self.submit(prompt, caller, model, config, api_key).result()
+
+    def stream(self, prompt, caller, model=GEMINI_MODEL, config=None, api_key=None):
+        """Blocking counterpart of astream(): yields answer text chunks as they arrive, holding a slot until done"""
+        client = self.client(api_key)
+        started = time.monotonic()
+        try:
+            self.limiter.acquire(self.timeout)
+        except LLMBusyError as e:
+            self._record(caller, started, time.monotonic() - started, prompt, error=e)
+            raise
+        queued = time.monotonic() - started
+        parts, last = [], None
+        try:
+            # The client's HTTP timeout bounds each wait for the next chunk
+            for last in client.models.generate_content_stream(model=model, contents=prompt, config=config):
+                if last.text:
+                    parts.append(last.text)
+                    yield last.text
+        except BaseException as e:
+            self._record(caller, started, queued, prompt, error=e if isinstance(e, Exception) else None,
+                         text="".join(parts))
+            raise
+        finally:
+            self.limiter.release()
+        self._record(caller, started, queued, prompt, last, text="".join(parts))
+
+    async def agenerate(self, prompt, caller, model=GEMINI_MODEL, config=None, api_key=None):
+        """Non-blocking call: waits for a free slot, then for the answer, within the timeout"""
+        client = self.client(api_key)
+        started = time.monotonic()
+        try:
+            await self.limiter.acquire_async(self.timeout)
+        except LLMBusyError as e:
+            self._record(caller, started, time.monotonic() - started, prompt, error=e)
+            raise
+        queued = time.monotonic() - started
+        try:
+            response = await asyncio.wait_for(
+                client.aio.models.generate_content(model=model, contents=prompt, config=config),
+                max(self.timeout - queued, 1),
+            )
+        except Exception as e:
+            self._record(caller, started, queued, prompt, error=e)
+            raise
+        finally:
+            self.limiter.release()
+        self._record(caller, started, queued, prompt, response)
+        return response
+
+    async def astream(self, prompt, caller, model=GEMINI_MODEL, config=None, api_key=None):
+        """Yield answer text chunks as they arrive; the slot is held until the stream ends"""
+        client = self.client(api_key)
+        started = time.monotonic()
+        try:
+            await self.limiter.acquire_async(self.timeout)
+        except LLMBusyError as e:
+            self._record(caller, started, time.monotonic() - started, prompt, error=e)
+            raise
+        queued = time.monotonic() - started
+        parts, last = [], None
+        try:
+            chunks = await asyncio.wait_for(
+                client.aio.models.generate_content_stream(model=model, contents=prompt, config=config), self.timeout
+            )
+            iterator = chunks.__aiter__()
+            while True:
+                try:
+                    # Timeout applies to each wait for the next chunk, so long answers can keep streaming
+                    last = await asyncio.wait_for(iterator.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    break
+                if last.text:
+                    parts.append(last.text)
+                    yield last.text
+        except BaseException as e:
+            self._record(caller, started, queued, prompt, error=e if isinstance(e, Exception) else None,
+                         text="".join(parts))
+            raise
+        finally:
+            self.limiter.release()
+        self._record(caller, started, queued, prompt, last, text="".join(parts))
+
+    def usage(self):
+        """Per-caller calls, errors, tokens and latency, plus current queue state"""
+        with self._lock:
+            callers = {}
+            for caller, stats in self._usage.items():
+                calls = stats["calls"] or 1
+                callers[caller] = {k: int(v) if v.is_integer() else round(v, 3) for k, v in stats.items()}
+                callers[caller]["avg_latency_seconds"] = round(stats["latency_seconds"] / calls, 3)
+        return {"in_flight": self.limiter.in_flight, "waiting": self.limiter.waiting,
+                "concurrency": self.limiter.concurrency, "rpm": self.limiter.rpm, "callers": callers}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway():
+    """Process-wide LLM gateway"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
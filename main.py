@@ -1,16 +1,21 @@
 import streamlit as st
 import requests
-from bs4 import BeautifulSoup
 
+import pandas as pd
 import base64
 import io
-import google.generativeai as genai
 import os
 from dotenv import load_dotenv
 import numpy as np
 from collections import defaultdict
 import random
-from urllib.parse import urlparse, urljoin
+from proxy_pool import get_proxy_pool
+from extract import DATA_CATEGORIES
+from archive import archive_page
+from dataset_store import get_dataset_store
+from data_profile import describe_frame
+from page_cache import FetchError, get_page_cache
+from llm_gateway import get_llm_gateway, response_text
 
 # Load environment variables
 load_dotenv()
@@ -333,35 +338,20 @@ def get_gemini_insights(dataframe, original_df=None, user_prompt=""):
         return "Error: Gemini API key not found in environment variables. Please add GEMINI_API_KEY to your .env file."
     
     try:
-        # Configure the Gemini API
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        # Generate comprehensive data context
+        # Compact statistical profile of the data, sized to a fixed token budget whatever the row count
         data_description = ""
         
-        # Include information about the original structure
-        if original_df is not None and not original_df.equals(dataframe):
+        # Include information about the original structure (reformat_for_excel hands back the same
+        # frame when nothing was restructured, so identity is enough - no full comparison needed)
+        if original_df is not None and original_df is not dataframe:
             data_description += f"""
-            Original data structure:
-            - Columns: {', '.join(original_df.columns)}
-            - Sample rows: 
-            {original_df.head(3).to_string(index=False)}
-            
-            The data has been restructured for better Excel readability with HTML tags as column headers:
+            The data has been restructured for better Excel readability with HTML tags as column headers,
+            from {len(original_df)} rows with columns {', '.join(original_df.columns)}.
             """
         
-        # Add reformatted data info
-        sample_data = dataframe.head(5).to_string()
-        column_info = str(dataframe.dtypes)
-        data_shape = f"Rows: {dataframe.shape[0]}, Columns: {dataframe.shape[1]}"
-        
         data_description += f"""
-        Data shape: {data_shape}
-        Column names: {', '.join(dataframe.columns)}
-        Column types: {column_info}
-        Sample data:
-        {sample_data}
+        Data profile (per column: counts, text lengths, recognised patterns and most common values):
+        {describe_frame(dataframe)}
         """
         
         # Create prompt with context about the data
@@ -390,27 +380,37 @@ def get_gemini_insights(dataframe, original_df=None, user_prompt=""):
             User question: {user_prompt}
             
             Please provide detailed, helpful insights based on the user's question, focusing on the actual content
-            visible in the data. Base your answers on what you can see in the sample data provided.
+            visible in the data. Base your answers on what the data profile provided shows.
             """
         
-        # Generate response
-        response = model.generate_content(system_prompt)
-        return response.text
+        # Generate response through the shared gateway (pooled client, process-wide rate limits)
+        response = get_llm_gateway().generate(system_prompt, "main.insights", api_key=GEMINI_API_KEY)
+        return response_text(response)
     
     except Exception as e:
         return f"Error getting insights: {str(e)}"
 
+# Function to fetch a page for the shared page cache, directly or through the proxy pool
+def fetch_page(url, headers, proxies):
+    if proxies:
+        # Shared health-scored pool, so proxy health carries over between runs
+        response, proxy = get_proxy_pool(proxies).get(url, headers=headers, timeout=10)
+    else:
+        response, proxy = requests.get(url, headers=headers), None
+    if response.status_code == 200:
+        # Kept so extraction rules can be replayed later without refetching
+        archive_page(url, response.content, 200, response.headers.get("Content-Type"))
+    return response.status_code, response.content, {"proxy": proxy}
+
 # Create session state to store data between reruns
-if 'tags' not in st.session_state:
-    st.session_state.tags = []
 if 'df' not in st.session_state:
     st.session_state.df = None
 if 'df_reformatted' not in st.session_state:
     st.session_state.df_reformatted = None
 if 'url' not in st.session_state:
     st.session_state.url = ""
-if 'soup' not in st.session_state:
-    st.session_state.soup = None
+if 'page_key' not in st.session_state:
+    st.session_state.page_key = None  # Key of the analyzed page in the shared page cache
 if 'insights' not in st.session_state:
     st.session_state.insights = ""
 
@@ -479,58 +479,31 @@ with st.container():
                     'User-Agent': random.choice(st.session_state.user_agents["agents"]) if rotate_user_agents else 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36'
                 }
                 
-                # Make request with proxy if enabled
-                if use_proxy and proxies:
-                    proxy = random.choice(proxies)
-                    response = requests.get(url, headers=headers, proxies={"http": proxy, "https": proxy}, timeout=10)
-                    st.session_state.used_proxy = proxy
-                else:
-                    response = requests.get(url, headers=headers)
-                    st.session_state.used_proxy = None
+                # Fetch and parse through the cache shared by all sessions (proxy if enabled);
+                # the session keeps only the page's key
+                fetch_proxies = proxies if use_proxy and proxies else []
+                try:
+                    page, fetched = get_page_cache().get(
+                        url, {"proxies": sorted(fetch_proxies)},
+                        lambda page_url: fetch_page(page_url, headers, fetch_proxies),
+                    )
+                except FetchError as e:
+                    st.error(str(e))
+                    page = None
                 
-                if response.status_code != 200:
-                    st.error(f"Failed to retrieve page. Status code: {response.status_code}")
-                else:
-                    soup = BeautifulSoup(response.content, "html.parser")
-                    st.session_state.soup = soup
-                    
-                    # Extract all unique tags
-                    all_tags = set([tag.name for tag in soup.find_all() if tag.name is not None])
-                    st.session_state.tags = sorted(all_tags)
+                if page is not None:
+                    st.session_state.page_key = page.key
+                    st.session_state.used_proxy = fetched.get("proxy")
+                    if fetched["cached"]:
+                        st.caption(f"Served from the shared page cache (fetched {fetched['age']:.0f} seconds ago)")
                     
                     # Check for pagination if enabled
                     if enable_pagination:
                         # Store the current URL for pagination
                         st.session_state.current_url = url
                         
-                        # Find potential next page link
-                        next_page_patterns = [
-                            # Text-based patterns
-                            {"element": "a", "text": ["next", "next page", "›", "»", ">"]},
-                            # Class-based patterns
-                            {"element": "a", "class": ["next", "pagination-next", "next-page"]}
-                        ]
-                        
-                        next_page_url = None
-                        base_url = url
-                        parsed_url = urlparse(url)
-                        domain = f"{parsed_url.scheme}://{parsed_url.netloc}"
-                        
-                        # Try to find next page link
-                        for pattern in next_page_patterns:
-                            if "text" in pattern:
-                                for text_pattern in pattern["text"]:
-                                    for link in soup.find_all(pattern["element"]):
-                                        if link.get_text().lower().strip() == text_pattern.lower() and link.has_attr('href'):
-                                            next_page_url = urljoin(base_url, link['href'])
-                                            break
-                            
-                            if "class" in pattern:
-                                for class_pattern in pattern["class"]:
-                                    for link in soup.find_all(pattern["element"], class_=lambda c: c and class_pattern in c.lower()):
-                                        if link.has_attr('href'):
-                                            next_page_url = urljoin(base_url, link['href'])
-                                            break
+                        # Next page link, found when the page was parsed
+                        next_page_url = page.next_url
                         
                         # Check if pagination is available
                         if next_page_url:
@@ -544,25 +517,20 @@ with st.container():
             except Exception as e:
                 st.error(f"Error occurred: {e}")
 
+# Page analyzed by this session, looked up in the shared cache
+page = get_page_cache().page(st.session_state.page_key) if st.session_state.page_key else None
+if st.session_state.page_key and page is None:
+    st.warning("The analyzed page is no longer cached. Click \"Analyze Page\" to fetch it again.")
+
 # Tag selection section
-if st.session_state.tags:
+if page is not None:
     with st.container():
         st.subheader("What data would you like to extract?")
         
         # Instead of showing tags, ask user what kind of data they want
-        data_categories = [
-            "Page Titles and Headers",
-            "Product Information",
-            "Prices and Costs",
-            "Contact Information",
-            "Links and Navigation",
-            "Article Content",
-            "Custom Query"
-        ]
-        
         selected_category = st.selectbox(
             "Select the type of data you're interested in:",
-            data_categories
+            DATA_CATEGORIES
         )
         
         # Custom query option
@@ -575,95 +543,8 @@ if st.session_state.tags:
         # Scrape button
         if st.button("Extract Data"):
             with st.spinner("Extracting data..."):
-                results = []
-                
-                # Map user-friendly categories to appropriate tags and extraction logic
-                if selected_category == "Page Titles and Headers":
-                    header_tags = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'title']
-                    for tag in header_tags:
-                        if tag in st.session_state.tags:
-                            for el in st.session_state.soup.find_all(tag):
-                                text = el.get_text(strip=True)
-                                if text:
-                                    results.append({"Type": f"Header ({tag})", "Text": text})
-                
-                elif selected_category == "Product Information":
-                    # Look for product-related elements
-                    product_classes = ["product", "item", "goods"]
-                    # Try various product patterns
-                    for el in st.session_state.soup.find_all(class_=lambda c: c and any(p in str(c).lower() for p in product_classes)):
-                        name = el.get_text(strip=True)
-                        if name:
-                            results.append({"Type": "Product", "Text": name})
-                    
-                    # Also check common product containers
-                    for tag in ['div', 'li', 'article']:
-                        if tag in st.session_state.tags:
-                            for el in st.session_state.soup.find_all(tag):
-                                if el.find('img') and (el.find('h3') or el.find('h2')):
-                                    text = el.get_text(strip=True)
-                                    results.append({"Type": "Product Item", "Text": text[:200]})
-                
-                elif selected_category == "Prices and Costs":
-                    # Price extraction with regex patterns
-                    import re
-                    price_pattern = re.compile(r'(\$|€|£|\¥|USD|EUR)\s?[\d,.]+|\d+(\.\d{2})?(?=\s*(?:\$|€|£|\¥|USD|EUR))')
-                    
-                    for tag in ['span', 'div', 'p', 'strong']:
-                        if tag in st.session_state.tags:
-                            for el in st.session_state.soup.find_all(tag):
-                                text = el.get_text(strip=True)
-                                if price_pattern.search(text):
-                                    results.append({"Type": "Price", "Text": text})
-                
-                elif selected_category == "Contact Information":
-                    # Email regex pattern
-                    import re
-                    email_pattern = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
-                    phone_pattern = re.compile(r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}')
-                    
-                    # Check contact info in various tags
-                    for tag in ['p', 'div', 'span', 'a', 'address']:
-                        if tag in st.session_state.tags:
-                            for el in st.session_state.soup.find_all(tag):
-                                text = el.get_text(strip=True)
-                                if "contact" in text.lower() or email_pattern.search(text) or phone_pattern.search(text):
-                                    results.append({"Type": "Contact", "Text": text})
-                
-                elif selected_category == "Links and Navigation":
-                    # Get links
-                    if 'a' in st.session_state.tags:
-                        for el in st.session_state.soup.find_all('a'):
-                            text = el.get_text(strip=True)
-                            href = el.get('href', '')
-                            if text and href:
-                                results.append({"Type": "Link", "Text": text, "URL": href})
-                
-                elif selected_category == "Article Content":
-                    # Article content typically in p tags, sometimes with article container
-                    article_container = st.session_state.soup.find('article')
-                    
-                    if article_container:
-                        for p in article_container.find_all('p'):
-                            text = p.get_text(strip=True)
-                            if text and len(text) > 15:  # Avoid very short paragraphs
-                                results.append({"Type": "Article Paragraph", "Text": text})
-                    else:
-                        # No article container, look for content in p tags
-                        for p in st.session_state.soup.find_all('p'):
-                            text = p.get_text(strip=True)
-                            if text and len(text) > 30:  # Longer threshold for general p tags
-                                results.append({"Type": "Paragraph", "Text": text})
-                
-                elif selected_category == "Custom Query":
-                    # Handle custom query with intelligent extraction
-                    query_terms = custom_query.lower().split()
-                    
-                    for tag in st.session_state.tags:
-                        for el in st.session_state.soup.find_all(tag):
-                            text = el.get_text(strip=True)
-                            if text and any(term in text.lower() for term in query_terms):
-                                results.append({"Type": f"Custom Match ({tag})", "Text": text})
+                # Memoized per page, so sessions extracting the same data share the work
+                results = page.extract(selected_category, custom_query if selected_category == "Custom Query" else "")
                 
                 if not results:
                     st.warning("No data found matching your selection. Try another category or custom query.")
@@ -681,6 +562,12 @@ if st.session_state.tags:
                     
                     st.session_state.df = df
                     
+                    # Persist the extraction so it can be queried later without re-scraping
+                    get_dataset_store().save(st.session_state.url, results, "streamlit", {
+                        "category": selected_category,
+                        "query": custom_query if selected_category == "Custom Query" else None,
+                    })
+                    
                     # Create reformatted version with types as columns
                     original_df, reformatted_df = reformat_for_excel(df)
                     st.session_state.df_reformatted = reformatted_df
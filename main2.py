@@ -1,5 +1,5 @@
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel
 import httpx
 from bs4 import BeautifulSoup
@@ -8,6 +8,15 @@ from io import BytesIO
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 import re
+import asyncio
+from resilience import resilient_get_async, CircuitOpenError
+from archive import archive_page
+import resilience
+from render_detect import render_router
+from browser_pool import get_browser_pool
+from scrape import scrape_website
+from fastapi.concurrency import run_in_threadpool
+from jobs import JobQueue
 
 app = FastAPI(
     title="DataForage API",
@@ -27,13 +36,11 @@ app.add_middleware(
 class ScrapeRequest(BaseModel):
     url: str
 
-@app.post("/scrape")
-async def scrape(request: ScrapeRequest):
+async def scrape_to_excel(url):
     """
-    Scrape data from a given URL and return it as an Excel file.
+    Scrape data from a given URL and build an Excel file.
+    Returns the workbook buffer and a download filename.
     """
-    url = request.url
-    
     # Headers to avoid being blocked by websites
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36',
@@ -47,13 +54,25 @@ async def scrape(request: ScrapeRequest):
     try:
         # Fetch the webpage content
         async with httpx.AsyncClient(follow_redirects=True, timeout=30.0) as client:
-            response = await client.get(url, headers=headers)
+            response = await resilient_get_async(client, url, headers=headers)
             response.raise_for_status()
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Origin unavailable: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to fetch URL: {str(e)}")
     
+    await run_in_threadpool(archive_page, url, response.content, 200, response.headers.get("Content-Type"))
     soup = BeautifulSoup(response.text, "html.parser")
     
+    # SPA shells have no content in the static HTML - render those in the browser pool
+    if render_router.needs_render(url, soup):
+        try:
+            html = await run_in_threadpool(scrape_website, url, static_response=response)
+            await run_in_threadpool(archive_page, url, html, 200, "text/html; rendered")
+            soup = BeautifulSoup(html, "html.parser")
+        except Exception as e:
+            print(f"Rendering failed for {url}, using static HTML: {str(e)}")
+    
     # Extract domain for naming the sheet
     domain_match = re.search(r'//([^/]+)', url)
     domain = domain_match.group(1) if domain_match else "website"
@@ -153,17 +172,79 @@ async def scrape(request: ScrapeRequest):
         df.to_excel(output, index=False)
         output.seek(0)
     
-    # Return the Excel file as a download
     filename = f"{domain}_data.xlsx"
+    return output, filename
+
+@app.post("/scrape")
+async def scrape(request: ScrapeRequest):
+    """
+    Scrape data from a given URL and return it as an Excel file.
+    """
+    output, filename = await scrape_to_excel(request.url)
+    
+    # Return the Excel file as a download
     return StreamingResponse(
         output, 
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
+# Large scrapes run as background jobs instead of holding the connection open
+job_queue = JobQueue()
+
+def run_excel_job(payload, progress):
+    """Job handler: run the same scrape as /scrape on a worker thread"""
+    progress(0.1, "Fetching page")
+    output, filename = asyncio.run(scrape_to_excel(payload["url"]))
+    return output.getvalue(), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", filename
+
+job_queue.register("main2_excel", run_excel_job)
+
+@app.on_event("startup")
+def start_job_workers():
+    job_queue.start()
+
+@app.on_event("startup")
+def warm_browsers():
+    # Launches the pooled browsers in the background, so the first render doesn't wait for Chrome
+    get_browser_pool()
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    job_queue.stop()
+
+@app.post("/scrape/jobs", status_code=202)
+async def submit_scrape_job(request: ScrapeRequest):
+    """Queue a scrape and return a job ID to poll"""
+    job_id = await run_in_threadpool(job_queue.submit, "main2_excel", {"url": request.url})
+    return {"job_id": job_id, "status": "queued", "status_url": f"/scrape/jobs/{job_id}",
+            "result_url": f"/scrape/jobs/{job_id}/result"}
+
+@app.get("/scrape/jobs/{job_id}")
+async def get_scrape_job(job_id: str):
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.pop("result_path", None)
+    return job
+
+@app.get("/scrape/jobs/{job_id}/result")
+async def get_scrape_job_result(job_id: str):
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "done":
+        detail = f"Job failed: {job['error']}" if job["status"] == "failed" else f"Job is {job['status']}"
+        raise HTTPException(status_code=409, detail=detail)
+    return FileResponse(job["result_path"], media_type=job["media_type"], filename=job["filename"])
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def get_metrics():
+    return {"resilience": resilience.metrics(), "rendering": render_router.stats}
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,220 @@
+"""
+Process-wide cache of fetched and parsed pages for the Streamlit scraper, shared
+by every browser session. Pages are held compactly (compressed HTML, tag list,
+next-page link and memoized extraction results) rather than as live
+BeautifulSoup trees; sessions keep only a page key.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from archive import _compress, _decompress
+from coalesce import normalize_url
+from extract import extract_category, page_tags
+
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "600"))  # Seconds a fetch is reused and an idle page kept
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # Memory ceiling, all pages
+MAX_EXTRACTIONS = 16  # Extraction results memoized per page
+
+NEXT_PAGE_TEXTS = ["next", "next page", "›", "»", ">"]
+NEXT_PAGE_CLASSES = ["next", "pagination-next", "next-page"]
+
+
+class FetchError(Exception):
+    """The page answered with a non-200 status"""
+
+    def __init__(self, status_code):
+        super().__init__(f"Failed to retrieve page. Status code: {status_code}")
+        self.status_code = status_code
+
+
+# Function to find a "next page" link, by its text first, then by its class
+def next_page_url(soup, url):
+    next_url = None
+    for text_pattern in NEXT_PAGE_TEXTS:
+        for link in soup.find_all("a"):
+            if link.get_text().lower().strip() == text_pattern and link.has_attr('href'):
+                next_url = urljoin(url, link['href'])
+                break
+    for class_pattern in NEXT_PAGE_CLASSES:
+        for link in soup.find_all("a", class_=lambda c: c and class_pattern in c.lower()):
+            if link.has_attr('href'):
+                next_url = urljoin(url, link['href'])
+                break
+    return next_url
+
+
+def page_key(url, content_hash):
+    raw = json.dumps([normalize_url(url), content_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class ParsedPage:
+    """One page body as shared by sessions: compressed HTML plus what was parsed from it"""
+
+    def __init__(self, key, url, content):
+        self.key = key
+        self.url = url
+        soup = BeautifulSoup(content, "html.parser")
+        self.tags = page_tags(soup)
+        self.next_url = next_page_url(soup, url)
+        self.body, self.codec = _compress(content)
+        self.accessed = time.time()
+        self._extractions = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = len(self.body) + sum(len(t) for t in self.tags) + len(self.next_url or "")
+
+    def soup(self):
+        """A fresh tree for one-off work; not kept"""
+        return BeautifulSoup(_decompress(self.body, self.codec), "html.parser")
+
+    def extract(self, category, custom_query=""):
+        """extract_category() rows for this page, memoized (callers must not modify them)"""
+        key = (category, custom_query or "")
+        with self._lock:
+            if key in self._extractions:
+                self._extractions.move_to_end(key)
+                return self._extractions[key][0]
+        results = extract_category(self.soup(), category, custom_query, tags=self.tags)
+        size = len(json.dumps(results, default=str))
+        with self._lock:
+            if key not in self._extractions:
+                self._extractions[key] = (results, size)
+                self.size += size
+                while len(self._extractions) > MAX_EXTRACTIONS:
+                    _, (_, dropped) = self._extractions.popitem(last=False)
+                    self.size -= dropped
+        return results
+
+
+class PageCache:
+    """
+    Fetches are reused per URL and fetch options for ttl seconds and coalesced
+    while in flight; parsed pages are keyed by URL and content hash, so refetching
+    an unchanged page reuses its parse. Pages idle longer than ttl, or least
+    recently used beyond max_bytes, are dropped.
+    """
+
+    def __init__(self, ttl=PAGE_CACHE_TTL, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+        self._fetches = {}  # fetch key -> (page key, fetched time, fetch info)
+        self._in_flight = {}
+        self.bytes = 0
+        self.stats = {"hits": 0, "fetches": 0, "coalesced": 0, "unchanged": 0, "expired": 0, "evictions": 0}
+
+    @staticmethod
+    def fetch_key(url, options=None):
+        raw = json.dumps([normalize_url(url), options or {}], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def page(self, key):
+        """Cached page for a key a session holds, or None once it expired or was evicted"""
+        with self._lock:
+            self._expire()
+            page = self._pages.get(key)
+            if page is not None:
+                page.accessed = time.time()
+                self._pages.move_to_end(key)
+            return page
+
+    def get(self, url, options, fetch):
+        """
+        Page at url, plus fetch info ({"cached": bool, ...} and whatever fetch
+        reported). fetch(url) returns (status_code, content, info); non-200
+        answers raise FetchError and aren't cached.
+        """
+        fetch_key = self.fetch_key(url, options)
+        with self._lock:
+            self._expire()
+            entry = self._fetches.get(fetch_key)
+            if entry is not None and time.time() - entry[1] < self.ttl and entry[0] in self._pages:
+                page = self._pages[entry[0]]
+                page.accessed = time.time()
+                self._pages.move_to_end(entry[0])
+                self.stats["hits"] += 1
+                return page, {**entry[2], "cached": True, "age": time.time() - entry[1]}
+            future = self._in_flight.get(fetch_key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[fetch_key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            page, info = future.result()
+            return page, {**info, "cached": True, "age": 0.0}
+
+        try:
+            result = self._fetch(url, fetch_key, fetch)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(fetch_key, None)
+
+    def _fetch(self, url, fetch_key, fetch):
+        self.stats["fetches"] += 1
+        status_code, content, info = fetch(url)
+        if status_code != 200:
+            raise FetchError(status_code)
+        key = page_key(url, hashlib.sha256(content).hexdigest())
+        with self._lock:
+            page = self._pages.get(key)
+        if page is not None:
+            self.stats["unchanged"] += 1
+        else:
+            # Parsed outside the lock; if another session parsed the same body meanwhile, keep theirs
+            page = ParsedPage(key, url, content)
+        with self._lock:
+            page = self._pages.setdefault(key, page)
+            self._pages.move_to_end(key)
+            page.accessed = time.time()
+            self._fetches[fetch_key] = (key, time.time(), info)
+            self._evict()
+        return page, {**info, "cached": False}
+
+    def _expire(self):
+        """Drop pages idle past the TTL and fetches past it. Caller holds the lock"""
+        now = time.time()
+        for key in [k for k, p in self._pages.items() if now - p.accessed >= self.ttl]:
+            del self._pages[key]
+            self.stats["expired"] += 1
+        for key in [k for k, (pk, fetched, _) in self._fetches.items() if now - fetched >= self.ttl or pk not in self._pages]:
+            del self._fetches[key]
+
+    def _evict(self):
+        """Least recently used pages go first once over the memory ceiling; the newest always stays. Caller holds the lock"""
+        self.bytes = sum(p.size for p in self._pages.values())
+        while self.bytes > self.max_bytes and len(self._pages) > 1:
+            _, page = self._pages.popitem(last=False)
+            self.bytes -= page.size
+            self.stats["evictions"] += 1
+
+    def metrics(self):
+        with self._lock:
+            return {**self.stats, "pages": len(self._pages), "bytes": sum(p.size for p in self._pages.values())}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """Process-wide page cache, shared by every Streamlit session"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageCache()
+        return _cache
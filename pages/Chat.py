@@ -1,11 +1,16 @@
 import streamlit as st
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
+from google.genai import types
 import requests
 from bs4 import BeautifulSoup
 import time
 
+from chat_history import get_chat_history, render_history
+from llm_cache import SIMILARITY_THRESHOLD, get_llm_cache
+from llm_gateway import cache_variant, get_llm_gateway
+from retrieval import build_prompt, get_index_cache
+
 # Load environment variables
 load_dotenv()
 
@@ -310,9 +315,33 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# Initialize session state
-if 'messages' not in st.session_state:
-    st.session_state.messages = []
+# Function to render an answer while its chunks arrive; returns the full text and when the first chunk came
+def render_stream(chunks, loading, box):
+    answer, first_token_time = "", None
+    for text in chunks:
+        if first_token_time is None:
+            first_token_time = time.time()
+            loading.empty()
+        answer += text
+        box.markdown(answer + "▌")
+    box.markdown(answer)
+    return answer, first_token_time
+
+# Function to render one chat message
+def render_message(msg):
+    if msg["role"] == "user":
+        st.markdown(f"<div class='user-message'>{msg['content']}</div>", unsafe_allow_html=True)
+    else:
+        # For AI responses, process them through Streamlit's markdown renderer
+        with st.container():
+            st.markdown("<div class='ai-message'>", unsafe_allow_html=True)
+            st.write(msg["content"])  # Using st.write instead of markdown for better rendering
+            st.markdown("</div>", unsafe_allow_html=True)
+            if msg.get("caption"):
+                st.caption(msg["caption"])
+
+# Initialize session state (capped chat history, older turns summarized)
+chat_history = get_chat_history()
 
 if 'gemini_key_set' not in st.session_state:
     # Check if API key is available
@@ -363,7 +392,14 @@ if st.session_state.gemini_key_set:
             **Q: How accurate is the information?**  
             A: The AI provides information based on the content it can access. Always verify critical information.
             """)
-    
+
+        # How close a rephrased question must be to reuse a cached answer about the same page
+        similarity_threshold = st.slider(
+            "Reuse answers to similar questions from", min_value=0.5, max_value=1.0,
+            value=SIMILARITY_THRESHOLD, step=0.05,
+            help="Word overlap with a question already answered for this page. 1.0 only reuses exact repeats."
+        )
+
     # Main chat container
     col1, col2 = st.columns([2, 1])
     
@@ -383,132 +419,154 @@ if st.session_state.gemini_key_set:
             else:
                 # Add user message to chat history
                 user_message = f"Question: {question}" + (f"\nWebsite: {url}" if url else "\nUsing Google Search")
-                st.session_state.messages.append({"role": "user", "content": user_message})
+                chat_history.append({"role": "user", "content": user_message})
                 
-                # Display loading indicator
+                # Display loading indicator until the first chunk of the answer arrives
                 with st.container():
-                    st.markdown('<div class="loading"><div class="loading-dot"></div><div class="loading-dot"></div><div class="loading-dot"></div></div>', unsafe_allow_html=True)
+                    loading = st.empty()
+                    answer_box = st.empty()
+                    loading.markdown('<div class="loading"><div class="loading-dot"></div><div class="loading-dot"></div><div class="loading-dot"></div></div>', unsafe_allow_html=True)
                     
                     try:
-                        # Initialize Gemini API using the correct method
-                        api_key = os.getenv("GEMINI_API_KEY")
-                        genai.configure(api_key=api_key)
+                        # Reuse an earlier answer to the same question while the page is unchanged
+                        llm_cache = get_llm_cache()
                         
-                        # Create model instance - use the latest model that supports Google Search
-                        model = genai.GenerativeModel('gemini-2.0-flash')
+                        # Index the page locally so only its relevant parts go to the model
+                        page_index = None
+                        if url:
+                            try:
+                                page_index = get_index_cache().get(url)
+                            except Exception as e:
+                                print(f"Retrieval failed for {url}, sending the URL only: {str(e)}")
+                            if page_index is not None and not page_index.chunks:
+                                page_index = None
                         
-                        start_time = time.time()
+                        if page_index is not None:
+                            variant = cache_variant("retrieval")
+                            fingerprint = page_index.fingerprint
+                        else:
+                            variant = cache_variant("url" if url else "web_search")
+                            fingerprint = llm_cache.page_fingerprint(url)
+                        cached = llm_cache.get(question, url, fingerprint, variant, similarity_threshold)
+                        
+                        if cached is not None:
+                            if cached.get("matched_question"):
+                                caption = (f"Answered from cache for the similar question \"{cached['matched_question']}\" "
+                                           f"({cached['similarity']:.0%} match, saved {cached['latency']:.2f} seconds)")
+                            else:
+                                caption = f"Answered from cache (saved {cached['latency']:.2f} seconds)"
+                            chat_history.append({"role": "assistant", "content": cached["response"], "caption": caption})
+                        else:
+                            # Gemini calls go through the shared gateway (pooled client, process-wide rate limits)
+                            api_key = os.getenv("GEMINI_API_KEY")
+                            gateway = get_llm_gateway()
+                        
+                            start_time = time.time()
+                            # Fallbacks and placeholder texts are shown but never cached
+                            cacheable = True
                         
-                        # Determine which mode to use based on URL presence
-                        if url:
-                            # URL-specific question
-                            prompt = f"{question} from this URL: {url}"
-                            
                             # Standard generation config
-                            generation_config = {
-                                "temperature": 0.7,
-                                "top_p": 0.95,
-                                "top_k": 64,
-                                "candidate_count": 1,
-                                "max_output_tokens": 2048,
-                            }
-                            
-                            # Call the Gemini API with the prompt
-                            response = model.generate_content(
-                                prompt,
-                                generation_config=generation_config
+                            generation_config = types.GenerateContentConfig(
+                                temperature=0.7,
+                                top_p=0.95,
+                                top_k=64,
+                                candidate_count=1,
+                                max_output_tokens=2048,
                             )
-                        else:
-                            # Use Google Search functionality
-                            try:
-                                # Create a safety settings object
-                                safety_settings = {
-                                    "HARASSMENT": "BLOCK_NONE",
-                                    "HATE": "BLOCK_NONE",
-                                    "SEXUAL": "BLOCK_NONE",
-                                    "DANGEROUS": "BLOCK_NONE",
-                                }
-                                
-                                # Configure generation settings
-                                generation_config = {
-                                    "temperature": 0.7,
-                                    "top_p": 0.95,
-                                    "top_k": 64,
-                                    "candidate_count": 1,
-                                    "max_output_tokens": 2048,
-                                }
-                                
-                                # Call the model with the web search capability
-                                # The model will automatically perform web search for the query
-                                response = model.generate_content(
-                                    question,
-                                    generation_config=generation_config,
-                                    safety_settings=safety_settings,
-                                    tools=[{"web_search": {}}]  # Enable web search through tools parameter
-                                )
-                                print("Web search query sent successfully")
-                            except Exception as search_error:
-                                print(f"Web search error: {search_error}")
-                                # Fallback to regular query without web search
-                                response = model.generate_content(
-                                    f"Please answer this question to the best of your ability without web search: {question}",
-                                    generation_config=generation_config
+                        
+                            # Determine which mode to use based on URL presence
+                            if url:
+                                # URL-specific question, grounded in the retrieved excerpts when the page could be fetched
+                                if page_index is not None:
+                                    prompt = build_prompt(question, url, page_index.top_chunks(question))
+                                else:
+                                    prompt = f"{question} from this URL: {url}"
+                            
+                                # Stream the answer for the prompt with the standard generation config
+                                answer, first_token_time = render_stream(
+                                    gateway.stream(prompt, "pages.chat", config=generation_config, api_key=api_key),
+                                    loading, answer_box,
                                 )
-                                print("Falling back to regular query without web search")
+                            else:
+                                # Use Google Search functionality
+                                try:
+                                    # Create the safety settings
+                                    safety_settings = [
+                                        types.SafetySetting(category=category, threshold=types.HarmBlockThreshold.BLOCK_NONE)
+                                        for category in (
+                                            types.HarmCategory.HARM_CATEGORY_HARASSMENT,
+                                            types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+                                            types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
+                                            types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
+                                        )
+                                    ]
+                                
+                                    # Call the model with the web search capability
+                                    # The model will automatically perform web search for the query
+                                    chunks = gateway.stream(
+                                        question,
+                                        "pages.chat",
+                                        config=generation_config.model_copy(update={
+                                            "safety_settings": safety_settings,
+                                            "tools": [types.Tool(google_search=types.GoogleSearch())],
+                                        }),
+                                        api_key=api_key,
+                                    )
+                                    answer, first_token_time = render_stream(chunks, loading, answer_box)
+                                    print("Web search answer streamed successfully")
+                                except Exception as search_error:
+                                    print(f"Web search error: {search_error}")
+                                    cacheable = False
+                                    # Fallback to regular query without web search
+                                    chunks = gateway.stream(
+                                        f"Please answer this question to the best of your ability without web search: {question}",
+                                        "pages.chat",
+                                        config=generation_config,
+                                        api_key=api_key,
+                                    )
+                                    answer, first_token_time = render_stream(chunks, loading, answer_box)
+                                    print("Falling back to regular query without web search")
                         
-                        end_time = time.time()
+                            end_time = time.time()
                         
-                        # Extract the response text safely
-                        if hasattr(response, 'text'):
-                            response_text = response.text
-                            if not response_text:
-                                response_text = "The AI generated an empty response. Please try rephrasing your question."
-                        else:
-                            # Alternative way to extract text for newer API versions
-                            try:
-                                response_text = response.candidates[0].content.parts[0].text
-                                if not response_text:
-                                    response_text = "The AI generated an empty response. Please try rephrasing your question."
-                            except:
-                                response_text = "Error: Could not extract text from the AI response."
+                            # Replace an empty answer with a hint
+                            if not answer:
+                                cacheable = False
+                                answer = "The AI generated an empty response. Please try rephrasing your question."
                         
-                        # Print to console for debugging
-                        print(f"AI Response: {response_text[:100]}...")
+                            # Print to console for debugging
+                            print(f"AI Response: {answer[:100]}...")
                         
-                        # Add AI response to chat history
-                        st.session_state.messages.append({"role": "assistant", "content": response_text})
+                            # Display processing time and time to first token with the answer
+                            processing_time = end_time - start_time
+                            caption = f"Processed in {processing_time:.2f} seconds"
+                            if first_token_time is not None:
+                                caption += f" (first token after {first_token_time - start_time:.2f} seconds)"
                         
-                        # Display processing time
-                        processing_time = end_time - start_time
-                        st.caption(f"Processed in {processing_time:.2f} seconds")
+                            # Add the complete AI response to chat history
+                            chat_history.append({"role": "assistant", "content": answer, "caption": caption})
+                            if cacheable:
+                                llm_cache.put(question, url, fingerprint, answer, processing_time, variant)
                         
                     except Exception as e:
                         st.error(f"Error: {str(e)}")
-                        st.session_state.messages.append({
+                        chat_history.append({
                             "role": "assistant", 
                             "content": f"Sorry, I encountered an error while processing your request: {str(e)}"
                         })
                     
-                    # Clear the loading indicator and rerun to display messages
+                    # Rerun to display messages, now including the complete answer
                     st.rerun()
         
-        # Display chat messages
-        if st.session_state.messages:
+        # Display chat messages: only a recent window is rendered, older ones on request
+        if chat_history:
             st.markdown("<div class='chat-container'>", unsafe_allow_html=True)
-            for msg in st.session_state.messages:
-                if msg["role"] == "user":
-                    st.markdown(f"<div class='user-message'>{msg['content']}</div>", unsafe_allow_html=True)
-                else:
-                    # For AI responses, process them through Streamlit's markdown renderer
-                    with st.container():
-                        st.markdown("<div class='ai-message'>", unsafe_allow_html=True)
-                        st.write(msg["content"])  # Using st.write instead of markdown for better rendering
-                        st.markdown("</div>", unsafe_allow_html=True)
+            render_history(chat_history, render_message)
             st.markdown("</div>", unsafe_allow_html=True)
             
             # Add a button to clear chat history
             if st.button("Clear Chat History"):
-                st.session_state.messages = []
+                chat_history.clear()
                 st.rerun()
     
     with col2:
@@ -0,0 +1,245 @@
+import random
+import threading
+import time
+from collections import Counter
+
+import requests
+
+# Default tuning for proxy health tracking
+EWMA_ALPHA = 0.3  # Weight of the newest sample in the moving averages
+MAX_CONSECUTIVE_FAILURES = 3  # Failures in a row before a proxy is ejected
+EJECT_SECONDS = 30  # Initial ejection period, doubled on every repeat ejection
+MAX_EJECT_SECONDS = 600
+MIN_LATENCY = 0.05  # Floor so a single very fast sample doesn't dominate selection
+PROBE_URL = "http://www.gstatic.com/generate_204"
+PROBE_TIMEOUT = 5
+
+# Status codes that point to a broken proxy rather than a broken origin
+PROXY_FAILURE_STATUSES = {407, 502, 503, 504}
+
+
+class ProxyStats:
+    """Health record for a single proxy"""
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.success_rate = 1.0  # Optimistic start so new proxies get tried
+        self.latency = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = None
+        self.session = None
+
+    def score(self):
+        """Selection weight: healthy and fast proxies score highest"""
+        latency = max(self.latency if self.latency is not None else 1.0, MIN_LATENCY)
+        return max(self.success_rate, 0.01) / latency
+
+    def as_dict(self):
+        return {
+            "proxy": self.proxy,
+            "success_rate": round(self.success_rate, 3),
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejected": self.ejected_until is not None,
+        }
+
+
+class ProxyPool:
+    """
+    Keeps a health score per proxy and picks proxies weighted by it.
+    Success rate and latency are tracked as EWMAs; proxies failing repeatedly
+    are ejected and re-probed once their ejection period expires.
+    """
+
+    def __init__(self, proxies, alpha=EWMA_ALPHA, max_failures=MAX_CONSECUTIVE_FAILURES,
+                 eject_seconds=EJECT_SECONDS, probe_url=PROBE_URL, probe_timeout=PROBE_TIMEOUT):
+        if not proxies:
+            raise ValueError("ProxyPool needs at least one proxy")
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.probe_url = probe_url
+        self.probe_timeout = probe_timeout
+        self._stats = {proxy: ProxyStats(proxy) for proxy in dict.fromkeys(proxies)}
+        self._lock = threading.Lock()
+        self._in_use = Counter()  # Requests in flight per session
+        self._retired = set()  # Sessions dropped from the pool, closed once their last request ends
+
+    @property
+    def proxies(self):
+        return list(self._stats)
+
+    def choose(self):
+        """Pick a proxy at random, weighted by health score"""
+        now = time.monotonic()
+        with self._lock:
+            due = [s for s in self._stats.values() if s.ejected_until is not None and s.ejected_until <= now]
+            for stats in due:
+                # Hold it out while probing so concurrent callers don't probe it too
+                stats.ejected_until = now + self.probe_timeout
+
+        # Proxies whose ejection has expired must pass a probe before rejoining
+        for stats in due:
+            self.probe(stats.proxy)
+
+        with self._lock:
+            candidates = [s for s in self._stats.values() if s.ejected_until is None]
+            if not candidates:
+                # Everything is ejected - fall back to the one due back soonest
+                return min(self._stats.values(), key=lambda s: s.ejected_until).proxy
+            weights = [s.score() for s in candidates]
+        return random.choices(candidates, weights=weights, k=1)[0].proxy
+
+    def report_success(self, proxy, latency, readmit=False):
+        """Record a success; only a probe (readmit=True) ends an ejection, so late in-flight successes can't"""
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return
+            stats.requests += 1
+            stats.consecutive_failures = 0
+            if readmit:
+                stats.ejected_until = None
+            stats.success_rate += self.alpha * (1.0 - stats.success_rate)
+            if stats.latency is None:
+                stats.latency = latency
+            else:
+                stats.latency += self.alpha * (latency - stats.latency)
+
+    def report_failure(self, proxy, latency=None):
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return
+            stats.requests += 1
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            stats.success_rate -= self.alpha * stats.success_rate
+            # Only slow failures (timeouts) feed latency - fast refusals must not look healthy
+            if latency is not None and (stats.latency is None or latency > stats.latency):
+                stats.latency = latency if stats.latency is None else stats.latency + self.alpha * (latency - stats.latency)
+            # Failures of requests in flight when it was ejected don't extend the ejection
+            if stats.consecutive_failures >= self.max_failures and stats.ejected_until is None:
+                self._eject(stats)
+
+    def _eject(self, stats):
+        period = min(self.eject_seconds * (2 ** stats.ejections), MAX_EJECT_SECONDS)
+        stats.ejections += 1
+        stats.consecutive_failures = 0
+        stats.ejected_until = time.monotonic() + period
+        self._retire(stats)
+
+    def _retire(self, stats):
+        """Stop handing out a proxy's session; it is closed now if idle, else when its last request ends. Caller holds the lock"""
+        session, stats.session = stats.session, None
+        if session is None:
+            return
+        if self._in_use[session]:
+            self._retired.add(session)
+        else:
+            session.close()
+
+    def probe(self, proxy):
+        """Check a proxy with a cheap request; readmits it on success, re-ejects on failure"""
+        if not self.probe_url:
+            self.report_success(proxy, self._stats[proxy].latency or 1.0, readmit=True)
+            return True
+        start = time.monotonic()
+        session = self._checkout(proxy)
+        try:
+            response = session.get(self.probe_url, timeout=self.probe_timeout)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        finally:
+            self._checkin(session)
+        elapsed = time.monotonic() - start
+        if ok:
+            self.report_success(proxy, elapsed, readmit=True)
+        else:
+            with self._lock:
+                stats = self._stats[proxy]
+                stats.failures += 1
+                self._eject(stats)
+        return ok
+
+    def session_for(self, proxy):
+        """Pooled keep-alive session routed through the given proxy"""
+        with self._lock:
+            return self._session(proxy)
+
+    def _session(self, proxy):
+        stats = self._stats[proxy]
+        if stats.session is None:
+            session = requests.Session()
+            session.proxies = {"http": proxy, "https": proxy}
+            stats.session = session
+        return stats.session
+
+    def _checkout(self, proxy):
+        """The proxy's session, counted as in use until _checkin()"""
+        with self._lock:
+            session = self._session(proxy)
+            self._in_use[session] += 1
+            return session
+
+    def _checkin(self, session):
+        with self._lock:
+            self._in_use[session] -= 1
+            if self._in_use[session] > 0:
+                return
+            del self._in_use[session]
+            if session in self._retired:
+                self._retired.discard(session)
+                session.close()
+
+    def get(self, url, **kwargs):
+        """
+        Fetch a URL through the healthiest proxy.
+        Returns (response, proxy); connection errors are recorded and re-raised.
+        """
+        proxy = self.choose()
+        session = self._checkout(proxy)
+        start = time.monotonic()
+        try:
+            response = session.get(url, **kwargs)
+        except requests.RequestException:
+            self.report_failure(proxy, time.monotonic() - start)
+            raise
+        finally:
+            self._checkin(session)
+        elapsed = time.monotonic() - start
+        if response.status_code in PROXY_FAILURE_STATUSES:
+            self.report_failure(proxy, elapsed)
+        else:
+            self.report_success(proxy, elapsed)
+        return response, proxy
+
+    def stats(self):
+        with self._lock:
+            return [s.as_dict() for s in self._stats.values()]
+
+    def close(self):
+        with self._lock:
+            for stats in self._stats.values():
+                self._retire(stats)
+
+
+# Process-wide pools so health survives Streamlit reruns and repeated calls
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_proxy_pool(proxies):
+    """Return the shared pool for this proxy list, creating it on first use"""
+    key = tuple(dict.fromkeys(proxies))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ProxyPool(list(key))
+            _pools[key] = pool
+        return pool
@@ -5,6 +5,11 @@ import re
 import time
 import random
 from urllib.parse import urljoin, urlparse
+from proxy_pool import ProxyPool
+from resilience import resilient_get
+from archive import archive_page
+from crawl_state import CrawlState
+from search_index import index_rows
 
 # Configuration options
 MAX_PAGES = 3  # Maximum number of pages to scrape
@@ -15,29 +20,43 @@ USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0'
 ]
 
+# Run options - set by the interactive prompts below or by cli.py
+enable_pagination = False
+max_pages = MAX_PAGES
+use_proxy = False
+proxy_pool = None
+pages_scraped = 0
+
 # Step 1: Get URL and scraping options from user
-url = input("Enter the URL to scrape: ")
+def prompt_options():
+    global enable_pagination, max_pages, use_proxy, proxy_pool
+    
+    url = input("Enter the URL to scrape: ")
 
-# Ask if pagination should be enabled
-enable_pagination = input("Do you want to scrape multiple pages? (y/n, default: n): ").lower().strip() == 'y'
-if enable_pagination:
-    max_pages = input(f"Maximum pages to scrape (default: {MAX_PAGES}): ")
-    max_pages = int(max_pages) if max_pages.isdigit() else MAX_PAGES
-    print(f"Will scrape up to {max_pages} pages")
+    # Ask if pagination should be enabled
+    enable_pagination = input("Do you want to scrape multiple pages? (y/n, default: n): ").lower().strip() == 'y'
+    if enable_pagination:
+        max_pages = input(f"Maximum pages to scrape (default: {MAX_PAGES}): ")
+        max_pages = int(max_pages) if max_pages.isdigit() else MAX_PAGES
+        print(f"Will scrape up to {max_pages} pages")
 
-# Ask if proxies should be used
-use_proxy = input("Do you want to use proxy servers to avoid detection? (y/n, default: n): ").lower().strip() == 'y'
-if use_proxy:
-    proxies = input("Enter proxies separated by comma (format: http://ip:port,http://ip:port) or press Enter to use default: ")
-    if proxies:
-        proxies = [p.strip() for p in proxies.split(",")]
-        print(f"Using {len(proxies)} custom proxies")
-    else:
-        # Sample proxy list - in a real app, you'd use a proxy service or your own list
-        proxies = ["http://103.152.112.162:80", "http://193.239.86.249:3128", "http://159.65.77.168:8585"]
-        print("Using default proxy servers")
+    # Ask if proxies should be used
+    use_proxy = input("Do you want to use proxy servers to avoid detection? (y/n, default: n): ").lower().strip() == 'y'
+    if use_proxy:
+        proxies = input("Enter proxies separated by comma (format: http://ip:port,http://ip:port) or press Enter to use default: ")
+        if proxies:
+            proxies = [p.strip() for p in proxies.split(",")]
+            print(f"Using {len(proxies)} custom proxies")
+        else:
+            # Sample proxy list - in a real app, you'd use a proxy service or your own list
+            proxies = ["http://103.152.112.162:80", "http://193.239.86.249:3128", "http://159.65.77.168:8585"]
+            print("Using default proxy servers")
+        # Health-scored pool: slow or dead proxies get picked less and are ejected when failing
+        proxy_pool = ProxyPool(proxies)
+    
+    return url
 
-# Function to get a random user agent and proxy
+# Function to get a random user agent (proxies are picked by the pool at fetch time)
 def get_request_config():
     headers = {
         'User-Agent': random.choice(USER_AGENTS),
@@ -46,13 +65,21 @@ def get_request_config():
         'Connection': 'keep-alive',
     }
     
+    return {"headers": headers}
+
+# Function to fetch a page, through the proxy pool when proxies are enabled.
+# Transient failures are retried with backoff so one hiccup doesn't end pagination.
+def fetch(page_url, req_config):
     if use_proxy:
-        proxy = random.choice(proxies)
-        return {"headers": headers, "proxies": {"http": proxy, "https": proxy}}
+        response = resilient_get(page_url, fetch=lambda u, **kw: proxy_pool.get(u, **kw)[0],
+                                 headers=req_config["headers"], timeout=10)
     else:
-        return {"headers": headers}
+        response = resilient_get(page_url, headers=req_config["headers"], timeout=10)
+    if response.status_code == 200:
+        archive_page(page_url, response.content, 200, response.headers.get("Content-Type"))
+    return response
 
-# Function to scrape a single page and return results
+# Function to scrape a single page and return results (None if the page failed)
 def scrape_page(page_url, data_type_keywords):
     print(f"Scraping: {page_url}")
     
@@ -60,14 +87,11 @@ def scrape_page(page_url, data_type_keywords):
     req_config = get_request_config()
     
     try:
-        if use_proxy:
-            response = requests.get(page_url, headers=req_config["headers"], proxies=req_config["proxies"], timeout=10)
-        else:
-            response = requests.get(page_url, headers=req_config["headers"], timeout=10)
+        response = fetch(page_url, req_config)
             
         if response.status_code != 200:
             print(f"Failed to retrieve page {page_url}. Status code: {response.status_code}")
-            return [], None
+            return None, None
         
         soup = BeautifulSoup(response.content, "html.parser")
         
@@ -81,7 +105,7 @@ def scrape_page(page_url, data_type_keywords):
     
     except Exception as e:
         print(f"Error scraping {page_url}: {str(e)}")
-        return [], None
+        return None, None
 
 # Function to find the next page link
 def find_next_page_link(soup, current_url):
@@ -188,126 +212,150 @@ def process_data_by_type(soup, keywords):
 
 # Main scraping process
 def scrape_with_options(start_url, data_type):
-    all_results = []
+    global pages_scraped
     current_url = start_url
-    pages_scraped = 0
+    keywords = data_type.lower().split()
+    
+    # Every finished page is checkpointed, so an interrupted run can pick up where it stopped
+    crawl_state = CrawlState(start_url, {"data_type": data_type})
+    if crawl_state.is_resumable():
+        resume = input(f"An earlier run for this URL stopped after {crawl_state.pages_done()} pages. Resume it? (y/n, default: y): ")
+        if resume.lower().strip() == 'n':
+            crawl_state.reset()
+    elif crawl_state.status == "done":
+        crawl_state.reset()
     
-    # First page - do initial scrape and also show data examples
     try:
-        req_config = get_request_config()
+        # First page - do initial scrape and also show data examples
+        if crawl_state.pages_done() == 0:
+            req_config = get_request_config()
         
-        if use_proxy:
-            response = requests.get(current_url, headers=req_config["headers"], proxies=req_config["proxies"], timeout=10)
-        else:
-            response = requests.get(current_url, headers=req_config["headers"], timeout=10)
+            response = fetch(current_url, req_config)
             
-        if response.status_code != 200:
-            print(f"Failed to retrieve page {current_url}. Status code: {response.status_code}")
-            return []
+            if response.status_code != 200:
+                print(f"Failed to retrieve page {current_url}. Status code: {response.status_code}")
+                return []
         
-        soup = BeautifulSoup(response.content, "html.parser")
+            soup = BeautifulSoup(response.content, "html.parser")
         
-        # Show examples of available data on the page without mentioning HTML tags
-        print("\nExamples of data available on this page:")
+            # Show examples of available data on the page without mentioning HTML tags
+            print("\nExamples of data available on this page:")
         
-        # Extract various types of content without showing the source tags
-        examples = []
+            # Extract various types of content without showing the source tags
+            examples = []
         
-        # Get page title
-        if soup.title:
-            title = soup.title.get_text(strip=True)
-            if title:
-                examples.append({"category": "Page Title", "text": title})
+            # Get page title
+            if soup.title:
+                title = soup.title.get_text(strip=True)
+                if title:
+                    examples.append({"category": "Page Title", "text": title})
         
-        # Get main headings
-        for heading in soup.find_all(['h1', 'h2'], limit=3):
-            text = heading.get_text(strip=True)
-            if text and len(text) > 5:
-                examples.append({"category": "Heading", "text": text})
+            # Get main headings
+            for heading in soup.find_all(['h1', 'h2'], limit=3):
+                text = heading.get_text(strip=True)
+                if text and len(text) > 5:
+                    examples.append({"category": "Heading", "text": text})
         
-        # Get potential product info
-        price_pattern = re.compile(r'\$\s*[\d,]+\.?\d*')
-        for element in soup.find_all(['span', 'div', 'p'], limit=50):
-            text = element.get_text(strip=True)
-            if text and price_pattern.search(text):
-                examples.append({"category": "Price Information", "text": text})
-                break
+            # Get potential product info
+            price_pattern = re.compile(r'\$\s*[\d,]+\.?\d*')
+            for element in soup.find_all(['span', 'div', 'p'], limit=50):
+                text = element.get_text(strip=True)
+                if text and price_pattern.search(text):
+                    examples.append({"category": "Price Information", "text": text})
+                    break
         
-        # Get paragraph text
-        for para in soup.find_all('p', limit=5):
-            text = para.get_text(strip=True)
-            if text and len(text) > 20:  # Reasonable paragraph length
-                examples.append({"category": "Paragraph Content", "text": text})
-                break
+            # Get paragraph text
+            for para in soup.find_all('p', limit=5):
+                text = para.get_text(strip=True)
+                if text and len(text) > 20:  # Reasonable paragraph length
+                    examples.append({"category": "Paragraph Content", "text": text})
+                    break
         
-        # Get link text
-        link_texts = []
-        for link in soup.find_all('a', limit=10):
-            text = link.get_text(strip=True)
-            if text and len(text) > 5 and text not in link_texts:
-                link_texts.append(text)
-        if link_texts:
-            examples.append({"category": "Link Content", "text": link_texts[0]})
+            # Get link text
+            link_texts = []
+            for link in soup.find_all('a', limit=10):
+                text = link.get_text(strip=True)
+                if text and len(text) > 5 and text not in link_texts:
+                    link_texts.append(text)
+            if link_texts:
+                examples.append({"category": "Link Content", "text": link_texts[0]})
         
-        # Show the examples without mentioning HTML structure
-        shown = 0
-        for example in examples:
-            if shown >= 5:  # Limit to 5 examples
-                break
-            text = example["text"]
-            if len(text) > 60:
-                text = text[:60] + "..."
-            print(f"{shown+1}. {example['category']}: {text}")
-            shown += 1
+            # Show the examples without mentioning HTML structure
+            shown = 0
+            for example in examples:
+                if shown >= 5:  # Limit to 5 examples
+                    break
+                text = example["text"]
+                if len(text) > 60:
+                    text = text[:60] + "..."
+                print(f"{shown+1}. {example['category']}: {text}")
+                shown += 1
         
-        if not examples:
-            print("Couldn't extract specific examples. The page may have unusual structure.")
+            if not examples:
+                print("Couldn't extract specific examples. The page may have unusual structure.")
         
-        # Process first page
-        keywords = data_type.lower().split()
-        page_results = process_data_by_type(soup, keywords)
-        all_results.extend(page_results)
-        pages_scraped += 1
+            # Process first page and checkpoint it along with the next page link
+            page_results = process_data_by_type(soup, keywords)
+            next_page_url = find_next_page_link(soup, current_url) if enable_pagination else None
+            crawl_state.complete_page(current_url, page_results, [next_page_url] if next_page_url else [])
+            index_rows(current_url, page_results)
         
-        # Find next page if pagination is enabled
-        if enable_pagination:
-            next_page_url = find_next_page_link(soup, current_url)
         else:
-            next_page_url = None
+            print(f"Resuming from checkpoint: {crawl_state.pages_done()} pages already scraped")
+        
+        pages_scraped = crawl_state.pages_done()
+        next_page_url = crawl_state.next_url() if enable_pagination else None
         
         # Scrape additional pages if available and pagination is enabled
         while enable_pagination and next_page_url and pages_scraped < max_pages:
             # Add a delay between requests to be nice to the server
             time.sleep(random.uniform(1, 3))
             
-            page_results, next_page_url = scrape_page(next_page_url, keywords)
-            all_results.extend(page_results)
-            pages_scraped += 1
+            page_results, found_next_url = scrape_page(next_page_url, keywords)
+            if page_results is None:
+                print("Stopping here - run again to resume from this page.")
+                return crawl_state.results()
+            
+            pages_scraped = crawl_state.complete_page(next_page_url, page_results,
+                                                      [found_next_url] if found_next_url else [])
+            index_rows(next_page_url, page_results)
+            next_page_url = crawl_state.next_url()
             
             print(f"Scraped page {pages_scraped} of {max_pages} maximum")
         
-        return all_results
+        crawl_state.finish()
+        return crawl_state.results()
     
     except Exception as e:
         print(f"Error in scraping process: {str(e)}")
-        return all_results
+        return crawl_state.results()
 
-# Step 2: Ask user what kind of data they want
-data_type = input("\nWhat kind of data do you need from this website? (e.g., 'product prices', 'article titles', 'contact information'): ")
+def main():
+    url = prompt_options()
+    
+    # Step 2: Ask user what kind of data they want
+    data_type = input("\nWhat kind of data do you need from this website? (e.g., 'product prices', 'article titles', 'contact information'): ")
+
+    # Step 3: Start the scraping process
+    print(f"\nScraping for: {data_type}")
+    results = scrape_with_options(url, data_type)
 
-# Step 3: Start the scraping process
-print(f"\nScraping for: {data_type}")
-results = scrape_with_options(url, data_type)
+    # Handle results
+    if not results:
+        print("No data found that matches your request.")
+        exit(1)
 
-# Handle results
-if not results:
-    print("No data found that matches your request.")
-    exit(1)
+    df = pd.DataFrame(results)
+    df.to_excel("scraped_data.xlsx", index=False)
+    print(f"✅ Found {len(results)} items from {pages_scraped} pages. Data saved to 'scraped_data.xlsx'")
+
+    # Print proxy usage summary if enabled
+    if use_proxy:
+        print(f"Proxy servers were used to avoid detection.")
+        for stats in proxy_pool.stats():
+            print(f"  {stats['proxy']}: success {stats['success_rate']:.0%}, latency {stats['latency']}s, ejected: {stats['ejected']}")
+        proxy_pool.close()
 
-df = pd.DataFrame(results)
-df.to_excel("scraped_data.xlsx", index=False)
-print(f"✅ Found {len(results)} items from {pages_scraped} pages. Data saved to 'scraped_data.xlsx'")
 
-# Print proxy usage summary if enabled
-if use_proxy:
-    print(f"Proxy servers were used to avoid detection.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
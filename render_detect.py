@@ -0,0 +1,128 @@
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+
+# Containers SPA frameworks mount into; empty in the static HTML when rendering is client-side
+ROOT_CONTAINER_SELECTORS = ["#root", "#app", "#__next", "#__nuxt", "#svelte", "[data-reactroot]", "app-root"]
+
+# Markers left in the markup by client-side frameworks
+FRAMEWORK_MARKERS = [
+    re.compile(r"__NEXT_DATA__"),
+    re.compile(r"window\.__NUXT__"),
+    re.compile(r"window\.__(INITIAL|PRELOADED|APOLLO)_STATE__"),
+    re.compile(r"\bng-version="),
+    re.compile(r"\bdata-reactroot\b"),
+    re.compile(r"webpackJsonp|__webpack_require__"),
+    re.compile(r"\bdata-v-[0-9a-f]{6,}\b"),
+]
+
+NOSCRIPT_HINT = re.compile(r"(enable|requires?|turn on)\s+javascript|javascript\s+(is\s+)?(required|disabled)", re.IGNORECASE)
+
+# Scoring thresholds
+RENDER_SCORE_THRESHOLD = 3
+MIN_TEXT_LENGTH = 200  # Less visible text than this looks like an unrendered shell
+RICH_TEXT_LENGTH = 1500  # A static page with this much text is usable as-is
+SCRIPT_TEXT_RATIO = 3.0
+DECISION_TTL = 6 * 3600  # Seconds to trust a remembered per-domain decision
+
+INVISIBLE_TAGS = {"script", "style", "noscript", "template", "head", "title", "meta"}
+
+
+def analyze_html(html):
+    """
+    Inspect statically fetched HTML (string or BeautifulSoup) and return
+    (needs_render, signals) where signals explains the verdict.
+    """
+    soup = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, "html.parser")
+    raw = str(soup)
+
+    text_length = sum(
+        len(s.strip()) for s in soup.find_all(string=True)
+        if s.parent is not None and s.parent.name not in INVISIBLE_TAGS
+    )
+    scripts = soup.find_all("script")
+    script_length = sum(len(s.string or "") for s in scripts)
+
+    empty_roots = []
+    for selector in ROOT_CONTAINER_SELECTORS:
+        for el in soup.select(selector):
+            if len(el.get_text(strip=True)) < 20:
+                empty_roots.append(selector)
+    markers = [m.pattern for m in FRAMEWORK_MARKERS if m.search(raw)]
+    noscript_hint = any(NOSCRIPT_HINT.search(n.get_text(" ", strip=True)) for n in soup.find_all("noscript"))
+
+    score = 0
+    if empty_roots:
+        score += 3
+    if noscript_hint:
+        score += 2
+    if scripts and text_length < MIN_TEXT_LENGTH:
+        score += 2
+    if script_length / max(text_length, 1) > SCRIPT_TEXT_RATIO:
+        score += 1
+    if markers:
+        score += 1
+    # Server-rendered framework pages carry their text already
+    if text_length >= RICH_TEXT_LENGTH and not empty_roots:
+        score = 0
+
+    signals = {
+        "score": score,
+        "text_length": text_length,
+        "script_count": len(scripts),
+        "script_length": script_length,
+        "empty_roots": empty_roots,
+        "framework_markers": markers,
+        "noscript_hint": noscript_hint,
+    }
+    return score >= RENDER_SCORE_THRESHOLD, signals
+
+
+class RenderRouter:
+    """Decides static vs browser rendering and remembers the decision per domain"""
+
+    def __init__(self, ttl=DECISION_TTL):
+        self.ttl = ttl
+        self._decisions = {}
+        self._lock = threading.Lock()
+        self.stats = {"static": 0, "rendered": 0, "detections": 0, "remembered": 0}
+
+    @staticmethod
+    def _domain(url):
+        return urlparse(str(url)).netloc.lower()
+
+    def decision(self, url):
+        """Remembered verdict for the URL's domain: True (render), False (static) or None"""
+        with self._lock:
+            entry = self._decisions.get(self._domain(url))
+            if entry is None:
+                return None
+            needs_render, decided_at = entry
+            if time.monotonic() - decided_at > self.ttl:
+                del self._decisions[self._domain(url)]
+                return None
+            return needs_render
+
+    def remember(self, url, needs_render):
+        with self._lock:
+            self._decisions[self._domain(url)] = (needs_render, time.monotonic())
+
+    def needs_render(self, url, html):
+        """Use the remembered domain verdict, or detect from the static HTML and remember it"""
+        remembered = self.decision(url)
+        if remembered is not None:
+            self.stats["remembered"] += 1
+            verdict = remembered
+        else:
+            self.stats["detections"] += 1
+            verdict, _ = analyze_html(html)
+            self.remember(url, verdict)
+        self.stats["rendered" if verdict else "static"] += 1
+        return verdict
+
+
+# Process-wide router shared by the API servers
+render_router = RenderRouter()
@@ -0,0 +1,344 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from urllib.parse import urlparse
+
+import requests
+
+# Retry tuning for idempotent fetches
+MAX_ATTEMPTS = 3
+BASE_DELAY = 0.5  # Seconds; doubled on every attempt before jitter is applied
+MAX_DELAY = 8.0
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# Circuit breaker tuning
+FAILURE_THRESHOLD = 5  # Consecutive failures before a host's circuit opens
+RESET_TIMEOUT = 30  # Seconds an open circuit waits before letting a trial request through
+
+# Hedging: fire a second copy of a slow request after this many seconds (None disables)
+HEDGE_AFTER = 2.0
+
+
+class CircuitOpenError(Exception):
+    """Raised when a host's circuit is open and the call fails fast"""
+
+    def __init__(self, host, retry_in):
+        self.host = host
+        self.retry_in = retry_in
+        super().__init__(f"Circuit open for {host}, retry in {retry_in:.0f}s")
+
+
+class RetryableStatus(Exception):
+    """Wraps a response whose status code is worth retrying"""
+
+    def __init__(self, response):
+        self.response = response
+        super().__init__(f"Retryable status {response.status_code}")
+
+
+# Shared counters for retries, circuits and hedges
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+def record(metric, amount=1):
+    with _metrics_lock:
+        _metrics[metric] += amount
+
+
+def metrics():
+    """Snapshot of the resilience counters plus the current circuit states"""
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    snapshot["open_circuits"] = sorted(host for host, breaker in list(_breakers.items()) if breaker.state != "closed")
+    return snapshot
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open trial -> closed again"""
+
+    def __init__(self, host, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call to this host may go ahead"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == "open" and retry_in <= 0:
+                self.state = "half-open"
+            if self.state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+        record("short_circuited")
+        raise CircuitOpenError(self.host, max(retry_in, 0))
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def release(self):
+        """Free a half-open trial slot without judging the host (e.g. caller-side error)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    record("circuits_opened")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url_or_host):
+    """Return the process-wide breaker for a host"""
+    host = urlparse(url_or_host).netloc or url_or_host
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host)
+            _breakers[host] = breaker
+        return breaker
+
+
+def backoff_delay(attempt, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    """Full-jitter exponential backoff for the given (0-based) retry attempt"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def _is_transient(error):
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, RetryableStatus)) or (
+        type(error).__module__.startswith("httpx") and type(error).__name__ in
+        {"ConnectError", "ConnectTimeout", "ReadTimeout", "ReadError", "RemoteProtocolError", "PoolTimeout"}
+    )
+
+
+def retry(func, attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    """
+    Call func until it succeeds or attempts run out, sleeping with jittered backoff.
+    Only transient errors are retried; a final RetryableStatus returns its response.
+    """
+    for attempt in range(attempts):
+        try:
+            return func()
+        except Exception as e:
+            if not _is_transient(e):
+                raise
+            if attempt == attempts - 1:
+                record("retries_exhausted")
+                if isinstance(e, RetryableStatus):
+                    return e.response
+                raise
+            record("retries")
+            time.sleep(backoff_delay(attempt, base_delay, max_delay))
+
+
+async def retry_async(func, attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    """Async twin of retry() for coroutine functions"""
+    for attempt in range(attempts):
+        try:
+            return await func()
+        except Exception as e:
+            if not _is_transient(e):
+                raise
+            if attempt == attempts - 1:
+                record("retries_exhausted")
+                if isinstance(e, RetryableStatus):
+                    return e.response
+                raise
+            record("retries")
+            await asyncio.sleep(backoff_delay(attempt, base_delay, max_delay))
+
+
+class HedgeTimers:
+    """
+    One thread holding every in-flight request's hedge deadline; a callback runs
+    only if its request is still in flight when the deadline passes.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, delay, callback):
+        entry = [time.monotonic() + delay, next(self._seq), callback]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="hedge-timers", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    def cancel(self, entry):
+        # Dropped lazily when its deadline comes up
+        entry[2] = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                callback = heapq.heappop(self._heap)[2]
+            if callback is not None:
+                callback()
+
+
+_hedge_timers = HedgeTimers()
+
+
+def _run_into(future, func):
+    try:
+        future.set_result(func())
+    except BaseException as e:
+        future.set_exception(e)
+
+
+def hedged(func, hedge_after=HEDGE_AFTER):
+    """
+    Run func in the calling thread and, if it is still in flight after hedge_after
+    seconds, start a second copy in its own thread. The first successful result
+    wins; since the calling thread can't be interrupted, a winning hedge is returned
+    once the first attempt ends (it rescues attempts that stall into a timeout or
+    error). Only use this for idempotent calls.
+    """
+    if not hedge_after:
+        return func()
+    lock = threading.Lock()
+    state = {"in_flight": True, "hedge": None}
+
+    def fire():
+        with lock:
+            if not state["in_flight"]:
+                return
+            hedge = state["hedge"] = Future()
+        record("hedges_fired")
+        threading.Thread(target=_run_into, args=(hedge, func), name="hedge", daemon=True).start()
+
+    timer = _hedge_timers.schedule(hedge_after, fire)
+    result, error = None, None
+    try:
+        result = func()
+    except Exception as e:
+        error = e
+    finally:
+        with lock:
+            state["in_flight"] = False
+            hedge = state["hedge"]
+        _hedge_timers.cancel(timer)
+
+    if hedge is not None and (error is not None or hedge.done()):
+        try:
+            # The hedge finished first, or is the only attempt that can still succeed
+            hedge_result = hedge.result()
+        except Exception:
+            pass
+        else:
+            record("hedges_won")
+            return hedge_result
+    if error is not None:
+        raise error
+    return result
+
+
+async def hedged_async(func, hedge_after=HEDGE_AFTER):
+    """Async twin of hedged(); the losing request is cancelled"""
+    if not hedge_after:
+        return await func()
+    first = asyncio.ensure_future(func())
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    tasks = [first]
+    if not done:
+        record("hedges_fired")
+        tasks.append(asyncio.ensure_future(func()))
+    pending = set(tasks)
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if len(tasks) > 1 and task is tasks[1]:
+                        record("hedges_won")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _guard(url, response_or_error):
+    """Feed one attempt's outcome to the host's breaker"""
+    breaker = get_breaker(url)
+    if isinstance(response_or_error, Exception):
+        if _is_transient(response_or_error):
+            breaker.record_failure()
+        else:
+            breaker.release()
+        return
+    if response_or_error.status_code in RETRYABLE_STATUSES:
+        breaker.record_failure()
+        raise RetryableStatus(response_or_error)
+    breaker.record_success()
+
+
+def resilient_get(url, fetch=None, attempts=MAX_ATTEMPTS, hedge_after=HEDGE_AFTER, **kwargs):
+    """
+    GET a URL with per-host circuit breaking, jittered retries and optional hedging.
+    `fetch` lets callers route through their own transport (e.g. a proxy pool);
+    it defaults to requests.get and receives the url plus kwargs.
+    """
+    fetch = fetch or requests.get
+
+    def attempt():
+        get_breaker(url).before_call()
+        try:
+            response = hedged(lambda: fetch(url, **kwargs), hedge_after)
+        except Exception as e:
+            _guard(url, e)
+            raise
+        _guard(url, response)
+        return response
+
+    return retry(attempt, attempts=attempts)
+
+
+async def resilient_get_async(client, url, attempts=MAX_ATTEMPTS, hedge_after=HEDGE_AFTER, **kwargs):
+    """Async twin of resilient_get() for an httpx.AsyncClient"""
+
+    async def attempt():
+        get_breaker(url).before_call()
+        try:
+            response = await hedged_async(lambda: client.get(url, **kwargs), hedge_after)
+        except Exception as e:
+            _guard(url, e)
+            raise
+        _guard(url, response)
+        return response
+
+    return await retry_async(attempt, attempts=attempts)
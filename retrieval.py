@@ -0,0 +1,265 @@
+import argparse
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from bs4 import BeautifulSoup, Comment
+
+from archive import archive_page
+from llm_cache import chat_url, stem
+from llm_gateway import estimate_tokens
+from render_detect import render_router
+from resilience import resilient_get
+from scrape import scrape_website
+from search_index import B, K1, tokenize
+
+CHUNK_TOKENS = 200  # Target chunk size, in estimated model tokens
+TOP_K = 6
+TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "1500"))  # Page text sent to the model per question
+INDEX_TTL = float(os.getenv("RETRIEVAL_TTL", "300"))  # Seconds a page's index is used before the page is refetched
+MAX_INDEXES = 64  # Pages whose indexes are kept in memory
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36'
+}
+NOISE_TAGS = ["script", "style", "noscript", "template", "svg", "iframe", "head"]
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+INLINE_TAGS = {"a", "abbr", "b", "bdi", "br", "cite", "code", "data", "del", "em", "font", "i", "ins", "kbd", "label",
+               "mark", "q", "s", "samp", "small", "span", "strong", "sub", "sup", "time", "u", "var", "wbr"}
+MIN_COVERAGE = 0.5  # Share of the page text the blocks must keep, else the whole text is used
+SPACE = re.compile(r"\s+")
+
+
+def terms(text):
+    """Search terms of a chunk or question, stemmed so "prices" also finds "Price" """
+    return [stem(t) for t in tokenize(text)]
+
+
+# Function to fetch a page's HTML the way the API does: static first, the browser pool only for JS shells
+def fetch_html(url):
+    if render_router.decision(url):
+        try:
+            return scrape_website(url)
+        except Exception as e:
+            print(f"Rendering failed for {url}, using static HTML: {str(e)}")
+
+    response = resilient_get(url, headers=HEADERS, timeout=15)
+    response.raise_for_status()
+    archive_page(url, response.content, 200, response.headers.get("Content-Type"))
+    if render_router.decision(url) is None and render_router.needs_render(url, response.content):
+        try:
+            return scrape_website(url, static_response=response)
+        except Exception as e:
+            print(f"Rendering failed for {url}, using static HTML: {str(e)}")
+    return response.content
+
+
+def page_blocks(html):
+    """
+    Visible text of a page as (heading, text) blocks in document order, where
+    heading is the nearest heading above the block. Text nodes are grouped by
+    their nearest non-inline element, so div and span cards and the own text of
+    an li wrapping a nested list come through as well as paragraphs.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    for el in soup(NOISE_TAGS):
+        el.decompose()
+    blocks, heading, parts, owner = [], "", [], None
+
+    def flush():
+        text = SPACE.sub(" ", " ".join(parts)).strip()
+        if text:
+            blocks.append((heading, text))
+
+    for string in soup.find_all(string=True):
+        if isinstance(string, Comment) or not string.strip():
+            continue
+        block = next((p for p in string.parents if p.name not in INLINE_TAGS), None)
+        if block is not owner:
+            flush()
+            parts, owner = [], block
+            if block is not None and block.name in HEADING_TAGS:
+                heading = SPACE.sub(" ", block.get_text(" ")).strip()
+        parts.append(string)
+    flush()
+    # Fall back to the whole text when the blocks miss most of it
+    text = SPACE.sub(" ", soup.get_text(" ")).strip()
+    if text and sum(len(t) for _, t in blocks) < len(text) * MIN_COVERAGE:
+        blocks = [("", text)]
+    return blocks
+
+
+def chunk_blocks(blocks, chunk_tokens=CHUNK_TOKENS):
+    """Pack consecutive blocks into chunks of about chunk_tokens, splitting oversized blocks on sentences"""
+    chunks, current, size, current_heading = [], [], 0, ""
+
+    def flush():
+        if current:
+            body = " ".join(current)
+            chunks.append(f"{current_heading}: {body}" if current_heading and current_heading != current[0] else body)
+
+    for heading, text in blocks:
+        pieces = [text]
+        if estimate_tokens(text) > chunk_tokens:
+            pieces, piece = [], ""
+            for sentence in re.split(r"(?<=[.!?])\s+", text):
+                if piece and estimate_tokens(piece + " " + sentence) > chunk_tokens:
+                    pieces.append(piece)
+                    piece = ""
+                piece = f"{piece} {sentence}".strip()
+            pieces.append(piece)
+        for piece in pieces:
+            if current and (heading != current_heading or size + estimate_tokens(piece) > chunk_tokens):
+                flush()
+                current, size = [], 0
+            if not current:
+                current_heading = heading
+            current.append(piece)
+            size += estimate_tokens(piece)
+    flush()
+    return chunks
+
+
+class PageIndex:
+    """BM25 index over one page's text chunks"""
+
+    def __init__(self, url, chunks, fingerprint):
+        self.url = url
+        self.chunks = chunks
+        self.fingerprint = fingerprint
+        self.built = time.time()
+        self._postings = defaultdict(list)
+        self._lengths = []
+        for i, chunk in enumerate(chunks):
+            tokens = terms(chunk)
+            self._lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self._postings[term].append((i, tf))
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 1.0
+
+    @classmethod
+    def from_html(cls, url, html):
+        chunks = chunk_blocks(page_blocks(html))
+        fingerprint = hashlib.sha256("\n".join(chunks).encode("utf-8")).hexdigest()
+        return cls(url, chunks, fingerprint)
+
+    def scores(self, question):
+        scores = defaultdict(float)
+        for term in set(terms(question)):
+            postings = self._postings.get(term, [])
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.chunks) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                norm = K1 * (1 - B + B * self._lengths[i] / self._avg_length)
+                scores[i] += idf * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+    def top_chunks(self, question, k=TOP_K, budget=TOKEN_BUDGET):
+        """
+        Best-scoring chunks that fit in the token budget, returned in page order.
+        Questions that match nothing (e.g. "summarize this") get the start of the page.
+        """
+        scores = self.scores(question)
+        ranked = sorted(scores, key=lambda i: (-scores[i], i)) if scores else range(len(self.chunks))
+        picked, used = [], 0
+        for i in ranked:
+            cost = estimate_tokens(self.chunks[i])
+            if used + cost > budget:
+                continue
+            picked.append(i)
+            used += cost
+            if len(picked) == k:
+                break
+        return [(i, self.chunks[i], round(scores.get(i, 0.0), 4)) for i in sorted(picked)]
+
+
+def build_prompt(question, url, chunks):
+    """Grounded prompt: the question plus only the retrieved excerpts of the page"""
+    excerpts = "\n\n".join(f"[{n}] {text}" for n, (_, text, _) in enumerate(chunks, 1))
+    return (
+        "Answer the question using only the excerpts from the web page below. "
+        "If they don't contain the answer, say so instead of guessing.\n\n"
+        f"Page: {url}\n\nExcerpts:\n{excerpts}\n\nQuestion: {question}"
+    )
+
+
+class IndexCache:
+    """Per-URL page indexes, kept for INDEX_TTL and least-recently-used beyond MAX_INDEXES"""
+
+    def __init__(self, ttl=INDEX_TTL, max_indexes=MAX_INDEXES, fetch=fetch_html):
+        self.ttl = ttl
+        self.max_indexes = max_indexes
+        self.fetch = fetch
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()
+        self.stats = {"hits": 0, "builds": 0, "unchanged": 0, "failures": 0}
+
+    def get(self, url):
+        """Index of the page at url, refetched once it is older than the TTL (raises if the fetch fails)"""
+        # Keyed like the answer cache, so a URL typed without a scheme is fetched over https
+        url = chat_url(url)
+        with self._lock:
+            index = self._indexes.get(url)
+            if index is not None:
+                self._indexes.move_to_end(url)
+        if index is not None and time.time() - index.built < self.ttl:
+            self.stats["hits"] += 1
+            return index
+
+        try:
+            fresh = PageIndex.from_html(url, self.fetch(url))
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        if index is not None and fresh.fingerprint == index.fingerprint:
+            self.stats["unchanged"] += 1
+        self.stats["builds"] += 1
+        with self._lock:
+            self._indexes[url] = fresh
+            self._indexes.move_to_end(url)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        return fresh
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_index_cache():
+    """Process-wide page index cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = IndexCache()
+        return _cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show which parts of a page would be sent to the model for a question")
+    parser.add_argument("url")
+    parser.add_argument("question")
+    parser.add_argument("-k", "--top-k", type=int, default=TOP_K)
+    parser.add_argument("--budget", type=int, default=TOKEN_BUDGET, help="Token budget for page excerpts")
+    parser.add_argument("--html", help="Read the page from this file instead of fetching it")
+    args = parser.parse_args()
+
+    if args.html:
+        with open(args.html, "rb") as f:
+            index = PageIndex.from_html(args.url, f.read())
+    else:
+        index = get_index_cache().get(args.url)
+    chunks = index.top_chunks(args.question, args.top_k, args.budget)
+    prompt = build_prompt(args.question, args.url, chunks)
+    print(f"{len(index.chunks)} chunks, {sum(estimate_tokens(c) for c in index.chunks)} tokens on the page; "
+          f"sending {len(chunks)} chunks, about {estimate_tokens(prompt)} tokens\n")
+    print(prompt)
+
+
+if __name__ == "__main__":
+    main()
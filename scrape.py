@@ -1,25 +1,29 @@
-import time
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
+from browser_pool import get_browser_pool
+from resilience import resilient_get
+from snapshot_cache import get_snapshot_cache
 
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36'
+}
 
-def scrape_website(website):
-    print("Launching Chrome...")  # Fixed typo
-    
-    chrome_driver_path = "./chromedriver.exe"  # Removed trailing space
-    
-    options = webdriver.ChromeOptions()
-    driver = webdriver.Chrome(service=Service(chrome_driver_path), options=options)
-    
-    try:
-        driver.get(website)
-        print("Website opened successfully.")
-        
-        html = driver.page_source
-        time.sleep(10)
-        
+
+def scrape_website(website, wait_for_selector=None, use_cache=True, static_response=None):
+    """Rendered HTML; static_response is the page's static fetch if the caller already made one"""
+    def render():
+        # Render in a warm pooled Chrome instead of launching (and sleeping in) a fresh one
+        html = get_browser_pool().render(website, wait_for_selector=wait_for_selector)
+        print("Website rendered successfully.")
         return html
-    
-    finally:
-        driver.quit()
-        print("Chrome closed.")
+
+    if not use_cache:
+        return render()
+
+    # Reuse a cached snapshot when the page hasn't changed; a conditional static
+    # fetch is far cheaper than a re-render
+    def static_fetch(conditional_headers):
+        return resilient_get(website, headers={**HEADERS, **conditional_headers}, timeout=10)
+
+    return get_snapshot_cache().render(
+        website, render, options={"wait_for_selector": wait_for_selector}, static_fetch=static_fetch,
+        static_response=static_response,
+    )
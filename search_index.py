@@ -0,0 +1,353 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+SEARCH_DB = os.getenv("SEARCH_DB", ".cache/search.db")
+K1 = 1.2
+B = 0.75
+MAX_SEGMENTS = 8  # A term's postings are merged back into one segment past this many
+CACHE_BYTES = int(os.getenv("SEARCH_CACHE_BYTES", str(64 * 1024 * 1024)))  # Decoded postings kept in memory
+SNIPPET_CHARS = 300
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was were will with".split()
+)
+DTYPES = [np.dtype("<u1"), np.dtype("<u2"), np.dtype("<u4"), np.dtype("<u8")]
+DTYPE_LIMITS = [np.iinfo(dtype).max for dtype in DTYPES]
+ARRAY_TYPECODES = ["B", "H", "I", "Q"]
+SMALL_ARRAY = 64
+
+
+def tokenize(text):
+    return [t for t in TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def encode_array(values, delta=False):
+    """
+    Pack non-negative integers into the narrowest unsigned dtype that fits, with a
+    one-byte dtype header; with delta=True, sorted IDs are stored as gaps.
+    """
+    if len(values) < SMALL_ARRAY:
+        # Most terms get a handful of postings per batch; numpy overhead dominates there
+        values = [int(v) for v in values]
+        if delta:
+            values = [b - a for a, b in zip([0] + values, values)]
+        peak = max(values, default=0)
+        code = next(i for i, limit in enumerate(DTYPE_LIMITS) if peak <= limit)
+        return bytes([code]) + array(ARRAY_TYPECODES[code], values).tobytes()
+    values = np.asarray(values, dtype=np.int64)
+    if delta:
+        values = np.diff(values, prepend=0)
+    peak = int(values.max())
+    code = next(i for i, limit in enumerate(DTYPE_LIMITS) if peak <= limit)
+    return bytes([code]) + values.astype(DTYPES[code]).tobytes()
+
+
+def decode_array(data, delta=False):
+    values = np.frombuffer(data, dtype=DTYPES[data[0]], offset=1)
+    return np.cumsum(values, dtype=np.int64) if delta else values.astype(np.float32)
+
+
+def top_k(scores, k, ids=None):
+    """
+    Positions of the k best scores, best first (newest doc ID first on ties).
+    A threshold taken from a sample prunes most candidates before the exact selection.
+    """
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.arange(len(scores))
+    if len(scores) > 50000:
+        sample = np.sort(scores[::97])
+        threshold = sample[max(len(sample) - 4 * k, 0)]
+        pruned = np.flatnonzero(scores >= threshold)
+        if len(pruned) >= k:
+            candidates = pruned
+    if len(candidates) > k:
+        kth = scores[candidates][np.argpartition(scores[candidates], len(candidates) - k)[-k:]].min()
+        # Keep every candidate tied with the k-th score so pages stay stable across offsets
+        candidates = candidates[scores[candidates] >= kth]
+    tiebreak = ids[candidates] if ids is not None else candidates
+    return candidates[np.lexsort((-tiebreak, -scores[candidates]))][:k]
+
+
+def row_text(row):
+    """Searchable text of an extracted row: its Text, or all its string values"""
+    if row.get("Text"):
+        return str(row["Text"])
+    return " ".join(str(v) for v in row.values() if isinstance(v, str))
+
+
+class SearchIndex:
+    """
+    Incremental BM25 inverted index over extracted rows. Each add() writes one new
+    postings segment per term (delta-encoded doc IDs + term frequencies); queries
+    decode and score postings with numpy. Several processes may share the DB: IDs
+    are allocated inside the write transaction and other writers' docs are picked
+    up before each query.
+    """
+
+    def __init__(self, path=SEARCH_DB, cache_bytes=CACHE_BYTES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.cache_bytes = cache_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                label TEXT,
+                text TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                seg INTEGER NOT NULL,
+                ids BLOB NOT NULL,
+                tfs BLOB NOT NULL,
+                PRIMARY KEY (term, seg)
+            ) WITHOUT ROWID;
+        """)
+        self._db.commit()
+
+        # Indexed by doc ID; IDs are assigned sequentially so this stays dense
+        self._lengths = np.zeros(1024, dtype=np.uint32)
+        self._doc_count = 0
+        self._total_length = 0
+        self._last_id = 0
+        self._last_seg = 0
+        self._data_version = None
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self.stats = {"documents": 0, "queries": 0, "cache_hits": 0, "cache_misses": 0, "merges": 0}
+        with self._lock:
+            self._sync()
+
+    @contextmanager
+    def _write(self):
+        """Write transaction holding the DB's write lock from the start, so ID allocation can't race other processes"""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self._db.commit()
+        except BaseException:
+            self._db.rollback()
+            raise
+
+    def _sync(self):
+        """
+        Load lengths of docs added by other processes sharing the DB and drop cached
+        postings of terms they wrote. Caller holds the lock.
+        """
+        (version,) = self._db.execute("PRAGMA data_version").fetchone()
+        if version == self._data_version:
+            return
+        self._data_version = version
+        # One read snapshot, so docs and postings from a commit landing mid-sync are seen together or not at all
+        snapshot = not self._db.in_transaction
+        if snapshot:
+            self._db.execute("BEGIN")
+        try:
+            self._load_new()
+        finally:
+            if snapshot:
+                self._db.commit()
+
+    def _load_new(self):
+        new = np.array(self._db.execute("SELECT id, length FROM docs WHERE id > ? ORDER BY id", (self._last_id,)).fetchall(),
+                       dtype=np.int64).reshape(-1, 2)
+        if len(new):
+            self._grow(int(new[-1, 0]))
+            self._lengths[new[:, 0]] = new[:, 1]
+            self._doc_count += len(new)
+            self._total_length += int(new[:, 1].sum())
+            self._last_id = int(new[-1, 0])
+            self.stats["documents"] = self._doc_count
+        for (term,) in self._db.execute("SELECT DISTINCT term FROM postings WHERE seg > ?", (self._last_seg,)):
+            self._evict(term)
+        (self._last_seg,) = self._db.execute("SELECT COALESCE(MAX(seg), 0) FROM postings").fetchone()
+
+    def _grow(self, doc_id):
+        if doc_id >= len(self._lengths):
+            grown = np.zeros(doc_id * 2, dtype=np.uint32)
+            grown[:len(self._lengths)] = self._lengths
+            self._lengths = grown
+
+    def add(self, url, rows, created=None):
+        """Index a finished extraction's rows; each row becomes one searchable document"""
+        created = created if created is not None else time.time()
+        docs = []
+        postings = defaultdict(lambda: ([], []))
+        for row in rows:
+            text = row_text(row)
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            # Offsets within this batch; the first doc ID is only known inside the transaction
+            for term, tf in Counter(tokens).items():
+                offsets, tfs = postings[term]
+                offsets.append(len(docs))
+                tfs.append(tf)
+            docs.append((str(url), row.get("Type") or row.get("Tag"), text, len(tokens), created))
+        if not docs:
+            return 0
+
+        with self._lock, self._write():
+            self._sync()
+            (first_id,) = self._db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM docs").fetchone()
+            (seg,) = self._db.execute("SELECT COALESCE(MAX(seg), 0) + 1 FROM postings").fetchone()
+            self._db.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?, ?)",
+                                 [(first_id + i, *doc) for i, doc in enumerate(docs)])
+            self._db.executemany(
+                "INSERT INTO postings VALUES (?, ?, ?, ?)",
+                [(term, seg, encode_array([first_id + i for i in offsets], delta=True), encode_array(tfs))
+                 for term, (offsets, tfs) in postings.items()],
+            )
+            merged = self._merge_segments(list(postings), seg)
+
+            last_id = first_id + len(docs) - 1
+            self._grow(last_id)
+            self._lengths[first_id:last_id + 1] = [doc[3] for doc in docs]
+            self._doc_count += len(docs)
+            self._total_length += sum(doc[3] for doc in docs)
+            self._last_id = last_id
+            self._last_seg = seg
+            self.stats["documents"] = self._doc_count
+            self.stats["merges"] += merged
+            for term in postings:
+                self._evict(term)
+        return len(docs)
+
+    def _merge_segments(self, terms, seg):
+        """Fold terms with too many small segments back into one (inside add's transaction)"""
+        crowded = []
+        for i in range(0, len(terms), 500):
+            chunk = terms[i:i + 500]
+            crowded += [term for (term,) in self._db.execute(
+                f"SELECT term FROM postings WHERE term IN ({','.join('?' for _ in chunk)}) "
+                "GROUP BY term HAVING COUNT(*) > ?", chunk + [MAX_SEGMENTS],
+            )]
+        for term in crowded:
+            ids, tfs = self._read_postings(term)
+            self._db.execute("DELETE FROM postings WHERE term = ?", (term,))
+            self._db.execute("INSERT INTO postings VALUES (?, ?, ?, ?)",
+                             (term, seg, encode_array(ids, delta=True), encode_array(tfs)))
+        return len(crowded)
+
+    def _read_postings(self, term):
+        segments = self._db.execute("SELECT ids, tfs FROM postings WHERE term = ? ORDER BY seg", (term,)).fetchall()
+        if not segments:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = np.concatenate([decode_array(s[0], delta=True) for s in segments])
+        tfs = np.concatenate([decode_array(s[1]) for s in segments])
+        return ids, tfs
+
+    def _evict(self, term):
+        entry = self._cache.pop(term, None)
+        if entry is not None:
+            self._cache_size -= entry[0].nbytes + entry[1].nbytes
+
+    def _postings(self, term):
+        entry = self._cache.get(term)
+        if entry is not None:
+            self._cache.move_to_end(term)
+            self.stats["cache_hits"] += 1
+            return entry
+        self.stats["cache_misses"] += 1
+        entry = self._read_postings(term)
+        self._cache[term] = entry
+        self._cache_size += entry[0].nbytes + entry[1].nbytes
+        while self._cache_size > self.cache_bytes and len(self._cache) > 1:
+            _, (ids, tfs) = self._cache.popitem(last=False)
+            self._cache_size -= ids.nbytes + tfs.nbytes
+        return entry
+
+    def search(self, query, limit=10, offset=0):
+        """BM25-ranked rows matching any query term"""
+        start = time.perf_counter()
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            self._sync()
+            self.stats["queries"] += 1
+            doc_count = self._doc_count
+            avg_length = self._total_length / doc_count if doc_count else 1.0
+            matches = []
+            for term in terms:
+                ids, tfs = self._postings(term)
+                if len(ids) and ids[-1] > self._last_id:
+                    # Written by another process after the sync; counted from the next query on
+                    keep = ids <= self._last_id
+                    ids, tfs = ids[keep], tfs[keep]
+                if not len(ids):
+                    continue
+                idf = math.log(1 + (doc_count - len(ids) + 0.5) / (len(ids) + 0.5))
+                norm = np.float32(K1 * (1 - B)) + np.float32(K1 * B / avg_length) * self._lengths[ids]
+                matches.append((ids, np.float32(idf * (K1 + 1)) * tfs / (tfs + norm)))
+            if len(matches) > 1:
+                # Dense accumulator indexed by doc ID; IDs are unique within one term's postings
+                dense = np.zeros(self._last_id + 1, dtype=np.float32)
+                for ids, term_scores in matches:
+                    dense[ids] += term_scores
+
+        if not matches:
+            return {"query": query, "total": 0, "took_ms": round((time.perf_counter() - start) * 1000, 2), "items": []}
+        if len(matches) == 1:
+            ids, scores = matches[0]
+            total = len(ids)
+            top = top_k(scores, offset + limit, ids)[offset:]
+            top_ids, top_scores = ids[top], scores[top]
+        else:
+            total = int(np.count_nonzero(dense))
+            top_ids = top_k(dense, min(offset + limit, total))[offset:]
+            top_scores = dense[top_ids]
+
+        hits = {int(i): float(s) for i, s in zip(top_ids, top_scores)}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, url, label, text, created FROM docs WHERE id IN ({','.join('?' for _ in hits)})",
+                list(hits),
+            ).fetchall() if hits else []
+        by_id = {row[0]: row for row in rows}
+        items = []
+        for doc_id, score in hits.items():
+            _, url, label, text, created = by_id[doc_id]
+            items.append({"id": doc_id, "score": round(score, 4), "url": url, "label": label,
+                          "text": text[:SNIPPET_CHARS], "created": created})
+        return {"query": query, "total": total, "took_ms": round((time.perf_counter() - start) * 1000, 2),
+                "items": items}
+
+    def close(self):
+        self._db.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """Process-wide search index"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SearchIndex()
+        return _index
+
+
+def index_rows(url, rows):
+    """Add rows to the process-wide index; failures are logged, not raised, so the scrape itself still succeeds"""
+    try:
+        return get_search_index().add(url, rows)
+    except Exception as e:
+        print(f"Search indexing failed for {url}: {str(e)}")
+        return 0
@@ -0,0 +1,170 @@
+"""
+Sitemap-driven URL discovery: robots.txt -> sitemap indexes -> page URLs,
+parsed as a stream so multi-million-entry sitemaps never sit in memory.
+"""
+import gzip
+import io
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urljoin, urlsplit
+from xml.etree.ElementTree import iterparse
+
+from resilience import resilient_get
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+SITEMAP_STATE_DB = os.getenv("SITEMAP_STATE_DB", ".cache/sitemap_state.db")
+MAX_INDEX_DEPTH = 4  # Sitemap indexes may nest; stop following them past this
+FETCH_TIMEOUT = 30
+
+
+def open_stream(url):
+    """Open a URL as a binary stream, transparently un-gzipping .gz sitemaps"""
+    # No hedging: a duplicate streamed request would be left dangling
+    response = resilient_get(url, headers=HEADERS, timeout=FETCH_TIMEOUT, stream=True, hedge_after=None)
+    response.raise_for_status()
+    response.raw.decode_content = True  # Content-Encoding: gzip
+    response.raw.auto_close = False  # Keep buffered bytes readable after the body hits EOF
+    stream = io.BufferedReader(response.raw)
+    if stream.peek(2)[:2] == b"\x1f\x8b":  # The file itself is gzipped
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+
+def site_root(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def sitemaps_from_robots(site_url):
+    """Sitemap URLs declared in robots.txt, falling back to /sitemap.xml"""
+    root = site_root(site_url)
+    sitemaps = []
+    try:
+        response = resilient_get(urljoin(root, "/robots.txt"), headers=HEADERS, timeout=FETCH_TIMEOUT)
+        if response.status_code == 200:
+            for line in response.text.splitlines():
+                key, _, value = line.partition(":")
+                if key.strip().lower() == "sitemap" and value.strip():
+                    sitemaps.append(urljoin(root, value.strip()))
+    except Exception as e:
+        print(f"Could not read robots.txt for {root}: {e}")
+    return sitemaps or [urljoin(root, "/sitemap.xml")]
+
+
+def parse_lastmod(value):
+    """
+    Parse a W3C datetime into an aware UTC datetime, or None.
+    Date-only values count as the end of that day so same-day changes aren't missed.
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        if len(value) <= 10:
+            parts = [int(p) for p in value.split("-")] + [1, 1]
+            day = datetime(parts[0], parts[1], parts[2], tzinfo=timezone.utc)
+            return day + timedelta(days=1) - timedelta(microseconds=1)
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def iter_entries(stream):
+    """
+    Stream (kind, loc, lastmod) from a sitemap or sitemap index, where kind is
+    "url" or "sitemap". Parsed elements are discarded as soon as they're read.
+    """
+    context = iterparse(stream, events=("start", "end"))
+    root = None
+    loc = lastmod = None
+    for event, elem in context:
+        if root is None:
+            root = elem
+        if event != "end":
+            continue
+        tag = _local(elem.tag)
+        if tag == "loc":
+            loc = (elem.text or "").strip()
+        elif tag == "lastmod":
+            lastmod = elem.text
+        elif tag in ("url", "sitemap"):
+            if loc:
+                yield tag, loc, parse_lastmod(lastmod)
+            loc = lastmod = None
+            root.clear()
+
+
+def discover_urls(site_url, since=None, opener=open_stream, stats=None):
+    """
+    Yield page URLs from a site's sitemaps, lazily. With `since` (aware datetime),
+    entries whose lastmod is older are skipped, as are whole child sitemaps the
+    index says haven't changed. Entries without a lastmod are always yielded.
+    """
+    stats = stats if stats is not None else {}
+    for key in ("sitemaps", "urls", "skipped", "failed"):
+        stats.setdefault(key, 0)
+    seen_sitemaps = set()
+
+    def walk(sitemap_url, depth):
+        if sitemap_url in seen_sitemaps or depth > MAX_INDEX_DEPTH:
+            return
+        seen_sitemaps.add(sitemap_url)
+        try:
+            stream = opener(sitemap_url)
+        except Exception as e:
+            stats["failed"] += 1
+            print(f"Could not fetch sitemap {sitemap_url}: {e}")
+            return
+        stats["sitemaps"] += 1
+        with stream:
+            try:
+                for kind, loc, lastmod in iter_entries(stream):
+                    if since is not None and lastmod is not None and lastmod < since:
+                        stats["skipped"] += 1
+                        continue
+                    if kind == "sitemap":
+                        yield from walk(urljoin(sitemap_url, loc), depth + 1)
+                    else:
+                        stats["urls"] += 1
+                        yield loc
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"Could not parse sitemap {sitemap_url}: {e}")
+
+    for sitemap_url in sitemaps_from_robots(site_url):
+        yield from walk(sitemap_url, 0)
+
+
+class SitemapState:
+    """When each site's sitemaps were last fully scraped, for lastmod filtering"""
+
+    def __init__(self, path=SITEMAP_STATE_DB):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS sites (site TEXT PRIMARY KEY, last_run REAL NOT NULL)")
+        self._db.commit()
+
+    def last_run(self, site_url):
+        row = self._db.execute("SELECT last_run FROM sites WHERE site = ?", (site_root(site_url),)).fetchone()
+        return datetime.fromtimestamp(row[0], tz=timezone.utc) if row else None
+
+    def mark_run(self, site_url, started=None):
+        """Record a completed run; pass the time it started so changes made during it are caught next time"""
+        self._db.execute("INSERT OR REPLACE INTO sites VALUES (?, ?)",
+                         (site_root(site_url), started if started is not None else time.time()))
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,231 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_CACHE_DIR", ".cache/snapshots")
+SNAPSHOT_TTL = 15 * 60  # Seconds a snapshot is served without revalidation
+MAX_AGE = 7 * 24 * 3600  # Stale snapshots older than this are dropped, not revalidated
+MAX_BYTES = 512 * 1024 * 1024  # Compressed size budget on disk
+MAX_ENTRIES = 20000
+
+
+def body_hash(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8", "replace")
+    return hashlib.sha256(content).hexdigest()
+
+
+class SnapshotCache:
+    """
+    Compressed on-disk cache of rendered HTML keyed by URL plus render options.
+    Fresh snapshots are served directly; stale ones are revalidated with a cheap
+    conditional static fetch before paying for another render.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, ttl=SNAPSHOT_TTL, max_age=MAX_AGE,
+                 max_bytes=MAX_BYTES, max_entries=MAX_ENTRIES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                static_hash TEXT
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_accessed ON snapshots (accessed)")
+        self._db.commit()
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    @staticmethod
+    def key(url, options=None):
+        raw = json.dumps([str(url), options or {}], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.html.gz")
+
+    def get(self, url, options=None):
+        """Return the cached entry (metadata dict with 'html') or None, ignoring freshness"""
+        key = self.key(url, options)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT created, etag, last_modified, static_hash FROM snapshots WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            with gzip.open(self._path(key), "rt", encoding="utf-8") as f:
+                html = f.read()
+        except OSError:
+            self._delete(key)
+            return None
+        created, etag, last_modified, static_hash = row
+        return {"key": key, "html": html, "created": created, "etag": etag,
+                "last_modified": last_modified, "static_hash": static_hash}
+
+    def put(self, url, html, options=None, static_response=None):
+        key = self.key(url, options)
+        path = self._path(key)
+        # A temp file of our own, so concurrent renders of one key never write the same file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8", compresslevel=6) as f:
+                f.write(html)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        etag, last_modified, static_hash = self._validators(static_response)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, str(url), os.path.getsize(path), now, now, etag, last_modified, static_hash),
+            )
+            self._db.commit()
+        self._evict()
+
+    @staticmethod
+    def _validators(response):
+        if response is None:
+            return None, None, None
+        return (response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                body_hash(response.content))
+
+    def _touch(self, key, refresh=False):
+        now = time.time()
+        with self._lock:
+            if refresh:
+                self._db.execute("UPDATE snapshots SET accessed = ?, created = ? WHERE key = ?", (now, now, key))
+            else:
+                self._db.execute("UPDATE snapshots SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+
+    def _delete(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM snapshots WHERE key = ?", (key,))
+            self._db.commit()
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Drop over-age snapshots, then least recently used ones until within budget"""
+        with self._lock:
+            expired = [k for (k,) in self._db.execute(
+                "SELECT key FROM snapshots WHERE created < ?", (time.time() - self.max_age,))]
+            total_bytes, count = self._db.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM snapshots").fetchone()
+            victims = []
+            if total_bytes > self.max_bytes or count > self.max_entries:
+                for key, size in self._db.execute("SELECT key, size FROM snapshots ORDER BY accessed"):
+                    if total_bytes <= self.max_bytes and count <= self.max_entries:
+                        break
+                    victims.append(key)
+                    total_bytes -= size
+                    count -= 1
+        for key in set(expired + victims):
+            self._delete(key)
+            self.stats["evictions"] += 1
+
+    @staticmethod
+    def matches(entry, response):
+        """True if a static response shows the page unchanged since the snapshot"""
+        if entry["etag"] and response.headers.get("ETag") == entry["etag"]:
+            return True
+        return entry["static_hash"] is not None and body_hash(response.content) == entry["static_hash"]
+
+    def is_unchanged(self, entry, static_fetch):
+        """Cheap freshness check: conditional static fetch compared against stored validators"""
+        if not (entry["etag"] or entry["last_modified"] or entry["static_hash"]):
+            # Nothing to compare against; the fetch could only ever fail
+            return False, None
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            response = static_fetch(headers)
+        except Exception:
+            return False, None
+        if response.status_code == 304:
+            return True, None
+        if response.status_code != 200:
+            return False, None
+        return self.matches(entry, response), response
+
+    def render(self, url, render_func, options=None, static_fetch=None, static_response=None):
+        """
+        Return rendered HTML for url, rendering with render_func() only when there
+        is no fresh snapshot and revalidation fails. static_response is the page's
+        static fetch if the caller already made one; it is used for revalidation and
+        as the new snapshot's validators, so static_fetch(headers) isn't called.
+        """
+        if static_response is not None and static_response.status_code != 200:
+            static_response = None
+        entry = self.get(url, options)
+        if entry is not None:
+            age = time.time() - entry["created"]
+            if age < self.ttl:
+                self._touch(entry["key"])
+                self.stats["hits"] += 1
+                return entry["html"]
+            if age >= self.max_age:
+                # Too old to revalidate; render afresh
+                self._delete(entry["key"])
+                self.stats["expired"] += 1
+                entry = None
+        if entry is not None:
+            if static_response is not None:
+                unchanged = self.matches(entry, static_response)
+            elif static_fetch is not None:
+                unchanged, static_response = self.is_unchanged(entry, static_fetch)
+            else:
+                unchanged = False
+            if unchanged:
+                self._touch(entry["key"], refresh=True)
+                self.stats["revalidated"] += 1
+                return entry["html"]
+
+        self.stats["misses"] += 1
+        # Validators are recorded only from a static response already at hand (the
+        # caller's, or the failed revalidation's); a miss costs no extra request
+        if static_response is not None and static_response.status_code != 200:
+            static_response = None
+        html = render_func()
+        self.put(url, html, options, static_response)
+        return html
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_snapshot_cache():
+    """Process-wide snapshot cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SnapshotCache()
+        return _cache
@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest
+
+import browser_pool
+from browser_pool import BrowserPool, RenderTimeout
+
+
+class FakeDriver:
+    """Stands in for a Selenium driver: a complete page whose resource count the test controls"""
+
+    def __init__(self):
+        self.current_url = "about:blank"
+        self.page_source = ""
+        self.quit_called = False
+        self.new_resources = []
+
+    def get(self, url):
+        self.current_url = url
+        self.page_source = f"<html>{url}</html>"
+
+    def delete_all_cookies(self):
+        pass
+
+    def execute_script(self, script):
+        if script == browser_pool.READY_STATE_JS:
+            return "complete"
+        return self.new_resources.pop(0) if self.new_resources else 0
+
+    def find_elements(self, by, selector):
+        return [object()]
+
+    def quit(self):
+        self.quit_called = True
+
+
+class BrowserPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.drivers = []
+        self._idle_seconds = browser_pool.NETWORK_IDLE_SECONDS
+        browser_pool.NETWORK_IDLE_SECONDS = 0.05
+
+    def tearDown(self):
+        browser_pool.NETWORK_IDLE_SECONDS = self._idle_seconds
+
+    def factory(self):
+        driver = FakeDriver()
+        self.drivers.append(driver)
+        return driver
+
+    def test_warm_up_starts_every_browser_once(self):
+        pool = BrowserPool(size=3, driver_factory=self.factory)
+        pool.warm_up()
+        self.assertEqual(pool.stats["browsers_started"], 3)
+        for _ in range(6):
+            pool.render("https://example.com")
+        self.assertEqual(pool.stats["browsers_started"], 3)
+
+    def test_browser_is_reused_between_renders(self):
+        pool = BrowserPool(size=2, driver_factory=self.factory)
+        self.assertEqual(pool.render("https://example.com/a"), "<html>https://example.com/a</html>")
+        pool.render("https://example.com/b")
+        self.assertEqual(len(self.drivers), 1)
+
+    def test_browser_recycled_after_max_uses(self):
+        pool = BrowserPool(size=1, driver_factory=self.factory, max_uses=2)
+        for _ in range(5):
+            pool.render("https://example.com")
+        self.assertEqual(pool.stats["browsers_recycled"], 2)
+        self.assertEqual(len(self.drivers), 3)
+        self.assertTrue(all(d.quit_called for d in self.drivers[:2]))
+        self.assertFalse(self.drivers[2].quit_called)
+
+    def test_broken_browser_is_discarded(self):
+        pool = BrowserPool(size=1, driver_factory=self.factory)
+        pool.render("https://example.com")
+        self.drivers[0].get = lambda url: (_ for _ in ()).throw(RuntimeError("tab crashed"))
+        with self.assertRaises(RuntimeError):
+            pool.render("https://example.com")
+        self.assertTrue(self.drivers[0].quit_called)
+        pool.render("https://example.com")
+        self.assertEqual(len(self.drivers), 2)
+
+    def test_checkout_waits_for_a_free_browser(self):
+        pool = BrowserPool(size=1, driver_factory=self.factory)
+        driver = pool._acquire()
+        with self.assertRaises(RenderTimeout):
+            pool._acquire(timeout=0.05)
+        threading.Timer(0.05, pool._release, args=(driver,)).start()
+        self.assertIs(pool._acquire(timeout=1), driver)
+
+    def test_network_idle_waits_for_requests_to_stop(self):
+        pool = BrowserPool(size=1, driver_factory=self.factory)
+        pool.warm_up()
+        self.drivers[0].new_resources = [300, 40, 12, 0]
+        started = time.monotonic()
+        pool.render("https://example.com")
+        # Each sample with new requests restarts the idle timer
+        self.assertGreaterEqual(time.monotonic() - started, 3 * browser_pool.POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import llm_cache
+from llm_cache import LLMCache
+
+URL = "https://shop.example/items"
+
+
+class AnswerCacheEvictionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "llm_cache.db")
+        self.cache = LLMCache(self.path, memory_entries=4, max_entries=100)
+        self.addCleanup(self.cache.close)
+
+    def put(self, cache, i):
+        cache.put(f"question number {i} about widgets", URL, "fp", f"answer {i}", 1.0)
+
+    def disk_count(self):
+        (count,) = self.cache._db.execute("SELECT COUNT(*) FROM answers").fetchone()
+        return count
+
+    def test_eviction_trims_in_one_batch(self):
+        for i in range(100):
+            self.put(self.cache, i)
+        self.assertEqual(self.cache.stats["evictions"], 0)
+        self.put(self.cache, 100)
+        self.assertEqual(self.disk_count(), int(100 * llm_cache.EVICT_TO))
+        self.assertEqual(self.cache.stats["evictions"], 101 - int(100 * llm_cache.EVICT_TO))
+        # Room was made for several more stores before the next eviction
+        evictions = self.cache.stats["evictions"]
+        for i in range(101, 106):
+            self.put(self.cache, i)
+        self.assertEqual(self.cache.stats["evictions"], evictions)
+        self.assertEqual(self.cache.metrics()["disk_entries"], self.disk_count())
+
+    def test_least_recently_used_answers_go_first(self):
+        for i in range(100):
+            self.put(self.cache, i)
+        self.assertIsNotNone(self.cache.get("question number 0 about widgets", URL, "fp", threshold=1))
+        self.put(self.cache, 100)
+        self.assertIsNotNone(self.cache.get("question number 0 about widgets", URL, "fp", threshold=1))
+        self.assertIsNone(self.cache.get("question number 1 about widgets", URL, "fp", threshold=1))
+
+    def test_replacing_an_answer_does_not_grow_the_count(self):
+        for _ in range(5):
+            self.put(self.cache, 0)
+        self.assertEqual(self.cache.metrics()["disk_entries"], 1)
+
+    def test_invalidate_updates_the_count(self):
+        for i in range(10):
+            self.put(self.cache, i)
+        self.assertEqual(self.cache.invalidate(URL), 10)
+        self.assertEqual(self.cache.metrics()["disk_entries"], 0)
+
+    def test_recount_sees_answers_stored_by_another_process(self):
+        other = LLMCache(self.path, max_entries=1000)
+        self.addCleanup(other.close)
+        for i in range(150):
+            self.put(other, i)
+        with mock.patch.object(llm_cache, "RECOUNT_EVERY", 1):
+            self.put(self.cache, 1000)
+        self.assertEqual(self.disk_count(), int(100 * llm_cache.EVICT_TO))
+
+
+if __name__ == "__main__":
+    unittest.main()
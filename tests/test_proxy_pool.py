@@ -0,0 +1,110 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from proxy_pool import ProxyPool
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeSession:
+    """requests.Session stand-in answering from a per-proxy script of outcomes"""
+    outcomes = {}
+
+    def __init__(self):
+        self.proxies = {}
+        self.closed = False
+        self.gate = None
+
+    def get(self, url, **kwargs):
+        if self.gate is not None:
+            self.gate.wait(5)
+        outcome = FakeSession.outcomes.get(self.proxies["http"], 200)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+    def close(self):
+        self.closed = True
+
+
+class ProxyPoolTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch("proxy_pool.requests.Session", FakeSession)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FakeSession.outcomes = {}
+        self.pool = ProxyPool(["http://good:1", "http://bad:1"], max_failures=2, eject_seconds=0.2,
+                              probe_url="http://probe")
+
+    def stats(self, proxy):
+        return self.pool._stats[proxy]
+
+    def fail(self, proxy, times):
+        for _ in range(times):
+            self.pool.report_failure(proxy)
+
+    def test_repeated_failures_eject(self):
+        self.fail("http://bad:1", 2)
+        self.assertIsNotNone(self.stats("http://bad:1").ejected_until)
+        self.assertEqual({self.pool.choose() for _ in range(50)}, {"http://good:1"})
+
+    def test_late_success_does_not_readmit(self):
+        self.fail("http://bad:1", 2)
+        # A request that was already in flight when the proxy was ejected
+        self.pool.report_success("http://bad:1", 0.1)
+        self.assertIsNotNone(self.stats("http://bad:1").ejected_until)
+
+    def test_late_failures_do_not_extend_ejection(self):
+        self.fail("http://bad:1", 2)
+        until = self.stats("http://bad:1").ejected_until
+        self.fail("http://bad:1", 2)
+        self.assertEqual(self.stats("http://bad:1").ejected_until, until)
+        self.assertEqual(self.stats("http://bad:1").ejections, 1)
+
+    def test_probe_readmits_after_ejection_period(self):
+        self.fail("http://bad:1", 2)
+        time.sleep(0.25)
+        self.pool.choose()
+        self.assertIsNone(self.stats("http://bad:1").ejected_until)
+
+    def test_failed_probe_doubles_ejection(self):
+        FakeSession.outcomes["http://bad:1"] = requests.ConnectionError("refused")
+        self.fail("http://bad:1", 2)
+        time.sleep(0.25)
+        before = time.monotonic()
+        self.pool.choose()
+        stats = self.stats("http://bad:1")
+        self.assertEqual(stats.ejections, 2)
+        self.assertGreaterEqual(stats.ejected_until - before, 0.35)
+
+    def test_ejection_waits_for_in_flight_request_before_closing_session(self):
+        pool = ProxyPool(["http://bad:1"], max_failures=1, probe_url="http://probe")
+        session = pool.session_for("http://bad:1")
+        session.gate = threading.Event()
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(response=pool.get("http://example.com")))
+        thread.start()
+        time.sleep(0.05)
+        pool.report_failure("http://bad:1")
+        self.assertFalse(session.closed)
+        self.assertIsNot(pool.session_for("http://bad:1"), session)
+        session.gate.set()
+        thread.join(5)
+        self.assertEqual(result["response"][0].status_code, 200)
+        self.assertTrue(session.closed)
+
+    def test_idle_session_closed_on_ejection(self):
+        session = self.pool.session_for("http://bad:1")
+        self.fail("http://bad:1", 2)
+        self.assertTrue(session.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from retrieval import PageIndex, chunk_blocks, page_blocks
+
+SHOP = """
+<html><head><title>Shop</title><script>var x = 1;</script></head><body>
+<h1>Shop</h1>
+<p>Welcome to our store.</p>
+<div class="card"><span class="name">Blue Kettle</span> <span class="price">$24.99</span></div>
+<div class="card"><div class="name">Red Toaster</div><span class="price">$39.00</span></div>
+<h2>Delivery</h2>
+<ul><li>Shipping options<ul><li>Free over $50</li></ul></li></ul>
+</body></html>
+"""
+
+
+class PageBlocksTest(unittest.TestCase):
+    def test_div_and_span_text_is_kept(self):
+        text = " ".join(t for _, t in page_blocks(SHOP))
+        for expected in ["Blue Kettle", "$24.99", "Red Toaster", "$39.00"]:
+            self.assertIn(expected, text)
+
+    def test_outer_list_item_text_is_kept_once(self):
+        texts = [t for _, t in page_blocks(SHOP)]
+        self.assertIn("Shipping options", texts)
+        self.assertEqual(sum(t.count("Free over $50") for t in texts), 1)
+
+    def test_blocks_carry_nearest_heading(self):
+        blocks = dict((t, h) for h, t in page_blocks(SHOP))
+        self.assertEqual(blocks["Blue Kettle $24.99"], "Shop")
+        self.assertEqual(blocks["Free over $50"], "Delivery")
+
+    def test_noise_is_dropped(self):
+        text = " ".join(t for _, t in page_blocks(SHOP))
+        self.assertNotIn("var x", text)
+
+    def test_chunks_rank_prices_for_price_question(self):
+        index = PageIndex("https://shop.example", chunk_blocks(page_blocks(SHOP), chunk_tokens=10), "fp")
+        best = max(index.scores("how much is the red toaster").items(), key=lambda item: item[1])[0]
+        self.assertIn("$39.00", index.chunks[best])
+
+
+if __name__ == "__main__":
+    unittest.main()